@@ -1,11 +1,27 @@
 
 from leaderboard.autoagents.agent_wrapper import AgentWrapper
 
+from rai.envs.sensor_interface import RAISensorInterface
+
 class RAIAgentWrapper(AgentWrapper):
     """
     RAIAgentWrapper derived from the AgentWrapper class, which is
     required for tracking and checking of used sensors
     """
+    def __init__(self, agent, zero_copy_sensors=False):
+        super().__init__(agent)
+        self.zero_copy_sensors = zero_copy_sensors
+
+    def setup_sensors(self, vehicle, debug_mode=False):
+        """
+        Create the sensors with a RAISensorInterface, and with zero_copy_sensors
+        decode their data into its preallocated buffers
+        """
+        self._agent.sensor_interface = RAISensorInterface()
+        super().setup_sensors(vehicle, debug_mode)
+        if self.zero_copy_sensors:
+            for sensor, sensor_spec in zip(self._sensors_list, self._agent.sensors()):
+                self._agent.sensor_interface.listen(sensor, sensor_spec)
     def __call__(self, config):
         """
         Pass the call directly to the agent
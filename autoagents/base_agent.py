@@ -1,6 +1,18 @@
+import time
+
 from leaderboard.autoagents.autonomous_agent import AutonomousAgent
 from srunner.scenariomanager.timer import GameTime
 from rai.core.variations import RAIVariation
+from rai.envs.sensor_interface import RAISensorInterface, detach_input_data
+
+def implements_hook(agent, name):
+    """
+    Whether the class of an agent overrides an optional BaseAgent hook. Agents
+    deriving from AutonomousAgent directly have none
+    """
+    method = getattr(type(agent), name, None)
+    return method is not None and method is not getattr(BaseAgent, name)
+
 
 class BaseAgent(AutonomousAgent):
 
@@ -8,6 +20,44 @@ class BaseAgent(AutonomousAgent):
     RAI Autonomous agent base class. All user agents have to be derived from this class
     """
 
+    def reset(self):
+        """
+        Optional hook: clear the per-run state of the agent, so the same instance
+        (and its loaded models) can be used for the next run with --reuse-agent.
+        Agents that don't override it are created again for every run
+        """
+        pass
+
+    def run_step_batch(self, input_data_batch, timestamps, env_ids):
+        """
+        Optional hook: compute the controls of several environments stepped in
+        lockstep with one forward pass. env_ids identifies the environment of every
+        entry, so the agent can keep a state per environment. Returns one control
+        per entry. Agents that don't override it get one instance per environment
+        """
+        raise NotImplementedError
+
+    def _timed_run_step(self, config, input_data, timestamp):
+        """
+        Call run_step and record its inference latency, without the perturbations and the recording
+        """
+        start_ns = time.perf_counter_ns()
+        control = self.run_step(input_data, timestamp)
+        if config.latency is not None:
+            config.latency.record_ns(time.perf_counter_ns() - start_ns)
+        return control
+
+    def _run_step(self, config, input_data, timestamp):
+        """
+        Get the control of the tick, under the compute budget of config.deadline if any
+        """
+        if config.deadline is not None:
+            # The step may outlive the sensor buffers of the frame
+            if isinstance(self.sensor_interface, RAISensorInterface):
+                input_data = detach_input_data(input_data)
+            return config.deadline.step(self._timed_run_step, config, input_data, timestamp)
+        return self._timed_run_step(config, input_data, timestamp)
+
     def __call__(self, config):
         """
         Execute the agent call, e.g. agent()
@@ -26,7 +76,7 @@ class BaseAgent(AutonomousAgent):
 
             #print('======[Agent] Wallclock_time = {} / Sim_time = {}'.format(wallclock, timestamp))
 
-            control = self.run_step(input_data, timestamp)
+            control = self._run_step(config, input_data, timestamp)
             control.manual_gear_shift = False
 
         else:
@@ -40,9 +90,15 @@ class BaseAgent(AutonomousAgent):
             char_count = config.route_type.count('_')
             rai_case = config.route_type.rsplit('_', char_count-1)[0]
 
+            #Record the clean sensor data, before any perturbation, for offline replay
+            recorder = config.frame_recorder
+            if recorder is not None:
+                recorder.set_global_plan(self._global_plan, self._global_plan_world_coord)
+                recorder.add_frame(GameTime.get_time(), input_data)
+
             #Perturb the sensor data if the rai_case is from D1, D2 or D3
             if rai_case in [RAIVariation.DISTORTION1, RAIVariation.DISTORTION2, RAIVariation.DISTORTION3]:
-                input_data = rai_interface.perturb_data(input_data, sensor_info, config.route_type)
+                input_data = rai_interface.perturb_data(input_data, sensor_info, config.route_type, config.severity)
 
             timestamp = GameTime.get_time()
 
@@ -55,8 +111,10 @@ class BaseAgent(AutonomousAgent):
            
             if rai_interface.no_predictions == 0:
                 rai_interface.start_emission_tracker()
-            control = self.run_step(input_data, timestamp)
+            control = self._run_step(config, input_data, timestamp)
             rai_interface.no_predictions += 1
+            if recorder is not None:
+                recorder.add_control(control)
 
             #Track power usage per second
             if rai_interface.no_predictions >= config.frame_rate: #rai_interface.emission_calc_rate:
@@ -0,0 +1,64 @@
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, wait
+
+import carla
+
+class DeadlineRunner:
+    """
+    Run the agent steps under a per-tick compute budget. Each step runs on a
+    worker thread and the tick waits at most budget_ms for it: when the step
+    misses the deadline the previous control is applied, and the step goes on,
+    its control being applied on the first tick it is ready. New sensor data is
+    only given to the agent once its previous step has finished, as on a real
+    vehicle with a single inference pipeline
+    """
+    def __init__(self, budget_ms):
+        self.budget_ms = budget_ms
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='rai_agent_step')
+        self._pending = None
+        self.last_control = None
+        # ticks, ticks without a new control, and controls applied after their deadline
+        self.ticks = 0
+        self.misses = 0
+        self.late_controls = 0
+
+    def step(self, run_step, *args):
+        """
+        Return the control to apply this tick. Errors of run_step are raised
+        on the tick its result is collected
+        """
+        self.ticks += 1
+        late = self._pending is not None
+        if not late:
+            self._pending = self._executor.submit(run_step, *args)
+
+        try:
+            control = self._pending.result(timeout=self.budget_ms / 1000.0)
+        except TimeoutError:
+            self.misses += 1
+            if self.last_control is None:
+                self.last_control = carla.VehicleControl()
+            return self.last_control
+
+        self._pending = None
+        if late:
+            self.late_controls += 1
+        self.last_control = control
+        return control
+
+    def close(self):
+        """
+        Wait for the step still running and stop the worker thread
+        """
+        if self._pending is not None:
+            wait([self._pending])
+            self._pending = None
+        self._executor.shutdown(wait=True)
+
+    def summary(self):
+        return {
+            'budget_ms': self.budget_ms,
+            'ticks': self.ticks,
+            'misses': self.misses,
+            'late_controls': self.late_controls,
+            'miss_rate': self.misses / self.ticks if self.ticks else 0.0,
+        }
@@ -0,0 +1,123 @@
+import numpy as np
+
+from rai.autoagents.base_agent import implements_hook
+
+class LockstepEnv:
+    """
+    Environment stepped by the LockstepExecutor. An environment gives the
+    (perturbed) sensor data of its current frame, takes the control of the agent
+    and tells when it is done. Simulator stand-ins only have to implement these
+    """
+    done = False
+
+    def observe(self):
+        """
+        Return (input_data, timestamp) of the current frame
+        """
+        raise NotImplementedError
+
+    def apply(self, control):
+        """
+        Apply the control of the current frame and move to the next one
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class ReplayEnv(LockstepEnv):
+    """
+    Recorded run, perturbed with the config of one RAI case. The controls of the
+    agent are stored, as the recording can't react to them
+    """
+    def __init__(self, reader, config, rai_interface):
+        self.reader = reader
+        self.config = config
+        self.rai_interface = rai_interface
+        self.rai_interface.start_run(config, len(reader))
+        self.index = 0
+        self.controls = np.zeros((len(reader), 3))
+
+    @property
+    def done(self):
+        return self.index >= len(self.reader)
+
+    def observe(self):
+        input_data = self.reader.get_frame(self.index, copy=True)
+        input_data = self.rai_interface.perturb_data(input_data, self.config.sensor_to_noise, self.config.route_type,
+                                                     self.config.severity)
+        return input_data, float(self.reader.timestamps[self.index])
+
+    def apply(self, control):
+        self.controls[self.index] = (control.steer, control.throttle, control.brake)
+        self.index += 1
+
+
+class LockstepExecutor:
+    """
+    Advance N environments in sync. At every step the sensor data of the running
+    environments is collated and given to one agent through run_step_batch, so a
+    single forward pass computes the N controls. Agents that don't override
+    BaseAgent.run_step_batch fall back to one agent instance per environment,
+    called one after the other
+    """
+    def __init__(self, agent_factory, envs):
+        self.agent_factory = agent_factory
+        self.envs = list(envs)
+        self.agents = []
+        self.batched = None
+        self.steps = 0
+
+    def _step_batched(self, env_ids, observations):
+        input_data_batch = [input_data for input_data, _ in observations]
+        timestamps = [timestamp for _, timestamp in observations]
+        controls = self.agents[0].run_step_batch(input_data_batch, timestamps, env_ids)
+        if len(controls) != len(env_ids):
+            raise RuntimeError("run_step_batch returned {} controls for {} environments".format(
+                len(controls), len(env_ids)))
+        return controls
+
+    def _step_each(self, env_ids, observations):
+        return [self.agents[env_id].run_step(input_data, timestamp)
+                for env_id, (input_data, timestamp) in zip(env_ids, observations)]
+
+    def step(self):
+        """
+        Advance all the running environments by one frame, returns False once they are all done
+        """
+        env_ids = [env_id for env_id, env in enumerate(self.envs) if not env.done]
+        if not env_ids:
+            return False
+        observations = [self.envs[env_id].observe() for env_id in env_ids]
+
+        if self.batched is None:
+            self.agents = [self.agent_factory()]
+            self.batched = implements_hook(self.agents[0], 'run_step_batch')
+            if not self.batched:
+                # The first agent is kept for the first environment
+                self.agents += [self.agent_factory() for _ in self.envs[1:]]
+
+        if self.batched:
+            controls = self._step_batched(env_ids, observations)
+        else:
+            controls = self._step_each(env_ids, observations)
+
+        for env_id, control in zip(env_ids, controls):
+            self.envs[env_id].apply(control)
+        self.steps += 1
+        return True
+
+    def run(self):
+        """
+        Step the environments until they are all done, then release the agents and environments
+        """
+        try:
+            while self.step():
+                pass
+        finally:
+            for agent in self.agents:
+                agent.destroy()
+            self.agents = []
+            for env in self.envs:
+                env.close()
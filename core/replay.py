@@ -0,0 +1,144 @@
+import importlib
+import os
+import sys
+
+import numpy as np
+
+import carla
+from agents.navigation.local_planner import RoadOption
+
+from rai.core.lockstep import LockstepExecutor, ReplayEnv
+from rai.core.responsibleAI import RAIModels
+from rai.core.variations import RAIVariation
+from rai.scenarioconfigs.route_scenario_configuration import ExtRouteScenarioConfiguration
+from rai.utils.configuration_utility import RAIConfigurationUtility
+from rai.utils.frame_store import SensorFrameReader
+from rai.utils.sensors import organise_sensors
+
+# Cases that only perturb the sensor data, and can therefore be replayed open-loop
+REPLAY_CASES = [RAIVariation.DISTORTION1, RAIVariation.DISTORTION2, RAIVariation.DISTORTION3]
+
+def control_deviation(controls, reference):
+    """
+    Mean normalised deviation between two (steer, throttle, brake) sequences.
+    Steer lives in [-1, 1], throttle and brake in [0, 1], so the result is in [0, 1]
+    """
+    n_frames = min(len(controls), len(reference))
+    if n_frames == 0:
+        return 0.0
+    diff = np.abs(np.asarray(controls[:n_frames]) - np.asarray(reference[:n_frames]))
+    diff[:, 0] /= 2.0
+    return float(np.mean(diff))
+
+
+class OpenLoopReplayer:
+    """
+    Feed a recorded REGULAR run to the agent offline, perturbing the frames with
+    RAIModels.perturb_data, and compare the controls against the clean run
+    """
+    def __init__(self, agent_path, agent_config, recording, robustness_config=None):
+        self.reader = SensorFrameReader(recording)
+        self.robustness_config = robustness_config
+        if self.reader.route_type not in [None, RAIVariation.REGULAR]:
+            print(f"\033[93mWarning: the recording is of a {self.reader.route_type} run, the controls are not clean\033[0m")
+        self.config_utils = RAIConfigurationUtility(robustness_config)
+        self.agent_config = agent_config
+
+        module_name = os.path.basename(agent_path).split('.')[0]
+        sys.path.insert(0, os.path.dirname(agent_path))
+        self.module_agent = importlib.import_module(module_name)
+
+        agent = self._create_agent()
+        self.sensors = agent.sensors()
+        agent.destroy()
+        self.sensor_types = organise_sensors(self.sensors)
+
+    def _create_agent(self):
+        agent_class_name = getattr(self.module_agent, 'get_entry_point')()
+        agent = getattr(self.module_agent, agent_class_name)(self.agent_config)
+
+        # The recorded plan is already downsampled, so set_global_plan() can't be used
+        global_plan = self.reader.global_plan
+        if global_plan is not None:
+            agent._global_plan = [({'lat': lat, 'lon': lon, 'z': z}, RoadOption(option))
+                                  for lat, lon, z, option in global_plan['gps']]
+            agent._global_plan_world_coord = [(carla.Transform(carla.Location(x=x, y=y, z=z),
+                                                               carla.Rotation(pitch=pitch, yaw=yaw, roll=roll)),
+                                               RoadOption(option))
+                                              for x, y, z, pitch, yaw, roll, option in global_plan['world']]
+        return agent
+
+    def collect_configs(self, cases=None):
+        """
+        Expand the replayable RAI cases into one config per perturbed sensor
+        and severity level
+        """
+        configs = []
+        for rai_case in (cases or REPLAY_CASES):
+            config = ExtRouteScenarioConfiguration()
+            config.is_rai = True
+            config.route_type = rai_case
+            configs.extend(self.config_utils.collect_configs(config, self.sensor_types))
+        return configs
+
+    def replay(self, config):
+        """
+        Run the agent over the whole recording for one perturbation config
+        and return the controls it produced
+        """
+        agent = self._create_agent()
+        rai_interface = RAIModels(self.sensors, self.robustness_config)
+        rai_interface.start_run(config, len(self.reader))
+        controls = np.zeros((len(self.reader), 3))
+        try:
+            for index in range(len(self.reader)):
+                input_data = self.reader.get_frame(index, copy=True)
+                input_data = rai_interface.perturb_data(input_data, config.sensor_to_noise, config.route_type,
+                                                        config.severity)
+                control = agent.run_step(input_data, float(self.reader.timestamps[index]))
+                controls[index] = (control.steer, control.throttle, control.brake)
+        finally:
+            agent.destroy()
+        return controls
+
+    def replay_lockstep(self, configs):
+        """
+        Replay all the perturbation configs at once, frame by frame, so agents
+        implementing run_step_batch compute the controls of all the configs
+        with one forward pass. Returns the controls of every config
+        """
+        envs = [ReplayEnv(self.reader, config, RAIModels(self.sensors, self.robustness_config))
+                for config in configs]
+        executor = LockstepExecutor(self._create_agent, envs)
+        executor.run()
+        if not executor.batched:
+            print("\033[93mThe agent doesn't implement run_step_batch(), each case used its own agent\033[0m")
+        return [env.controls for env in envs]
+
+    def run(self, cases=None, lockstep=False):
+        """
+        Replay every perturbation case and return the open-loop robustness proxies,
+        1.0 meaning the controls did not change at all
+        """
+        configs = self.collect_configs(cases)
+        if lockstep:
+            print(f"Replaying {len(configs)} cases in lockstep")
+            all_controls = self.replay_lockstep(configs)
+        else:
+            all_controls = None
+
+        results = []
+        for idx, config in enumerate(configs):
+            if all_controls is not None:
+                controls = all_controls[idx]
+            else:
+                print(f"Replaying: {config.route_type} with sensor ID: {config.variant}")
+                controls = self.replay(config)
+            deviation = control_deviation(controls, self.reader.controls)
+            results.append({'route_type': config.route_type,
+                            'sensor': config.variant,
+                            'severity': config.severity,
+                            'frames': len(controls),
+                            'control_deviation': deviation,
+                            'robustness_proxy': 1.0 - deviation})
+        return results
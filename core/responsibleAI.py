@@ -2,6 +2,7 @@
 from rai.core.variations import RAIVariation
 from rai.utils.sensors import RAISensors
 from rai_metric.emission import Emission
+from rai_metric.noise_timeline import NoiseTimeline, noise_levels
 from rai_metric.robustness import Robustness
 
 
@@ -10,11 +11,16 @@ class RAIModels:
     Class for starting and stopping the emission tracker and perturbing
     sensor data
     """
-    def __init__(self, sensors):
-        self.__robuster = Robustness(sensors)
+    def __init__(self, sensors, robustness_config=None):
+        self.__sensors = sensors
+        self.__robuster = Robustness(sensors, robustness_config)
+        # (parameter, level) -> robuster of a severity sweep level
+        self.__severity_robusters = {}
         self.__emitter = Emission()
         self.no_predictions = 0
         self.emission_calc_rate = 20
+        # Noise of the current D3 run, pre-generated by start_run()
+        self.noise_timeline = None
 
     def start_emission_tracker(self):
         self.__emitter.start_emissions_tracker()
@@ -31,37 +37,70 @@ class RAIModels:
     def reset_emissions(self):
         return self.__emitter.reset_emissions()
 
-    def perturb_data(self, input_data, sensor_info, noise_type):
+    def get_robuster(self, severity=None):
+        """
+        Return the robuster of a severity sweep level, or the default one
+        """
+        if severity is None or severity['default']:
+            return self.__robuster
+        key = (severity['parameter'], str(severity['level']))
+        if key not in self.__severity_robusters:
+            config = self.__robuster.config.at_level(severity['parameter'], severity['level'])
+            self.__severity_robusters[key] = Robustness(self.__sensors, config)
+        return self.__severity_robusters[key]
+
+    def start_run(self, config, n_frames):
+        """
+        Pre-generate the noise of a GNSS, IMU or speedometer distortion run,
+        for the expected number of frames. Returns the timeline, or None for
+        the other cases
+        """
+        self.noise_timeline = None
+        sensor_info = config.sensor_to_noise
+        if not config.route_type.startswith(RAIVariation.DISTORTION3) or not isinstance(sensor_info, dict):
+            return None
+        if sensor_info['type'] not in ('gnss', 'imu', 'speedometer'):
+            return None
+        robust_config = self.get_robuster(config.severity).config
+        self.noise_timeline = NoiseTimeline(sensor_info['type'], noise_levels(robust_config, sensor_info['type']),
+                                            n_frames, robust_config.noise_model, robust_config.noise_seed,
+                                            robust_config.noise_walk_step)
+        return self.noise_timeline
+
+    def perturb_data(self, input_data, sensor_info, noise_type, severity=None):
         """
         Manipulate frames and scenarios and then return the updated data
         """
+        if isinstance(sensor_info, list):
+            # Group of sensors of the same type, perturbed together
+            for sensor in sensor_info:
+                input_data = self.perturb_data(input_data, sensor, noise_type, severity)
+            return input_data
+
+        robuster = self.get_robuster(severity)
         input_to_noise = input_data[sensor_info['id']]
-        if noise_type == RAIVariation.DISTORTION1 + RAISensors.CAMERA:
-            noised_input = self.__robuster.add_salt_and_pepper_noise(input_to_noise, sensor_info)
-            input_data[sensor_info['id']][1][:, :, :3] = noised_input
+        if noise_type in (RAIVariation.DISTORTION1 + RAISensors.CAMERA, RAIVariation.DISTORTION2 + RAISensors.CAMERA):
+            # The camera pipelines of config/robustness.yaml distort the image in place
+            robuster.distort_camera(input_to_noise, noise_type[:-len(RAISensors.CAMERA)])
 
         elif noise_type == RAIVariation.DISTORTION1+ RAISensors.LIDAR:
-            noised_input = self.__robuster.add_salt_and_pepper_noise(input_to_noise, sensor_info)
+            noised_input = robuster.add_salt_and_pepper_noise(input_to_noise, sensor_info)
             input_data[sensor_info['id']] = noised_input
 
-        elif noise_type == RAIVariation.DISTORTION2 + RAISensors.CAMERA:
-            noised_input = self.__robuster.add_occlussion_noise(input_to_noise, sensor_info)
-            input_data[sensor_info['id']][1][:, :, :3] = noised_input
-
         elif noise_type == RAIVariation.DISTORTION2 + RAISensors.LIDAR:
-            noised_input = self.__robuster.add_occlussion_noise(input_to_noise, sensor_info)
+            noised_input = robuster.add_occlussion_noise(input_to_noise, sensor_info)
             input_data[sensor_info['id']] = noised_input
         
         elif noise_type == RAIVariation.DISTORTION3 + RAISensors.GNSS:
-            noised_input = self.__robuster.add_random_noise(input_to_noise, sensor_info)
+            noised_input = robuster.add_random_noise(input_to_noise, sensor_info, self.noise_timeline)
             input_data[sensor_info['id']][1][:] = noised_input
         
         elif noise_type == RAIVariation.DISTORTION3 + RAISensors.IMU:
-            noised_input = self.__robuster.add_random_noise(input_to_noise, sensor_info)   
+            noised_input = robuster.add_random_noise(input_to_noise, sensor_info, self.noise_timeline)   
             input_data[sensor_info['id']][1][:] = noised_input
         
         elif noise_type == RAIVariation.DISTORTION3 + RAISensors.SPEEDOMETER:
-            noised_input = self.__robuster.add_random_noise(input_to_noise, sensor_info)
+            noised_input = robuster.add_random_noise(input_to_noise, sensor_info, self.noise_timeline)
             input_data[sensor_info['id']] = (input_data[sensor_info['id']][0], {'speed':noised_input})
 
         return input_data
\ No newline at end of file
@@ -0,0 +1,145 @@
+import numpy as np
+
+import carla
+
+from leaderboard.envs.sensor_interface import CallBack, SensorInterface
+
+def detach_input_data(input_data):
+    """
+    Copy the arrays of a frame, for consumers that keep them after the next
+    frame has been written into the sensor buffers
+    """
+    return {tag: (frame, np.array(data, copy=True) if isinstance(data, np.ndarray) else data)
+            for tag, (frame, data) in input_data.items()}
+
+
+class RAICallBack(CallBack):
+    """
+    Sensor callback decoding the CARLA measurements straight into the buffers of
+    the RAISensorInterface, instead of allocating new arrays every frame
+    """
+    def __init__(self, tag, sensor_type, sensor, data_provider):
+        # The sensor is already registered, by the leaderboard callback this one replaces
+        self._tag = tag
+        self._data_provider = data_provider
+
+    def _parse_image_cb(self, image, tag):
+        array = np.frombuffer(image.raw_data, dtype=np.dtype("uint8"))
+        self._data_provider.update_sensor_buffer(tag, array.reshape((image.height, image.width, 4)), image.frame)
+
+    def _parse_lidar_cb(self, lidar_data, tag):
+        points = np.frombuffer(lidar_data.raw_data, dtype=np.dtype('f4'))
+        self._data_provider.update_sensor_buffer(tag, points.reshape((int(points.shape[0] / 4), 4)), lidar_data.frame)
+
+    def _parse_radar_cb(self, radar_data, tag):
+        # [depth, azimuth, altitute, velocity]
+        points = np.frombuffer(radar_data.raw_data, dtype=np.dtype('f4'))
+        points = np.flip(points.reshape((int(points.shape[0] / 4), 4)), 1)
+        self._data_provider.update_sensor_buffer(tag, points, radar_data.frame)
+
+    def _parse_gnss_cb(self, gnss_data, tag):
+        buffer = self._data_provider.next_buffer(tag, (3,), np.float64)
+        buffer[0] = gnss_data.latitude
+        buffer[1] = gnss_data.longitude
+        buffer[2] = gnss_data.altitude
+        self._data_provider.update_sensor(tag, buffer, gnss_data.frame)
+
+    def _parse_imu_cb(self, imu_data, tag):
+        buffer = self._data_provider.next_buffer(tag, (7,), np.float64)
+        buffer[0] = imu_data.accelerometer.x
+        buffer[1] = imu_data.accelerometer.y
+        buffer[2] = imu_data.accelerometer.z
+        buffer[3] = imu_data.gyroscope.x
+        buffer[4] = imu_data.gyroscope.y
+        buffer[5] = imu_data.gyroscope.z
+        buffer[6] = imu_data.compass
+        self._data_provider.update_sensor(tag, buffer, imu_data.frame)
+
+
+class RAISensorInterface(SensorInterface):
+    """
+    Sensor interface counting the frames received, dropped (gaps in the frame
+    numbers of a sensor) and late (older than the newest frame of the same step)
+    per sensor. With RAICallBack callbacks, it also owns the arrays given to the
+    agent: every sensor has two preallocated buffers used in turn, so a frame can
+    be read (and perturbed in place) while the next one is written. The arrays of
+    a frame are then only valid until the frame after the next one, consumers
+    keeping them longer have to copy them, e.g. with detach_input_data()
+    """
+    # Pseudo sensors, which don't send data every frame
+    PSEUDO_SENSORS = ('sensor.opendrive_map', 'sensor.speedometer')
+
+    def __init__(self):
+        super().__init__()
+        # Sensors sending data every frame
+        self._frame_tags = set()
+        # tag -> [flat buffer, flat buffer], and the buffer written last
+        self._buffers = {}
+        self._buffer_index = {}
+        # tag -> frame number of the last data received
+        self._last_frames = {}
+        # tag -> {'received', 'dropped', 'late'}
+        self._frame_stats = {}
+
+    def register_sensor(self, tag, sensor_type, sensor):
+        super().register_sensor(tag, sensor_type, sensor)
+        if not sensor_type.startswith(self.PSEUDO_SENSORS):
+            self._frame_tags.add(tag)
+
+    def next_buffer(self, tag, shape, dtype):
+        """
+        Return the buffer to write the next frame of a sensor into, with the shape
+        of that frame. Buffers only grow, e.g. for the varying number of LiDAR points
+        """
+        buffers = self._buffers.get(tag)
+        if buffers is None:
+            buffers = self._buffers[tag] = [None, None]
+        index = self._buffer_index[tag] = 1 - self._buffer_index.get(tag, 1)
+
+        size = int(np.prod(shape))
+        buffer = buffers[index]
+        if buffer is None or buffer.dtype != dtype:
+            buffer = buffers[index] = np.empty(size, dtype=dtype)
+        elif buffer.size < size:
+            buffer = buffers[index] = np.empty(max(size, buffer.size + buffer.size // 2), dtype=dtype)
+        return buffer[:size].reshape(shape)
+
+    def update_sensor_buffer(self, tag, data, timestamp):
+        """
+        Copy the decoded measurement into the next buffer of the sensor
+        """
+        buffer = self.next_buffer(tag, data.shape, data.dtype)
+        np.copyto(buffer, data)
+        self.update_sensor(tag, buffer, timestamp)
+
+    def update_sensor(self, tag, data, timestamp):
+        stats = self._frame_stats.get(tag)
+        if stats is None:
+            stats = self._frame_stats[tag] = {'received': 0, 'dropped': 0, 'late': 0}
+        stats['received'] += 1
+        last_frame = self._last_frames.get(tag)
+        if tag in self._frame_tags and last_frame is not None and timestamp > last_frame + 1:
+            stats['dropped'] += timestamp - last_frame - 1
+        self._last_frames[tag] = timestamp
+        super().update_sensor(tag, data, timestamp)
+
+    def get_data(self):
+        data_dict = super().get_data()
+        frames = [frame for tag, (frame, _) in data_dict.items() if tag in self._frame_tags]
+        if frames:
+            newest_frame = max(frames)
+            for tag, (frame, _) in data_dict.items():
+                if tag in self._frame_tags and frame < newest_frame:
+                    self._frame_stats[tag]['late'] += 1
+        return data_dict
+
+    def frame_stats(self):
+        return {tag: dict(stats) for tag, stats in self._frame_stats.items()}
+
+    def listen(self, sensor, sensor_spec):
+        """
+        Replace the leaderboard callback of a spawned sensor by a RAICallBack
+        """
+        if isinstance(sensor, carla.Sensor):
+            sensor.stop()
+            sensor.listen(RAICallBack(sensor_spec['id'], sensor_spec['type'], sensor, self))
@@ -1,9 +1,8 @@
 import copy
+import os
 import sys
 import traceback
 import warnings
-from tabulate import tabulate
-
 import carla
 
 from leaderboard.autoagents.agent_wrapper import  AgentError
@@ -15,12 +14,21 @@ from leaderboard.envs.sensor_interface import SensorInterface, SensorConfigurati
 from rai.core.responsibleAI import RAIModels
 from rai.core.variations import RAIVariation, RAI_CASES
 from rai.autoagents.agent_wrapper import RAIAgentWrapper
+from rai.autoagents.base_agent import implements_hook
 from rai.scenarios.scenario_manager import RAIScenarioManager
 from rai.scenarios.route_scenario import RAIRouteScenario
+from rai.scenarios.run_monitors import RAIScoreSettledMonitor, StallMonitor
 from rai.utils.configuration_utility import RAIConfigurationUtility
+from rai.utils.coverage import SensorCoverage
+from rai.utils.events import EventBus, ConsoleSink, JsonlSink, MetricsSink
+from rai.utils.frame_store import SensorFrameWriter
+from rai.utils.result_cache import ResultCache, agent_fingerprint, file_fingerprint
 from rai.utils.route_indexer import RAIRouteIndexer
-from rai.utils.utility import shift_environment
-from rai.utils.weathers import Weathers
+from rai.utils.sensors import RAISensors, organise_sensors, sensor_ids
+from rai.utils.shift_plan import shift_environment
+from rai.utils.statistics_table import EARLY_STOP_STATUS
+from rai.utils.weathers import Weathers, WeatherSampler, parse_weather_ranges, weather_to_dict
+from rai_metric.robustness_config import load_robustness_config
 
 class RAILeaderboardEvaluator(LeaderboardEvaluator):
     """
@@ -31,13 +39,49 @@ class RAILeaderboardEvaluator(LeaderboardEvaluator):
         #Create agent object
         self.agent_instance = None
         self.is_rai = args.is_rai
-        self.weathers = Weathers()
-        self.config_utils = RAIConfigurationUtility()
+        # Progress events, for the console and optionally a JSONL file and a metrics endpoint
+        self.events = EventBus([ConsoleSink()])
+        if args.events_jsonl:
+            self.events.add_sink(JsonlSink(args.events_jsonl))
+        if args.metrics_port:
+            self.events.add_sink(MetricsSink(args.metrics_port))
+        sampler = None
+        if args.weather_samples > 0:
+            sampler = WeatherSampler(args.weather_samples, args.weather_seed, parse_weather_ranges(args.weather_range))
+        self.weathers = Weathers(sampler)
+        # Validated once, and shared by the RAI interfaces of all the cases
+        self.robustness_config = load_robustness_config(args.robustness_config or None, args.robustness_override)
+        self.coverage = SensorCoverage(args.coverage, args.coverage_samples, args.coverage_seed)
+        self.config_utils = RAIConfigurationUtility(self.robustness_config, self.weathers, self.events, self.coverage)
         #dictionary to organise sensors
         self.sensor_types = {}
         # Create the ScenarioManager
         self.manager = RAIScenarioManager(args.timeout, args.debug > 1)
-        self.n_weather_conditions = 5
+        self.manager.events = self.events
+        self.manager.zero_copy_sensors = args.zero_copy_sensors
+        if args.noise_timelines:
+            statistics_manager.noise_timeline_dir = args.noise_timelines
+        if args.realtime_budget_ms > 0:
+            self.manager.realtime_budget_ms = args.realtime_budget_ms
+            statistics_manager.realtime_budget_ms = args.realtime_budget_ms
+        if args.early_stop:
+            self.manager.run_monitors.append(RAIScoreSettledMonitor(statistics_manager))
+        if args.stall_time > 0:
+            self.manager.run_monitors.append(StallMonitor(args.stall_time, args.stall_distance,
+                                                          args.stall_sample_period))
+        self.n_weather_conditions = len(self.weathers.get_weathers())
+        self.total_runs = 0
+        # Distribution shift actors of the current run and the actor count before it
+        self._shift_actors = None
+        self._actors_before_run = None
+        # Agent kept alive between runs with --reuse-agent, and whether the world can be reused
+        self._warm_agent = None
+        self._world_is_clean = False
+        # Route records of the runs of earlier evaluations, and the fingerprint parts common to all runs
+        self.result_cache = None
+        if not args.no_cache:
+            self.result_cache = ResultCache(args.result_cache or None, args.cache_max_mb, args.cache_max_entries)
+        self._run_fingerprint = None
 
     def _organise_sensors(self, sensors):
         """
@@ -45,32 +89,7 @@ class RAILeaderboardEvaluator(LeaderboardEvaluator):
         """
         #Ensure that at least one sensor exist
         assert(len(sensors) > 0)
-        for sensor in sensors:
-            if sensor['type'] == 'sensor.camera.rgb':
-                if 'camera' in self.sensor_types:
-                    self.sensor_types['camera'].append({'type': 'camera', 'id': sensor['id']})  
-                else: 
-                    self.sensor_types['camera'] = [{'type': 'camera', 'id': sensor['id']}]
-            elif sensor['type'] ==  'sensor.lidar.ray_cast':
-                if 'lidar' in self.sensor_types:
-                    self.sensor_types['lidar'].append({'type': 'lidar', 'id': sensor['id']})  
-                else: 
-                    self.sensor_types['lidar'] = [{'type': 'lidar', 'id': sensor['id']}]
-            elif sensor['type'] ==  'sensor.other.gnss':
-                if 'gnss' in self.sensor_types:
-                    self.sensor_types['gnss'].append({'type': 'gnss', 'id': sensor['id']})  
-                else: 
-                    self.sensor_types['gnss'] = [{'type': 'gnss', 'id': sensor['id']}]
-            elif sensor['type'] ==  'sensor.other.imu':
-                if 'imu' in self.sensor_types:
-                    self.sensor_types['imu'].append({'type': 'imu', 'id': sensor['id']})  
-                else: 
-                    self.sensor_types['imu'] = [{'type': 'imu', 'id': sensor['id']}]
-            elif sensor['type'] ==  'sensor.speedometer':
-                if 'speedometer' in self.sensor_types:
-                    self.sensor_types['speedometer'].append({'type': 'speedometer', 'id': sensor['id']})  
-                else: 
-                    self.sensor_types['speedometer'] = [{'type': 'speedometer', 'id': sensor['id']}]
+        organise_sensors(sensors, self.sensor_types)
 
     def create_agent_with_sensors(self, args, config):
         """
@@ -87,8 +106,7 @@ class RAILeaderboardEvaluator(LeaderboardEvaluator):
 
         except SensorConfigurationInvalid as e:
             # The sensors are invalid -> set the ejecution to rejected and stop
-            print("\n\033[91mThe sensor's configuration used is invalid:")
-            print("> {}\033[0m\n".format(e))
+            self.events.emit('error', error="The sensor's configuration used is invalid", message=str(e))
             traceback.print_exc()
 
             crash_message = "Agent's sensors were invalid"
@@ -100,8 +118,7 @@ class RAILeaderboardEvaluator(LeaderboardEvaluator):
 
         except Exception as e:
             # The agent setup has failed -> start the next route
-            print("\n\033[91mCould not set up the required agent:")
-            print("> {}\033[0m\n".format(e))
+            self.events.emit('error', error="Could not set up the required agent", message=str(e))
             traceback.print_exc()
 
             crash_message = "Agent couldn't be set up"
@@ -110,6 +127,175 @@ class RAILeaderboardEvaluator(LeaderboardEvaluator):
             self._cleanup()
             return        
 
+    def _cleanup(self):
+        """
+        Remove the distribution shift actors, then all the other simulation and agent elements
+        """
+        if getattr(self, '_shift_actors', None) is not None:
+            try:
+                self._shift_actors.destroy(self.client, self.world)
+            except Exception as e:
+                self.events.emit('error', error="Failed to destroy the distribution shift actors", message=str(e))
+            self._shift_actors = None
+
+        super()._cleanup()
+
+    def _create_agent(self, args):
+        """
+        Create the agent of the run. With --reuse-agent the agent of the previous
+        run is reset instead, so its models are only loaded once
+        """
+        agent_instance, self._warm_agent = self._warm_agent, None
+        if agent_instance is not None:
+            if implements_hook(agent_instance, 'reset'):
+                agent_instance.reset()
+                agent_instance.sensor_interface = SensorInterface()
+                agent_instance.wallclock_t0 = None
+                return agent_instance
+            self.events.emit('warning', message="The agent doesn't implement reset(), it will be created again for every run")
+            args.reuse_agent = False
+            agent_instance.destroy()
+
+        agent_class_name = getattr(self.module_agent, 'get_entry_point')()
+        return getattr(self.module_agent, agent_class_name)(args.agent_config)
+
+    def _load_and_wait_for_world(self, args, town, ego_vehicles=None):
+        """
+        Load the world of the run. With --reuse-world, the current world is kept when
+        the town doesn't change and the previous run left no actors behind
+        """
+        world_is_clean, self._world_is_clean = self._world_is_clean, False
+        if not (args.reuse_world and world_is_clean and getattr(self, 'world', None) is not None
+                and self.world.get_map().name == town):
+            super()._load_and_wait_for_world(args, town, ego_vehicles)
+            return
+
+        self.events.emit('world_reused', town=town)
+        self.world.reset_all_traffic_lights()
+        settings = self.world.get_settings()
+        settings.fixed_delta_seconds = 1.0 / self.frame_rate
+        settings.synchronous_mode = True
+        self.world.apply_settings(settings)
+
+        CarlaDataProvider.set_client(self.client)
+        CarlaDataProvider.set_world(self.world)
+        CarlaDataProvider.set_traffic_manager_port(int(args.trafficManagerPort))
+
+        self.traffic_manager.set_synchronous_mode(True)
+        self.traffic_manager.set_random_device_seed(int(args.trafficManagerSeed))
+
+        # Wait for the world to be ready
+        self.world.tick()
+
+    def _check_actor_leaks(self):
+        """
+        Compare the number of actors in the world before and after the run
+        """
+        if self._actors_before_run is None:
+            return
+        actors = self.world.get_actors()
+        n_leaked = len(actors) - self._actors_before_run
+        self._world_is_clean = n_leaked <= 0
+        if n_leaked > 0:
+            remaining = {}
+            for actor in actors:
+                actor_type = actor.type_id.split('.')[0]
+                if actor_type in ['vehicle', 'walker', 'controller', 'sensor']:
+                    remaining[actor_type] = remaining.get(actor_type, 0) + 1
+            self.events.emit('warning', message="Warning: {} actors were left in the world after the run, remaining: {}".format(
+                n_leaked, remaining), leaked_actors=n_leaked, remaining=remaining)
+        self._actors_before_run = None
+
+    def _register_statistics(self, config, checkpoint, entry_status, crash_message=""):
+        """
+        Compute and save the statistics of the route, and the provisional global record
+        """
+        super()._register_statistics(config, checkpoint, entry_status, crash_message)
+
+        # Only runs that went to the end are reused by later evaluations. Whether a run is
+        # stopped early depends on the other runs of the evaluation, so those are not kept
+        route_record = self.statistics_manager.last_route_record
+        if self.result_cache is not None and config.result_key is not None and entry_status == "Started" \
+                and not crash_message and route_record.status != EARLY_STOP_STATUS:
+            self.result_cache.put(config.result_key, route_record.to_dict())
+
+        self._emit_run_finished(config, checkpoint, entry_status, crash_message)
+
+    def _emit_run_finished(self, config, checkpoint, entry_status, crash_message=""):
+        """
+        Save the provisional global record and report the finished run
+        """
+        progress = None
+        provisional_score = None
+        if self.is_rai:
+            partial_record = self.statistics_manager.save_partial_global_record(self.total_runs, checkpoint)
+            progress = partial_record['meta']['progress']
+            provisional_score = partial_record['rai_scores']['rai_avg_score_composed']
+
+        route_record = self.statistics_manager.last_route_record
+        cached = route_record.meta.get('cached') is not None
+        self.events.emit('run_finished', route=config.name, route_id=route_record.route_id,
+                         route_type=config.route_type, variant=config.variant, severity=config.severity,
+                         status=route_record.status, entry_status=entry_status, crash_message=crash_message,
+                         scores=route_record.scores, rai_scores=route_record.rai_scores,
+                         duration_game=route_record.meta['duration_game'],
+                         duration_system=route_record.meta['duration_system'],
+                         route_length=route_record.meta['route_length'],
+                         early_stop=config.early_stop, ticks=0 if cached else self.manager.ticks,
+                         latency=config.latency.summary() if config.latency is not None else None,
+                         deadline=config.deadline.summary() if config.deadline is not None else None,
+                         progress=progress, provisional_score=provisional_score, cached=cached)
+
+    def _result_fingerprint(self, args, config):
+        """
+        Everything a run depends on: the agent, the route, the RAI case and variant,
+        the weather, the seeds, the robustness config and the leaderboard code
+        """
+        if self._run_fingerprint is None:
+            leaderboard_module = sys.modules[LeaderboardEvaluator.__module__]
+            leaderboard_root = os.path.dirname(os.path.abspath(leaderboard_module.__file__))
+            self._run_fingerprint = {
+                'agent': agent_fingerprint(args.agent, args.agent_config),
+                'cache_salt': args.cache_salt,
+                'rai_code': file_fingerprint(os.path.dirname(os.path.abspath(__file__)), ('.py',)),
+                'leaderboard_code': file_fingerprint(leaderboard_root, ('.py',)),
+                'carla': self.client.get_server_version(),
+                'robustness': self.robustness_config.fingerprint(),
+                'args': {name: str(getattr(args, name)) for name in [
+                    'carlaProviderSeed', 'trafficManagerSeed', 'track', 'customRouteTimeout', 'early_stop',
+                    'stall_time', 'stall_distance', 'stall_sample_period', 'realtime_budget_ms',
+                    'zero_copy_sensors']},
+            }
+        return dict(self._run_fingerprint,
+                    route=[config.name, config.town, [[location.x, location.y, location.z]
+                                                      for location in config.trajectory]],
+                    scenarios=file_fingerprint(config.scenario_file),
+                    route_type=config.route_type,
+                    variant=config.variant,
+                    severity=config.severity,
+                    weather=weather_to_dict(config.weather),
+                    frame_rate=config.frame_rate)
+
+    def _load_cached_run(self, args, config):
+        """
+        Register the cached record of a run of an earlier evaluation, returns
+        False when the run has to be simulated
+        """
+        if self.result_cache is None:
+            return False
+        config.result_key = ResultCache.key(self._result_fingerprint(args, config))
+        record = self.result_cache.get(config.result_key)
+        if record is None:
+            return False
+
+        route_name = config.name +'_'+ config.route_type + '_' + config.run_id
+        self.events.emit('run_cached', route=route_name, key=config.result_key)
+        self.statistics_manager.add_cached_record(record, route_name, int(config.run_id.split('_')[0]),
+                                                  config.result_key, args.checkpoint)
+        self.statistics_manager.save_entry_status("Started", False, args.checkpoint)
+        self._emit_run_finished(config, args.checkpoint, "Started")
+        return True
+
     def _load_and_run_scenario(self, args, config):
         """
         Load and run the scenario given by config.
@@ -119,18 +305,18 @@ class RAILeaderboardEvaluator(LeaderboardEvaluator):
         """
         crash_message = ""
         entry_status = "Started"
-        print("\n\033[1m========= Preparing {} (repetition {}) =========".format(config.name, config.repetition_index))
-        print("> Setting up the agent\033[0m")
+        self.manager.ticks = 0
+        self.events.emit('run_preparing', route=config.name, route_type=config.route_type,
+                         repetition=config.repetition_index, run_id=config.run_id)
 
         # Prepare the statistics of the route
         route_name = config.name +'_'+ config.route_type + '_' + config.run_id
         self.statistics_manager.set_route(route_name, int(config.run_id.split('_')[0]))
-        print("Route setting completed...")
+        self.events.emit('route_set', route=route_name)
         # Set up the user's agent, and the timer to avoid freezing the simulation
         try:
             self._agent_watchdog.start()
-            agent_class_name = getattr(self.module_agent, 'get_entry_point')()
-            self.agent_instance = getattr(self.module_agent, agent_class_name)(args.agent_config)
+            self.agent_instance = self._create_agent(args)
             config.agent = self.agent_instance
 
             # Check and store the sensors
@@ -148,12 +334,11 @@ class RAILeaderboardEvaluator(LeaderboardEvaluator):
                 self.statistics_manager.save_sensors(self.sensor_icons, args.checkpoint)
 
             self._agent_watchdog.stop()
-            print("Sensor data inspected and stored...")
+            self.events.emit('agent_ready', route=route_name)
 
         except SensorConfigurationInvalid as e:
             # The sensors are invalid -> set the ejecution to rejected and stop
-            print("\n\033[91mThe sensor's configuration used is invalid:")
-            print("> {}\033[0m\n".format(e))
+            self.events.emit('error', error="The sensor's configuration used is invalid", message=str(e))
             traceback.print_exc()
 
             crash_message = "Agent's sensors were invalid"
@@ -165,8 +350,7 @@ class RAILeaderboardEvaluator(LeaderboardEvaluator):
 
         except Exception as e:
             # The agent setup has failed -> start the next route
-            print("\n\033[91mCould not set up the required agent:")
-            print("> {}\033[0m\n".format(e))
+            self.events.emit('error', error="Could not set up the required agent", message=str(e))
             traceback.print_exc()
 
             crash_message = "Agent couldn't be set up"
@@ -175,20 +359,23 @@ class RAILeaderboardEvaluator(LeaderboardEvaluator):
             self._cleanup()
             return
 
-        print("\033[1m> Loading the world\033[0m")
+        self.events.emit('world_loading', route=route_name, town=config.town)
 
         # Load the world and the scenario
         try:
             self._load_and_wait_for_world(args, config.town, config.ego_vehicles)
+            self._actors_before_run = len(self.world.get_actors())
             self._prepare_ego_vehicles(config.ego_vehicles, False)
 
             # If RAI_CASE is SHIFT, shift the environment
             if config.route_type == RAIVariation.SHIFT:
-                shift_environment(world = self.world, _map = CarlaDataProvider._map, client = self.client, traffic_manager = self.traffic_manager, args=args)
+                self._shift_actors = shift_environment(world = self.world, _map = CarlaDataProvider._map, client = self.client, traffic_manager = self.traffic_manager, args=args)
 
             scenario = RAIRouteScenario(world=self.world, config=config, debug_mode=args.debug, \
-                                     custom_timeout = args.customRouteTimeout)
-            print("Scenario instance created...")
+                                     custom_timeout = args.customRouteTimeout,
+                                     route_plan_cache=args.route_plan_cache or None,
+                                     use_route_plan_cache=args.use_route_plan_cache)
+            self.events.emit('world_loaded', route=route_name, town=config.town)
             self.statistics_manager.set_scenario(scenario.scenario)
 
             # self.agent_instance._init()
@@ -202,14 +389,15 @@ class RAILeaderboardEvaluator(LeaderboardEvaluator):
             # Load scenario and run it
             if args.record:
                 self.client.start_recorder("{}/{}_rep{}.log".format(args.record, config.name, config.repetition_index))
-            print("Loading scenario...")
+            if args.record_sensors:
+                config.frame_recorder = SensorFrameWriter(os.path.join(args.record_sensors, route_name), config.route_type)
+            self.events.emit('scenario_loading', route=route_name)
             self.manager.load_scenario(scenario, self.agent_instance, config.repetition_index)
-            print("Scenario loading complete...")
+            self.events.emit('scenario_loaded', route=route_name)
 
         except Exception as e:
             # The scenario is wrong -> set the ejecution to crashed and stop
-            print("\n\033[91mThe scenario could not be loaded:")
-            print("> {}\033[0m\n".format(e))
+            self.events.emit('error', error="The scenario could not be loaded", message=str(e))
             traceback.print_exc()
 
             crash_message = "Simulation crashed"
@@ -219,11 +407,12 @@ class RAILeaderboardEvaluator(LeaderboardEvaluator):
 
             if args.record:
                 self.client.stop_recorder()
+            self._close_frame_recorder(config)
 
             self._cleanup()
             sys.exit(-1)
 
-        print("\033[1m> Running the route\033[0m")
+        self.events.emit('run_running', route=route_name)
 
         # Run the scenario
         try:
@@ -231,15 +420,13 @@ class RAILeaderboardEvaluator(LeaderboardEvaluator):
 
         except AgentError as e:
             # The agent has failed -> stop the route
-            print("\n\033[91mStopping the route, the agent has crashed:")
-            print("> {}\033[0m\n".format(e))
+            self.events.emit('error', error="Stopping the route, the agent has crashed", message=str(e))
             traceback.print_exc()
 
             crash_message = "Agent crashed"
 
         except Exception as e:
-            print("\n\033[91mError during the simulation:")
-            print("> {}\033[0m\n".format(e))
+            self.events.emit('error', error="Error during the simulation", message=str(e))
             traceback.print_exc()
 
             crash_message = "Simulation crashed"
@@ -247,61 +434,77 @@ class RAILeaderboardEvaluator(LeaderboardEvaluator):
 
         # Stop the scenario
         try:
-            print("\033[1m> Stopping the route\033[0m")
+            self.events.emit('run_stopping', route=route_name)
             self.manager.stop_scenario()
             self._register_statistics(config, args.checkpoint, entry_status, crash_message)
 
             if args.record:
                 self.client.stop_recorder()
+            self._close_frame_recorder(config)
 
             # Remove all actors
             scenario.remove_all_actors()
 
+            # Keep the agent for the next run, unless something went wrong
+            if args.reuse_agent and not crash_message:
+                self._warm_agent, self.agent_instance = self.agent_instance, None
+
             self._cleanup()
+            self._check_actor_leaks()
 
         except Exception as e:
-            print("\n\033[91mFailed to stop the scenario, the statistics might be empty:")
-            print("> {}\033[0m\n".format(e))
+            self.events.emit('error', error="Failed to stop the scenario, the statistics might be empty", message=str(e))
             traceback.print_exc()
 
             crash_message = "Simulation crashed"
+            self._close_frame_recorder(config)
 
         if crash_message == "Simulation crashed":
             sys.exit(-1)
 
+    def _close_frame_recorder(self, config):
+        """
+        Finish the sensor frames recorded for the run, if any, whether it ended or failed
+        """
+        recorder, config.frame_recorder = config.frame_recorder, None
+        if recorder is None:
+            return
+        try:
+            recorder.close()
+        except Exception as e:
+            self.events.emit('error', error="Failed to write the recorded sensor frames", message=str(e))
+
     def _calculate_total_runs(self):
         """
-        Calculate total runs based on each case in RAI_CASES.
+        Calculate total runs based on each case in RAI_CASES. Perturbed sensors are
+        run once per severity level when their case is swept
         """
+        levels = self.config_utils.n_severity_levels
         total_runs = 0
         if RAIVariation.REGULAR in RAI_CASES:
             total_runs += 1
         if RAIVariation.SHIFT in RAI_CASES:
             total_runs += 1
-        if RAIVariation.DISTORTION1 in RAI_CASES:
-            # If Camera is present, update the total_runs
-            if 'camera' in self.sensor_types:
-                total_runs += len(self.sensor_types['camera'])
-            # If LIDAR is present, update the total_runs
-            if 'lidar' in self.sensor_types:
-                total_runs += len(self.sensor_types['lidar'])
-        if RAIVariation.DISTORTION2 in RAI_CASES:
-            # If Camera is present, update the total_runs
-            if 'camera' in self.sensor_types:
-                total_runs += len(self.sensor_types['camera'])
-            # If LIDAR is present, update the total_runs
-            if 'lidar' in self.sensor_types:
-                total_runs += len(self.sensor_types['lidar'])
+        for rai_case in [RAIVariation.DISTORTION1, RAIVariation.DISTORTION2]:
+            if rai_case in RAI_CASES:
+                # If Camera is present, update the total_runs
+                if 'camera' in self.sensor_types:
+                    total_runs += self.coverage.n_runs(len(self.sensor_types['camera'])) * \
+                        levels(rai_case + RAISensors.CAMERA)
+                # If LIDAR is present, update the total_runs
+                if 'lidar' in self.sensor_types:
+                    total_runs += self.coverage.n_runs(len(self.sensor_types['lidar'])) * \
+                        levels(rai_case + RAISensors.LIDAR)
         if RAIVariation.DISTORTION3 in RAI_CASES:
             # If IMU is present, update the total_runs
             if 'imu' in self.sensor_types:
-                total_runs += 1
+                total_runs += levels(RAIVariation.DISTORTION3 + RAISensors.IMU)
             # If GNSS is present, update the total_runs
             if 'gnss' in self.sensor_types:
-                total_runs += 1
+                total_runs += levels(RAIVariation.DISTORTION3 + RAISensors.GNSS)
             # If Speedometer is present, update the total_runs
             if 'speedometer' in self.sensor_types:
-                total_runs += 1
+                total_runs += levels(RAIVariation.DISTORTION3 + RAISensors.SPEEDOMETER)
         if RAIVariation.WEATHER in RAI_CASES:
                 total_runs += self.n_weather_conditions
         return total_runs
@@ -326,6 +529,7 @@ class RAILeaderboardEvaluator(LeaderboardEvaluator):
             # get total runs from all RAI_CASES
             total_runs = self._calculate_total_runs()
             route_indexer.total = total_runs
+            self.total_runs = total_runs
 
             args.resume = False # TODO: this doesn't seem like a good idea!!
             if args.resume:
@@ -340,7 +544,7 @@ class RAILeaderboardEvaluator(LeaderboardEvaluator):
             run_id = 0
             while trial_idx < len(RAI_CASES):
                 # Get an instance of the RAI class interface
-                self.rai_interface = RAIModels(self.sensors)
+                self.rai_interface = RAIModels(self.sensors, self.robustness_config)
                 new_config = copy.copy(config)
                 new_config.rai_interface = self.rai_interface
                 new_config.route_type = RAI_CASES[trial_idx]
@@ -353,19 +557,24 @@ class RAILeaderboardEvaluator(LeaderboardEvaluator):
                     assert (self.n_weather_conditions == len(configs)), "The number of weather conditions must match"
 
                 for config_i in configs:
-                    print(f"Executing: {config_i.route_type} ")
-                    #print('weather.. ', config_i.weather)
-                    if config_i.sensor_to_noise is not None:
-                        print(f"... with sensor ID: {config_i.sensor_to_noise['id']}")
-
                     config_i.run_id = str(run_id) + '_of_' + str(total_runs)
-                    self._load_and_run_scenario(args, config_i)
+                    sensor_id = ', '.join(sensor_ids(config_i.sensor_to_noise)) or None
+                    self.events.emit('run_started', route=config_i.name, route_type=config_i.route_type,
+                                     sensor_id=sensor_id, variant=config_i.variant, severity=config_i.severity,
+                                     run_id=config_i.run_id, run_index=run_id, total_runs=total_runs)
+
+                    if not self._load_cached_run(args, config_i):
+                        self._load_and_run_scenario(args, config_i)
                     route_indexer.save_state(args.checkpoint)
                     run_id += 1
 
                 trial_idx += 1
 
-            print("\033[1m> Registering the global statistics\033[0m")
+            if self._warm_agent is not None:
+                self._warm_agent.destroy()
+                self._warm_agent = None
+
+            self.events.emit('global_statistics_started')
             global_stats_record = self.statistics_manager.compute_global_statistics(route_indexer.total)
             self.statistics_manager.save_global_record(global_stats_record, self.sensor_types, route_indexer.total,\
                                                          args.checkpoint, args.is_rai)
@@ -380,10 +589,20 @@ class RAILeaderboardEvaluator(LeaderboardEvaluator):
                 else:
                     list_statistics.extend([[rai_case, '{:.6f}'.format(global_stats_record.rai_scores[rai_case])]])
 
+            early_stops = global_stats_record.meta.get('early_stops')
+            if early_stops:
+                list_statistics.extend([['Runs stopped early', str(early_stops['runs'])],
+                                        ['Time saved by early stops', '{:.1f}s simulated, ~{:.1f}s wall-clock'.format(
+                                            early_stops['game_time_saved'], early_stops['system_time_saved'])]])
+
+            for rai_case, case_curves in global_stats_record.meta.get('severity_curves', {}).items():
+                for sensor_id, curve in case_curves.items():
+                    list_statistics.extend([[f"{rai_case} {sensor_id} severity AUC ({curve['parameter']})",
+                                             '{:.6f}'.format(curve['auc'])]])
+
             #RAI result organisation
-            output = ''
-            output += tabulate(list_statistics, tablefmt='fancy_grid')
-            output += "\n"
-            print(output)
+            self.events.emit('global_statistics', table=list_statistics, status=global_stats_record.status,
+                             scores=global_stats_record.scores, rai_scores=global_stats_record.rai_scores)
 
+        self.events.close()
         return
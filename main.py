@@ -7,6 +7,7 @@ from leaderboard.leaderboard_evaluator import LeaderboardEvaluator
 from leaderboard.utils.statistics_manager import StatisticsManager
 
 from rai.leaderboard_evaluator import RAILeaderboardEvaluator
+from rai.utils.coverage import COVERAGE_STRATEGIES
 from rai.utils.statistics_manager import RAIStatisticsManager
 
 def str_to_bool(value):
@@ -35,6 +36,68 @@ def main():
     parser.add_argument('--debug', type=int, help='Run with debug output', default=0)
     parser.add_argument('--record', type=str, default='',
                         help='Use CARLA recording feature to create a recording of the scenario')
+    parser.add_argument('--record-sensors', type=str, default='',
+                        help='Record the raw sensor data of every run to this directory, for debugging and offline replay')
+    parser.add_argument('--shift-cache', type=str, default='',
+                        help='Directory of the cached distribution shift plans (default: $RAI_CACHE_DIR/shift_plans)')
+    parser.add_argument('--route-plan-cache', type=str, default='',
+                        help='Directory of the cached route plans (default: $RAI_CACHE_DIR/route_plans)')
+    parser.add_argument('--use-route-plan-cache', type=str_to_bool, default=True,
+                        help='Keep the route plans on disk between evaluations, they are always shared in memory')
+    parser.add_argument('--robustness-config', type=str, default='',
+                        help='Path to the robustness config (default: $RAI_LEADERBOARD_ROOT/config/robustness.yaml)')
+    parser.add_argument('--robustness-override', type=str, action='append', default=[],
+                        help="Override a robustness config value, e.g. camera.probability=0.2 (can be repeated)")
+    parser.add_argument('--reuse-world', type=str_to_bool, default=False,
+                        help='Keep the loaded world between runs of the same town instead of reloading it')
+    parser.add_argument('--reuse-agent', type=str_to_bool, default=False,
+                        help="Reset and reuse the agent between runs, for agents implementing reset()")
+    parser.add_argument('--early-stop', type=str_to_bool, default=False,
+                        help='Stop the runs whose outcome can no longer change the RAI scores')
+    parser.add_argument('--stall-time', type=float, default=0.0,
+                        help='Fail a run as blocked after these simulated seconds without progress (default: 0, disabled)')
+    parser.add_argument('--stall-distance', type=float, default=1.0,
+                        help='Distance in meters the ego has to move to count as progress (default: 1.0)')
+    parser.add_argument('--stall-sample-period', type=float, default=1.0,
+                        help='Simulated seconds between two samples of the stall detector (default: 1.0)')
+    parser.add_argument('--weather-samples', type=int, default=0,
+                        help='Number of sampled weather conditions (default: 0, use the five presets)')
+    parser.add_argument('--weather-seed', type=int, default=0, help='Seed of the weather sampler (default: 0)')
+    parser.add_argument('--weather-range', type=str, action='append', default=[],
+                        help='Range of a sampled weather parameter, e.g. fog_density=0:50 (can be repeated)')
+    parser.add_argument('--infraction-samples', type=int, default=10,
+                        help='Infraction messages kept per type in each route record, the others are only counted (default: 10)')
+    parser.add_argument('--spill-records', type=str_to_bool, default=False,
+                        help='Only keep the aggregated statistics in memory, the route records being in the checkpoint')
+    parser.add_argument('--coverage', type=str, default='exhaustive', choices=COVERAGE_STRATEGIES,
+                        help='Cameras and LiDARs perturbed per run: each in its own run (exhaustive), all the sensors '
+                             'of a type together (grouped) or a seeded subset (sampled) (default: exhaustive)')
+    parser.add_argument('--coverage-samples', type=int, default=1,
+                        help='Sensors of each type run per case with --coverage=sampled (default: 1)')
+    parser.add_argument('--coverage-seed', type=int, default=0, help='Seed of the sampled coverage (default: 0)')
+    parser.add_argument('--zero-copy-sensors', type=str_to_bool, default=False,
+                        help='Decode the sensor data into preallocated buffers, for agents that do not keep the '
+                             'arrays of past frames')
+    parser.add_argument('--noise-timelines', type=str, default='',
+                        help='Save the noise of the GNSS, IMU and speedometer distortion runs in this directory')
+    parser.add_argument('--realtime-budget-ms', type=float, default=0.0,
+                        help='Compute budget of every agent step in milliseconds, the previous control being applied '
+                             'when it is missed (default: 0, wait for the agent)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Run every case, instead of reusing the results of identical runs of earlier evaluations')
+    parser.add_argument('--result-cache', type=str, default='',
+                        help='Directory of the cached results (default: $RAI_CACHE_DIR/results)')
+    parser.add_argument('--cache-max-mb', type=float, default=512,
+                        help='Size of the result cache, the least recently used results being evicted (default: 512)')
+    parser.add_argument('--cache-max-entries', type=int, default=20000,
+                        help='Number of results kept in the result cache (default: 20000)')
+    parser.add_argument('--cache-salt', type=str, default='',
+                        help='Extra string of the result fingerprints, e.g. the version of agent weights that are '
+                             'not in the agent directory or config')
+    parser.add_argument('--events-jsonl', type=str, default='',
+                        help='Append the progress events of the evaluation to this JSON-lines file')
+    parser.add_argument('--metrics-port', type=int, default=0,
+                        help='Serve the progress metrics on http://127.0.0.1:<port>/metrics (default: 0, disabled)')
     parser.add_argument('--timeout', default='60.0',
                         help='Set the CARLA client timeout value in seconds')
 
@@ -88,7 +151,8 @@ def main():
             del leaderboard_evaluator
     else:
         print("Ruuning RAI Leaderboard!")
-        statistics_manager = RAIStatisticsManager()
+        statistics_manager = RAIStatisticsManager(max_infraction_samples=arguments.infraction_samples,
+                                                  spill_records=arguments.spill_records)
 
         try:
             leaderboard_evaluator = RAILeaderboardEvaluator(arguments, statistics_manager)
@@ -0,0 +1,186 @@
+import cv2
+import numpy as np
+
+# op name -> camera operation class, filled by register_camera_op
+CAMERA_OPS = {}
+
+# Size of the row blocks the pointwise operations are fused over, small enough to stay in the cache
+BLOCK_BYTES = 1 << 18
+
+def register_camera_op(name):
+    """
+    Register a camera operation class under the name used in the camera_pipelines
+    section of config/robustness.yaml
+    """
+    def register(cls):
+        cls.name = name
+        CAMERA_OPS[name] = cls
+        return cls
+    return register
+
+
+class CameraOp:
+    """
+    Operation of a camera pipeline, of one of three kinds:
+        lut       pointwise map of the pixel values, given as a 256 entries table
+        mask      pixels set to a value, the masks being computed per row block
+        spatial   operation needing the neighbouring rows, run on the whole frame
+    params maps the parameters of the operation to their kind in the robustness config.
+    Parameters left out of the pipeline take the values of the config, so severity
+    sweeps of the camera section apply to the pipelines as well
+    """
+    kind = None
+    params = {}
+
+    def lut(self):
+        raise NotImplementedError
+
+    def start_frame(self, height, width):
+        pass
+
+    def masks(self, block, rows):
+        """
+        Yield (mask, value) pairs for a block of the frame covering the given rows
+        """
+        raise NotImplementedError
+
+    def apply(self, image):
+        raise NotImplementedError
+
+
+@register_camera_op('salt_and_pepper')
+class SaltAndPepperOp(CameraOp):
+    kind = 'mask'
+    params = {'probability': 'probability'}
+
+    def __init__(self, config, probability=None):
+        if probability is None:
+            self.pepper_threshold, self.salt_threshold = config.pepper_threshold, config.salt_threshold
+        else:
+            self.pepper_threshold, self.salt_threshold = config.salt_and_pepper_thresholds(probability)
+
+    def masks(self, block, rows):
+        # One draw per pixel, shared by the pepper and salt masks
+        probs = np.random.random(block.shape[:2])
+        yield probs < self.pepper_threshold, 0
+        yield probs > self.salt_threshold, 255
+
+
+@register_camera_op('occlusion')
+class OcclusionOp(CameraOp):
+    kind = 'mask'
+    params = {'num_vertices': 'vertices', 'random_seed': 'int'}
+
+    def __init__(self, config, num_vertices=None, random_seed=None):
+        self.config = config
+        self.num_vertices = num_vertices
+        self.random_seed = random_seed
+        self._frame_mask = None
+
+    def start_frame(self, height, width):
+        # The polygon mask is cached by the config per image size, vertices and seed
+        self._frame_mask = self.config.occlusion_mask(height, width, self.num_vertices, self.random_seed)
+
+    def masks(self, block, rows):
+        yield self._frame_mask[rows], 0
+
+
+@register_camera_op('brightness')
+class BrightnessOp(CameraOp):
+    kind = 'lut'
+    params = {'offset': 'offset'}
+
+    def __init__(self, config, offset=0):
+        self.offset = offset
+
+    def lut(self):
+        return np.clip(np.arange(256) + self.offset, 0, 255).astype(np.uint8)
+
+
+@register_camera_op('contrast')
+class ContrastOp(CameraOp):
+    kind = 'lut'
+    params = {'factor': 'level'}
+
+    def __init__(self, config, factor=1.0):
+        self.factor = factor
+
+    def lut(self):
+        return np.clip(np.round((np.arange(256) - 128) * self.factor + 128), 0, 255).astype(np.uint8)
+
+
+@register_camera_op('blur')
+class BlurOp(CameraOp):
+    kind = 'spatial'
+    params = {'kernel': 'kernel'}
+
+    def __init__(self, config, kernel=3):
+        self.kernel = kernel
+
+    def apply(self, image):
+        image[...] = cv2.blur(np.ascontiguousarray(image), (self.kernel, self.kernel))
+
+
+class CameraPipeline:
+    """
+    Camera distortions composed from a list of operations, run in as few passes
+    over the frame as possible. Consecutive pointwise operations are fused into a
+    stage: their lookup tables are composed into one, and the values of the masks
+    are mapped through the tables of the operations after them, so a stage makes
+    a single pass over the frame, block of rows by block of rows. Only spatial
+    operations start a new pass
+    """
+    def __init__(self, ops):
+        self.ops = ops
+        # [('spatial', op)] or [('pointwise', lut, [(mask op, lut applied after it)])]
+        self.stages = []
+        lut, masks = None, []
+        for op in ops:
+            if op.kind == 'spatial':
+                if lut is not None or masks:
+                    self.stages.append(('pointwise', lut, masks))
+                lut, masks = None, []
+                self.stages.append(('spatial', op))
+            elif op.kind == 'lut':
+                table = op.lut()
+                lut = table if lut is None else table[lut]
+                masks = [(mask_op, table if after is None else table[after]) for mask_op, after in masks]
+            else:
+                masks.append((op, None))
+        if lut is not None or masks:
+            self.stages.append(('pointwise', lut, masks))
+
+    @classmethod
+    def from_spec(cls, config, spec):
+        """
+        Build a pipeline from its validated list of {'op': name, parameter: value} entries
+        """
+        ops = []
+        for entry in spec:
+            params = {key: value for key, value in entry.items() if key != 'op'}
+            ops.append(CAMERA_OPS[entry['op']](config, **params))
+        return cls(ops)
+
+    def apply(self, image):
+        """
+        Distort an image of shape (height, width, channels) in place
+        """
+        height, width = image.shape[:2]
+        block_rows = max(1, BLOCK_BYTES // max(1, image[0].nbytes))
+        for stage in self.stages:
+            if stage[0] == 'spatial':
+                stage[1].apply(image)
+                continue
+
+            _, lut, masks = stage
+            for mask_op, _ in masks:
+                mask_op.start_frame(height, width)
+            for row in range(0, height, block_rows):
+                rows = slice(row, min(row + block_rows, height))
+                block = image[rows]
+                if lut is not None:
+                    block[...] = lut[block]
+                for mask_op, after in masks:
+                    for mask, value in mask_op.masks(block, rows):
+                        block[mask] = value if after is None else after[value]
+        return image
@@ -0,0 +1,110 @@
+import numpy as np
+
+class LatencyHistogram:
+    """
+    Fixed-size histogram of latencies with logarithmic buckets, in the style of
+    HDR histograms. Values are recorded in microseconds: below 2**sub_bucket_bits
+    every value has its own bucket, above each power of two is split in
+    2**(sub_bucket_bits - 1) buckets, so the relative error stays under
+    2**(1 - sub_bucket_bits), i.e. 1.6% for the default 7 bits. Recording a value
+    only increments a counter, the percentiles are computed when reported
+    """
+    def __init__(self, sub_bucket_bits=7, max_latency_s=60.0):
+        self.sub_bucket_bits = sub_bucket_bits
+        self.sub_bucket_count = 1 << sub_bucket_bits
+        self.half_count = self.sub_bucket_count >> 1
+        self.max_value_us = int(max_latency_s * 1e6)
+        self.counts = np.zeros(self._index(self.max_value_us) + 1, dtype=np.int64)
+        self.reset()
+
+    def reset(self):
+        self.counts[:] = 0
+        self.count = 0
+        self.total_us = 0
+        self.max_us = 0
+
+    def _index(self, value_us):
+        if value_us < self.sub_bucket_count:
+            return value_us
+        shift = value_us.bit_length() - self.sub_bucket_bits
+        return self.sub_bucket_count + (shift - 1) * self.half_count + (value_us >> shift) - self.half_count
+
+    def _highest_value(self, index):
+        """
+        Highest value (in microseconds) falling in a bucket
+        """
+        if index < self.sub_bucket_count:
+            return index
+        shift, sub_index = divmod(index - self.sub_bucket_count, self.half_count)
+        shift += 1
+        return ((sub_index + self.half_count + 1) << shift) - 1
+
+    def record_ns(self, latency_ns):
+        """
+        Record a latency measured in nanoseconds, e.g. with time.perf_counter_ns()
+        """
+        value_us = latency_ns // 1000
+        if value_us > self.max_us:
+            self.max_us = value_us
+        self.counts[self._index(min(value_us, self.max_value_us))] += 1
+        self.count += 1
+        self.total_us += value_us
+
+    def merge(self, other):
+        """
+        Add the values of another histogram with the same buckets
+        """
+        self.counts += other.counts
+        self.count += other.count
+        self.total_us += other.total_us
+        self.max_us = max(self.max_us, other.max_us)
+
+    def percentile(self, q):
+        """
+        Latency in milliseconds below which q percent of the values are
+        """
+        if not self.count:
+            return 0.0
+        rank = max(1, int(np.ceil(q / 100.0 * self.count)))
+        index = int(np.searchsorted(np.cumsum(self.counts), rank))
+        return min(self._highest_value(index), self.max_us) / 1000.0
+
+    def fraction_below(self, budget_ms):
+        """
+        Fraction of the values within a budget in milliseconds, up to the bucket precision
+        """
+        if not self.count:
+            return 1.0
+        budget_us = int(budget_ms * 1000)
+        if budget_us >= self.max_us:
+            return 1.0
+        return float(self.counts[:self._index(min(budget_us, self.max_value_us)) + 1].sum()) / self.count
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean_ms': self.total_us / self.count / 1000.0 if self.count else 0.0,
+            'p50_ms': self.percentile(50),
+            'p95_ms': self.percentile(95),
+            'p99_ms': self.percentile(99),
+            'max_ms': self.max_us / 1000.0,
+        }
+
+    def to_dict(self):
+        """
+        Summary of the histogram with its non empty buckets, as [index, count] pairs
+        """
+        latency_dict = self.summary()
+        latency_dict['buckets'] = [[int(index), int(self.counts[index])] for index in np.flatnonzero(self.counts)]
+        latency_dict['sub_bucket_bits'] = self.sub_bucket_bits
+        return latency_dict
+
+    @classmethod
+    def from_dict(cls, latency_dict):
+        histogram = cls(latency_dict.get('sub_bucket_bits', 7))
+        for index, count in latency_dict.get('buckets', []):
+            histogram.counts[index] += count
+        histogram.count = latency_dict['count']
+        histogram.total_us = int(round(latency_dict['mean_ms'] * 1000.0 * latency_dict['count']))
+        histogram.max_us = int(round(latency_dict['max_ms'] * 1000.0))
+        return histogram
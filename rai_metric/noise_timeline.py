@@ -0,0 +1,100 @@
+import os
+import random
+
+import numpy as np
+
+# Noise models of the timelines
+NOISE_MODELS = ['uniform', 'bias', 'random_walk']
+
+def noise_levels(config, sensor_type):
+    """
+    Noise level of every channel of a sensor, in the order they are added by
+    Robustness.noise_gnss, noise_imu and noise_speedometer
+    """
+    if sensor_type == 'gnss':
+        return [config.noise_level] * 3
+    elif sensor_type == 'imu':
+        return [config.acc_noise_lvl, config.compass_noise_lvl, config.gyroscope_noise_lvl]
+    elif sensor_type == 'speedometer':
+        return [config.speed_noise_lvl]
+    raise ValueError(f"No noise timeline for '{sensor_type}' sensors")
+
+
+class NoiseTimeline:
+    """
+    Noise of every frame of a run for the channels of one sensor, generated up
+    front with one vectorized call, so each tick only reads a row. Models:
+        uniform       independent U(-level, level) noise every frame
+        bias          one U(-level, level) offset for the whole run
+        random_walk   drift with U(-walk_step * level, walk_step * level) steps,
+                      reflected at -level and level
+    Frames are counted from the first frame of the run, and the timeline grows
+    if the run is longer than expected
+    """
+    def __init__(self, sensor_type, levels, n_frames, model='uniform', seed=None, walk_step=0.05):
+        if model not in NOISE_MODELS:
+            raise ValueError(f"Unknown noise model '{model}', expected one of {NOISE_MODELS}")
+        self.sensor_type = sensor_type
+        self.levels = np.asarray(levels, dtype=np.float64)
+        self.model = model
+        self.seed = seed if seed is not None else random.randrange(2 ** 31)
+        self.walk_step = walk_step
+        self._rng = np.random.RandomState(self.seed)
+        self._bias = None
+        # Unbounded position of the random walk, folded into the levels by _reflect
+        self._walk = np.zeros(len(self.levels))
+        self.values = np.empty((0, len(self.levels)))
+        self._extend(max(1, n_frames))
+        self.first_frame = None
+        self.n_used = 0
+
+    def _extend(self, n_frames):
+        shape = (n_frames, len(self.levels))
+        if self.model == 'uniform':
+            values = self._rng.uniform(-1.0, 1.0, shape) * self.levels
+        elif self.model == 'bias':
+            if self._bias is None:
+                self._bias = self._rng.uniform(-1.0, 1.0, len(self.levels)) * self.levels
+            values = np.broadcast_to(self._bias, shape).copy()
+        else:
+            steps = self._rng.uniform(-self.walk_step, self.walk_step, shape) * self.levels
+            walk = self._walk + np.cumsum(steps, axis=0)
+            self._walk = walk[-1]
+            values = self._reflect(walk)
+        self.values = np.concatenate([self.values, values]) if len(self.values) else values
+
+    def _reflect(self, walk):
+        """
+        Fold an unbounded walk into [-level, level] with a triangle wave of period
+        4 * level, i.e. the walk bounces off the bounds at every step
+        """
+        period = 4.0 * self.levels
+        safe_period = np.where(period > 0, period, 1.0)
+        folded = self.levels - np.abs(np.mod(walk + self.levels, safe_period) - 2.0 * self.levels)
+        return np.where(period > 0, folded, 0.0)
+
+    def at(self, frame):
+        """
+        Noise of the channels at a frame number
+        """
+        if self.first_frame is None:
+            self.first_frame = frame
+        index = max(0, frame - self.first_frame)
+        if index >= len(self.values):
+            self._extend(max(index + 1 - len(self.values), len(self.values)))
+        self.n_used = max(self.n_used, index + 1)
+        return self.values[index]
+
+    def describe(self):
+        return {'sensor_type': self.sensor_type, 'model': self.model, 'seed': self.seed,
+                'levels': self.levels.tolist(), 'walk_step': self.walk_step, 'frames': self.n_used}
+
+    def save(self, path):
+        """
+        Save the noise of the frames used by the run, with its parameters
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        np.savez_compressed(path, values=self.values[:self.n_used], levels=self.levels,
+                            first_frame=-1 if self.first_frame is None else self.first_frame,
+                            model=self.model, seed=self.seed, walk_step=self.walk_step)
+        return path
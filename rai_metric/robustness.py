@@ -1,59 +1,19 @@
-import os
 import random
 import cv2
-import yaml
 import numpy as np
 from scipy.spatial import Delaunay
 
-def check_default_values(config, **kwargs):
-    """
-    If any values are None, update them with values from the yaml config. If not None,
-    keep the current value. The keys in kwargs should match keys in the config.
-    """
-    updated_values = {}
-    for key, value in kwargs.items():
-        if value is None:
-            config_value = get_config_value(config, key)
-            updated_values[key] = config_value
-        else:
-            updated_values[key] = value
-    return updated_values.values()
-
-def get_config_value(config, key):
-    """
-    Navigate the config dict and return the value for the key
-    """
-    for k, v in config.items():
-        # For nested dict
-        if isinstance(v, dict):
-            if key in v:
-                return v[key]
-        # If the value is not dict
-        else:
-            if key in config:
-                return config[key]
-    raise KeyError(f"Key '{key}' not found in the config.")
-
-def sort_vertices(vertices):
-    """
-    Sort vertices in clockwise order
-    """
-    centre_x = sum([v[0] for v in vertices]) / len(vertices)
-    centre_y = sum([v[1] for v in vertices]) / len(vertices)
-    return sorted(vertices, key=lambda v: np.arctan2(v[1] - centre_y, v[0] - centre_x))
-
+from rai_metric.robustness_config import load_robustness_config
 
 class Robustness:
     """
     Class for noising sensors for robustness test
     """
-    def __init__(self, sensors):
+    def __init__(self, sensors, config=None):
         self.sensors = sensors
 
-        # load parameters from the config file
-        rai_path = os.environ.get('RAI_LEADERBOARD_ROOT')
-        with open(f'{rai_path}/config/robustness.yaml','r') as f:
-            self.config = yaml.safe_load(f)
+        # compiled parameters, loaded once from config/robustness.yaml by default
+        self.config = config if config is not None else load_robustness_config()
 
         # default parameters for lidar from agent_wrapper.py.
         # TODO: These parameters are not directly accessible in sensors
@@ -66,8 +26,8 @@ class Robustness:
 
         # 5 points, including the origin, defines the occlusion shape.
         # spherical (r, theta, phi)
-        theta_0, theta_1 = self.config['lidar']['theta']
-        phi_0, phi_1 = self.config['lidar']['phi']
+        theta_0, theta_1 = self.config.lidar_theta
+        phi_0, phi_1 = self.config.lidar_phi
         self.points_in_spherical = np.array([[self._LIDAR_RANGE,theta_0,phi_0],
                                             [self._LIDAR_RANGE,theta_0,phi_1],
                                             [self._LIDAR_RANGE,theta_1,phi_0],
@@ -76,8 +36,7 @@ class Robustness:
         self.occlusion_hull = None
         self.lidar_occlusion_init = False
         # channel range to remove for internal noise
-        channel_range_to_remove = np.array(self.config['lidar']['channel_range_to_remove'])
-        self.angle_range_to_remove = self.channels_to_angle(channel_range_to_remove)
+        self.angle_range_to_remove = self.channels_to_angle(self.config.channel_range_to_remove)
 
     def channels_to_angle(self, channel_range_to_remove, in_radians=True):
         """
@@ -99,17 +58,18 @@ class Robustness:
         """
         if  sensor_info:
             if sensor_info['type'] == 'camera':
-                probability, = check_default_values(self.config, probability=probability)
+                if probability is None:
+                    pepper_threshold, salt_threshold = self.config.pepper_threshold, self.config.salt_threshold
+                else:
+                    pepper_threshold, salt_threshold = self.config.salt_and_pepper_thresholds(probability)
 
                 # Generate random noise with the same shape as the input image
                 sensor_data = sensor_data[1][:, :, :3]
 
                 # Generate random noise mask
-                black = np.array([0, 0, 0], dtype='uint8')
-                white = np.array([255, 255, 255], dtype='uint8')
                 probs = np.random.random(sensor_data.shape[:2])
-                sensor_data[probs < (probability / 2)] = black
-                sensor_data[probs > 1 - (probability / 2)] = white
+                sensor_data[probs < pepper_threshold] = 0
+                sensor_data[probs > salt_threshold] = 255
 
             elif sensor_info['type'] == 'lidar':
                 # Remove selected lidar channels
@@ -117,6 +77,13 @@ class Robustness:
 
         return sensor_data
 
+    def distort_camera(self, sensor_data, case):
+        """
+        Run the camera pipeline of a RAI case, e.g. REGULAR_D1, over the RGB
+        channels of the image in place
+        """
+        return self.config.camera_pipeline(case).apply(sensor_data[1][:, :, :3])
+
     def lidar_channel_removal(self, sensor_data):
         """
         Compute angles between the origin->sensor_data points and 
@@ -158,34 +125,13 @@ class Robustness:
         # Create an empty mask array
         if  sensor_info:
             if sensor_info['type'] == 'camera':
-                # Get default values from yaml if params are None
-                num_vertices, random_seed = check_default_values(self.config, num_vertices=num_vertices,
-                                                                 random_seed=random_seed)
                 # Generate random noise with the same shape as the input image
                 sensor_data = sensor_data[1][:, :, :3]
                 height, width, _ = sensor_data.shape
-                mask = np.zeros(sensor_data.shape[:2], dtype=np.uint8)
 
-                # Generate random polygon vertices
-                random.seed(random_seed)
-
-                # Generate unique vertices
-                vertices = set()
-                while len(vertices) < num_vertices:
-                    x = random.randint(0, width - 1)
-                    y = random.randint(0, height - 1)
-                    vertices.add((x, y))
-
-                # Sort vertices in clockwise order
-                vertices_sorted = sort_vertices(list(vertices))
-
-                # Create a polygon mask using fillPoly
-                cv2.fillPoly(mask, [np.array(vertices_sorted)], 255)
-                # self.display_image(mask)
-                # Invert the mask
-                inverted_mask = cv2.bitwise_not(mask)
-                # Apply the mask to the image
-                sensor_data = cv2.bitwise_and(sensor_data, sensor_data, mask=inverted_mask)
+                # The polygon mask is cached per image size, vertices and seed
+                mask = self.config.occlusion_mask(height, width, num_vertices, random_seed)
+                sensor_data[mask] = 0
 
             elif sensor_info['type'] == 'lidar':
                 if not self.lidar_occlusion_init:
@@ -262,24 +208,30 @@ class Robustness:
         cropped_data = sensor_data[points_removal,:]
         return cropped_data
     
-    def add_random_noise(self, sensor_data, sensor_info):
+    def add_random_noise(self, sensor_data, sensor_info, timeline=None):
         """
         Add random noise to GPS readings or IMU readings depending
-        on the type of sensor parameter passed in
+        on the type of sensor parameter passed in. With a NoiseTimeline,
+        the noise of the frame is read from it instead of being drawn
         """
+        noise = timeline.at(sensor_data[0]) if timeline is not None else None
         # Generate random noise values within the specified noise_level
         if sensor_info['type'] == 'gnss':
-            return self.noise_gnss(sensor_data[1])
+            return self.noise_gnss(sensor_data[1], noise=noise)
         elif sensor_info['type'] == 'imu':
-            return self.noise_imu(sensor_data[1])
+            return self.noise_imu(sensor_data[1], noise=noise)
         elif sensor_info['type'] == 'speedometer':
-            return self.noise_speedometer(sensor_data[1])
+            return self.noise_speedometer(sensor_data[1], noise=noise)
     
-    def noise_gnss(self, sensor_data, noise_level=None):
+    def noise_gnss(self, sensor_data, noise_level=None, noise=None):
         """
         Use the same level of random noise for latitude, longitude, and altitude
         """
-        noise_level, = check_default_values(self.config, noise_level=noise_level)
+        if noise is not None:
+            sensor_data += noise
+            return sensor_data
+        if noise_level is None:
+            noise_level = self.config.noise_level
         lat_noise = random.uniform(-noise_level, noise_level)
         lon_noise = random.uniform(-noise_level, noise_level)
         alt_noise = random.uniform(-noise_level, noise_level)
@@ -288,14 +240,22 @@ class Robustness:
         sensor_data +=  np.array([lat_noise, lon_noise, alt_noise])
         return sensor_data
     
-    def noise_imu(self, sensor_data, acc_noise_lvl=None, compass_noise_lvl=None, gyroscope_noise_lvl=None):
+    def noise_imu(self, sensor_data, acc_noise_lvl=None, compass_noise_lvl=None, gyroscope_noise_lvl=None,
+                  noise=None):
         """
         Set levels for random noise for acceleration, compass, and gyroscope
         """
-        noise_levels = check_default_values(self.config, acc_noise_lvl=acc_noise_lvl,
-                                                 compass_noise_lvl=compass_noise_lvl,
-                                                 gyroscope_noise_lvl=gyroscope_noise_lvl)
-        acc_noise_lvl, compass_noise_lvl, gyroscope_noise_lvl = noise_levels
+        if noise is not None:
+            sensor_data[0:3] += noise[0]
+            sensor_data[3] += noise[1]
+            sensor_data[4:] += noise[2]
+            return sensor_data
+        if acc_noise_lvl is None:
+            acc_noise_lvl = self.config.acc_noise_lvl
+        if compass_noise_lvl is None:
+            compass_noise_lvl = self.config.compass_noise_lvl
+        if gyroscope_noise_lvl is None:
+            gyroscope_noise_lvl = self.config.gyroscope_noise_lvl
         acc_noise = random.uniform(-acc_noise_lvl, acc_noise_lvl)
         compass_noise = random.uniform(-compass_noise_lvl, compass_noise_lvl)
         gyroscope_noise = random.uniform(-gyroscope_noise_lvl, gyroscope_noise_lvl)
@@ -306,12 +266,16 @@ class Robustness:
         sensor_data[4:] += gyroscope_noise
         return sensor_data
 
-    def noise_speedometer(self, sensor_data, speed_noise_lvl=None):
+    def noise_speedometer(self, sensor_data, speed_noise_lvl=None, noise=None):
         """
         Set level for random noise for speedometer
         """
-        speed_noise_lvl, = check_default_values(self.config, speed_noise_lvl=speed_noise_lvl)
-        speed_noise = random.uniform(-speed_noise_lvl, speed_noise_lvl)
+        if noise is not None:
+            speed_noise = float(noise[0])
+        else:
+            if speed_noise_lvl is None:
+                speed_noise_lvl = self.config.speed_noise_lvl
+            speed_noise = random.uniform(-speed_noise_lvl, speed_noise_lvl)
 
         # Add noise to speedometer reading
         sensor_data['speed'] += speed_noise
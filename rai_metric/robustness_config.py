@@ -0,0 +1,310 @@
+import copy
+import hashlib
+import json
+import os
+import random
+
+import cv2
+import numpy as np
+import yaml
+
+from rai_metric.camera_pipeline import CAMERA_OPS, CameraPipeline
+from rai_metric.noise_timeline import NOISE_MODELS
+
+# section -> key -> kind of value expected in config/robustness.yaml
+ROBUSTNESS_SCHEMA = {
+    'lidar': {'theta': 'range', 'phi': 'range', 'channel_range_to_remove': 'ranges'},
+    'camera': {'probability': 'probability', 'num_vertices': 'vertices', 'random_seed': 'int'},
+    'gnss': {'noise_level': 'level'},
+    'imu': {'acc_noise_lvl': 'level', 'compass_noise_lvl': 'level', 'gyroscope_noise_lvl': 'level'},
+    'speedometer': {'speed_noise_lvl': 'level'},
+}
+
+# Optional sections, with the default of every key
+OPTIONAL_SCHEMA = {
+    'noise_timeline': {'model': 'noise_model', 'seed': 'optional_int', 'walk_step': 'probability'},
+}
+OPTIONAL_DEFAULTS = {
+    'noise_timeline': {'model': 'uniform', 'seed': None, 'walk_step': 0.05},
+}
+
+# Optional section of severity sweeps, 'section.key' -> list of levels of that parameter
+SEVERITY_SECTION = 'severity'
+
+# Optional section of camera pipelines, camera RAI case -> list of operations
+PIPELINE_SECTION = 'camera_pipelines'
+DEFAULT_CAMERA_PIPELINES = {
+    'REGULAR_D1': [{'op': 'salt_and_pepper'}],
+    'REGULAR_D2': [{'op': 'occlusion'}],
+}
+
+# Loaded configs, keyed by (path, mtime, overrides)
+_robustness_configs = {}
+
+def sort_vertices(vertices):
+    """
+    Sort vertices in clockwise order
+    """
+    centre_x = sum([v[0] for v in vertices]) / len(vertices)
+    centre_y = sum([v[1] for v in vertices]) / len(vertices)
+    return sorted(vertices, key=lambda v: np.arctan2(v[1] - centre_y, v[0] - centre_x))
+
+def default_robustness_config_path():
+    rai_path = os.environ.get('RAI_LEADERBOARD_ROOT')
+    return f'{rai_path}/config/robustness.yaml'
+
+def apply_overrides(values, overrides):
+    """
+    Apply 'section.key=value' overrides, the value being parsed as yaml
+    """
+    for override in overrides:
+        name, equal, value = override.partition('=')
+        section, dot, key = name.strip().partition('.')
+        if not equal or not dot:
+            raise ValueError(f"Malformed robustness override '{override}', expected 'section.key=value'")
+        if not isinstance(values.get(section), dict):
+            values[section] = {}
+        values[section][key] = yaml.safe_load(value)
+    return values
+
+def validate_value(name, kind, value):
+    """
+    Check a single config value against its kind and return it with the right type
+    """
+    def is_number(x):
+        return isinstance(x, (int, float)) and not isinstance(x, bool)
+
+    if kind == 'range':
+        if not (isinstance(value, list) and len(value) == 2 and all(is_number(x) for x in value)):
+            raise ValueError(f"Robustness config '{name}' must be a pair of numbers, got {value!r}")
+        return [float(x) for x in value]
+    elif kind == 'ranges':
+        if not (isinstance(value, list) and value and all(isinstance(x, list) for x in value)):
+            raise ValueError(f"Robustness config '{name}' must be a list of [start, end] pairs, got {value!r}")
+        return [validate_value(name, 'range', x) for x in value]
+    elif kind == 'probability':
+        if not (is_number(value) and 0 <= value <= 1):
+            raise ValueError(f"Robustness config '{name}' must be a probability in [0, 1], got {value!r}")
+    elif kind == 'vertices':
+        if not (isinstance(value, int) and not isinstance(value, bool) and value >= 3):
+            raise ValueError(f"Robustness config '{name}' must be an integer >= 3, got {value!r}")
+    elif kind == 'int':
+        if not (isinstance(value, int) and not isinstance(value, bool)):
+            raise ValueError(f"Robustness config '{name}' must be an integer, got {value!r}")
+    elif kind == 'noise_model':
+        if value not in NOISE_MODELS:
+            raise ValueError(f"Robustness config '{name}' must be one of {NOISE_MODELS}, got {value!r}")
+    elif kind == 'optional_int':
+        if not (value is None or (isinstance(value, int) and not isinstance(value, bool))):
+            raise ValueError(f"Robustness config '{name}' must be an integer or null, got {value!r}")
+    elif kind == 'offset':
+        if not (isinstance(value, int) and not isinstance(value, bool) and -255 <= value <= 255):
+            raise ValueError(f"Robustness config '{name}' must be an integer in [-255, 255], got {value!r}")
+    elif kind == 'kernel':
+        if not (isinstance(value, int) and not isinstance(value, bool) and value >= 1):
+            raise ValueError(f"Robustness config '{name}' must be an integer >= 1, got {value!r}")
+    elif kind == 'level':
+        if not (is_number(value) and value >= 0):
+            raise ValueError(f"Robustness config '{name}' must be a non negative number, got {value!r}")
+        return float(value)
+    return value
+
+
+def validate_pipelines(pipelines):
+    """
+    Check the camera pipelines, each being a list of {'op': name, parameter: value} entries
+    """
+    if not isinstance(pipelines, dict):
+        raise ValueError(f"Robustness config section '{PIPELINE_SECTION}' must be a mapping")
+    validated = copy.deepcopy(DEFAULT_CAMERA_PIPELINES)
+    for case, spec in pipelines.items():
+        if case not in DEFAULT_CAMERA_PIPELINES:
+            raise ValueError(f"Unknown camera case '{case}' in the camera pipelines, "
+                             f"expected one of {list(DEFAULT_CAMERA_PIPELINES)}")
+        if not isinstance(spec, list) or not spec:
+            raise ValueError(f"Camera pipeline of '{case}' must be a non empty list of operations")
+        entries = []
+        for entry in spec:
+            if isinstance(entry, str):
+                entry = {'op': entry}
+            if not isinstance(entry, dict) or entry.get('op') not in CAMERA_OPS:
+                raise ValueError(f"Camera pipeline of '{case}' has an unknown operation {entry!r}, "
+                                 f"expected one of {sorted(CAMERA_OPS)}")
+            op_params = CAMERA_OPS[entry['op']].params
+            validated_entry = {'op': entry['op']}
+            for key, value in entry.items():
+                if key == 'op':
+                    continue
+                if key not in op_params:
+                    raise ValueError(f"Unknown parameter '{key}' of the camera operation '{entry['op']}'")
+                validated_entry[key] = validate_value(f"{PIPELINE_SECTION}.{case}.{entry['op']}.{key}",
+                                                      op_params[key], value)
+            entries.append(validated_entry)
+        validated[case] = entries
+    return validated
+
+
+class RobustnessConfig:
+    """
+    Validated robustness parameters, compiled into the values used by the noise
+    kernels. Instances are read only, so one config can be shared by all the RAI cases
+    """
+    def __init__(self, values):
+        if not isinstance(values, dict):
+            raise ValueError("The robustness config must be a mapping of sections")
+        for section in values:
+            if section not in ROBUSTNESS_SCHEMA and section not in OPTIONAL_SCHEMA and \
+                    section not in (SEVERITY_SECTION, PIPELINE_SECTION):
+                raise ValueError(f"Unknown robustness config section '{section}'")
+
+        params = {}
+        for section, keys in ROBUSTNESS_SCHEMA.items():
+            section_values = values.get(section)
+            if not isinstance(section_values, dict):
+                raise ValueError(f"Missing robustness config section '{section}'")
+            for key in section_values:
+                if key not in keys:
+                    raise ValueError(f"Unknown robustness config key '{section}.{key}'")
+            for key, kind in keys.items():
+                if key not in section_values:
+                    raise ValueError(f"Missing robustness config key '{section}.{key}'")
+                params[(section, key)] = validate_value(f'{section}.{key}', kind, section_values[key])
+        for section, keys in OPTIONAL_SCHEMA.items():
+            section_values = values.get(section) or {}
+            if not isinstance(section_values, dict):
+                raise ValueError(f"Robustness config section '{section}' must be a mapping")
+            for key in section_values:
+                if key not in keys:
+                    raise ValueError(f"Unknown robustness config key '{section}.{key}'")
+            for key, kind in keys.items():
+                value = section_values.get(key, OPTIONAL_DEFAULTS[section][key])
+                params[(section, key)] = validate_value(f'{section}.{key}', kind, value)
+        self.params = params
+
+        # 'section.key' -> validated levels of the severity sweeps
+        self.severity = {}
+        for parameter, levels in (values.get(SEVERITY_SECTION) or {}).items():
+            section, _, key = parameter.partition('.')
+            if key not in ROBUSTNESS_SCHEMA.get(section, {}):
+                raise ValueError(f"Unknown robustness config key '{parameter}' in the severity sweeps")
+            if not isinstance(levels, list) or not levels:
+                raise ValueError(f"Severity sweep of '{parameter}' must be a non empty list of levels")
+            kind = ROBUSTNESS_SCHEMA[section][key]
+            self.severity[parameter] = [validate_value(parameter, kind, level) for level in levels]
+
+        # camera case -> operations of its pipeline
+        self.camera_pipelines = validate_pipelines(values.get(PIPELINE_SECTION) or {})
+
+        # lidar
+        self.lidar_theta = params[('lidar', 'theta')]
+        self.lidar_phi = params[('lidar', 'phi')]
+        self.channel_range_to_remove = np.array(params[('lidar', 'channel_range_to_remove')])
+        # camera
+        self.probability = params[('camera', 'probability')]
+        self.num_vertices = params[('camera', 'num_vertices')]
+        self.random_seed = params[('camera', 'random_seed')]
+        # gnss, imu and speedometer
+        self.noise_level = params[('gnss', 'noise_level')]
+        self.acc_noise_lvl = params[('imu', 'acc_noise_lvl')]
+        self.compass_noise_lvl = params[('imu', 'compass_noise_lvl')]
+        self.gyroscope_noise_lvl = params[('imu', 'gyroscope_noise_lvl')]
+        self.speed_noise_lvl = params[('speedometer', 'speed_noise_lvl')]
+        # noise timelines of gnss, imu and speedometer
+        self.noise_model = params[('noise_timeline', 'model')]
+        self.noise_seed = params[('noise_timeline', 'seed')]
+        self.noise_walk_step = params[('noise_timeline', 'walk_step')]
+
+        # salt and pepper thresholds of the default probability
+        self.pepper_threshold, self.salt_threshold = self.salt_and_pepper_thresholds(self.probability)
+        # (height, width, num_vertices, random_seed) -> occlusion mask
+        self._occlusion_masks = {}
+        # (parameter, level) -> config compiled at that severity level
+        self._levels = {}
+        # camera case -> compiled camera pipeline
+        self._pipelines = {}
+
+    def fingerprint(self):
+        """
+        Hash of the validated parameters and camera pipelines
+        """
+        description = json.dumps([[f'{section}.{key}', value] for (section, key), value in sorted(self.params.items())] +
+                                 [self.camera_pipelines], sort_keys=True)
+        return hashlib.sha1(description.encode('utf-8')).hexdigest()
+
+    def default_level(self, parameter):
+        """
+        Configured value of a 'section.key' parameter
+        """
+        section, _, key = parameter.partition('.')
+        return self.params[(section, key)]
+
+    def at_level(self, parameter, level):
+        """
+        Return this config with one parameter set to a severity level. Configs of
+        each level are compiled once and cached
+        """
+        level_key = (parameter, json.dumps(level))
+        if level_key not in self._levels:
+            values = {section: {} for section in list(ROBUSTNESS_SCHEMA) + list(OPTIONAL_SCHEMA)}
+            for (section, key), value in self.params.items():
+                values[section][key] = copy.deepcopy(value)
+            values[PIPELINE_SECTION] = copy.deepcopy(self.camera_pipelines)
+            section, _, key = parameter.partition('.')
+            values[section][key] = level
+            self._levels[level_key] = RobustnessConfig(values)
+        return self._levels[level_key]
+
+    def camera_pipeline(self, case):
+        """
+        Compiled camera pipeline of a camera RAI case, e.g. REGULAR_D1
+        """
+        if case not in self._pipelines:
+            self._pipelines[case] = CameraPipeline.from_spec(self, self.camera_pipelines[case])
+        return self._pipelines[case]
+
+    @staticmethod
+    def salt_and_pepper_thresholds(probability):
+        return probability / 2, 1 - (probability / 2)
+
+    def occlusion_mask(self, height, width, num_vertices=None, random_seed=None):
+        """
+        Boolean mask of the polygon occlusion over an image, True on occluded pixels.
+        The polygon only depends on the image size, the number of vertices and the
+        seed, so masks are computed once and cached
+        """
+        num_vertices = self.num_vertices if num_vertices is None else num_vertices
+        random_seed = self.random_seed if random_seed is None else random_seed
+        key = (height, width, num_vertices, random_seed)
+        if key not in self._occlusion_masks:
+            # Generate unique random polygon vertices, with a generator of its own
+            rng = random.Random(random_seed)
+            vertices = set()
+            while len(vertices) < num_vertices:
+                x = rng.randint(0, width - 1)
+                y = rng.randint(0, height - 1)
+                vertices.add((x, y))
+
+            # Sort vertices in clockwise order
+            vertices_sorted = sort_vertices(list(vertices))
+
+            # Create a polygon mask using fillPoly
+            mask = np.zeros((height, width), dtype=np.uint8)
+            cv2.fillPoly(mask, [np.array(vertices_sorted)], 255)
+            self._occlusion_masks[key] = mask.astype(bool)
+        return self._occlusion_masks[key]
+
+
+def load_robustness_config(path=None, overrides=None):
+    """
+    Load, validate and compile a robustness config. Configs are only read once
+    per (path, mtime, overrides), and errors are raised here instead of at the
+    first perturbed frame
+    """
+    path = path or default_robustness_config_path()
+    overrides = tuple(overrides or ())
+    key = (os.path.abspath(path), os.path.getmtime(path), overrides)
+    if key not in _robustness_configs:
+        with open(path, 'r') as f:
+            values = yaml.safe_load(f) or {}
+        _robustness_configs[key] = RobustnessConfig(apply_overrides(values, overrides))
+    return _robustness_configs[key]
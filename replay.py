@@ -0,0 +1,51 @@
+import argparse
+from argparse import RawTextHelpFormatter
+import json
+
+from tabulate import tabulate
+
+from rai.core.replay import OpenLoopReplayer
+from rai_metric.robustness_config import load_robustness_config
+
+def main():
+    description = "RAI Leaderboard open-loop replay: screen an Agent's robustness on a recorded run, without CARLA\n"
+
+    parser = argparse.ArgumentParser(description=description, formatter_class=RawTextHelpFormatter)
+    parser.add_argument('--recording', type=str, required=True,
+                        help='Path to the sensor frame store of a REGULAR run (see --record-sensors)')
+    parser.add_argument('--cases', type=str, default='',
+                        help='Comma separated RAI cases to replay, e.g. REGULAR_D1,REGULAR_D3 (default: all D1/D2/D3)')
+    parser.add_argument('--lockstep', action='store_true',
+                        help='Replay all the cases at once, batching the agent steps with run_step_batch() if implemented')
+    parser.add_argument('--output', type=str, default='./replay_results.json',
+                        help='Path to the json file used for saving the replay results')
+
+    # agent-related options
+    parser.add_argument('-a', '--agent', type=str, help="Path to Agent's py file to evaluate", required=True)
+    parser.add_argument('--agent-config', type=str, help="Path to Agent's configuration file", default="")
+    parser.add_argument('--robustness-config', type=str, default='',
+                        help='Path to the robustness config (default: $RAI_LEADERBOARD_ROOT/config/robustness.yaml)')
+    parser.add_argument('--robustness-override', type=str, action='append', default=[],
+                        help="Override a robustness config value, e.g. camera.probability=0.2 (can be repeated)")
+    arguments = parser.parse_args()
+
+    cases = [case.strip() for case in arguments.cases.split(',') if case.strip()]
+
+    robustness_config = load_robustness_config(arguments.robustness_config or None, arguments.robustness_override)
+    replayer = OpenLoopReplayer(arguments.agent, arguments.agent_config, arguments.recording, robustness_config)
+    results = replayer.run(cases, arguments.lockstep)
+
+    with open(arguments.output, 'w') as f:
+        json.dump({'recording': arguments.recording, 'results': results}, f, indent=2)
+
+    list_statistics = [['Case', 'Sensor', 'Severity', 'Control deviation', 'Robustness proxy']]
+    for result in results:
+        severity = result['severity']
+        list_statistics.append([result['route_type'], result['sensor'],
+                                '{}={}'.format(severity['parameter'], severity['level']) if severity else '-',
+                                '{:.6f}'.format(result['control_deviation']),
+                                '{:.6f}'.format(result['robustness_proxy'])])
+    print(tabulate(list_statistics, tablefmt='fancy_grid'))
+
+if __name__ == '__main__':
+    main()
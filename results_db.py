@@ -0,0 +1,62 @@
+import argparse
+from argparse import RawTextHelpFormatter
+
+from tabulate import tabulate
+
+from rai.utils.results_db import RAIResultsDatabase, find_checkpoints
+
+def main():
+    description = "RAI Leaderboard results database: ingest checkpoints and query the leaderboard across submissions\n"
+
+    parser = argparse.ArgumentParser(description=description, formatter_class=RawTextHelpFormatter)
+    parser.add_argument('--db', type=str, default='./rai_results.db', help='Path to the SQLite database')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    ingest_parser = subparsers.add_parser('ingest', help='Load checkpoints (files or directories) into the database')
+    ingest_parser.add_argument('checkpoints', nargs='+', help='Checkpoint json files or directories containing them')
+    ingest_parser.add_argument('--agent', type=str, default=None,
+                               help='Agent name of all the checkpoints given (default: checkpoint file name, or its '
+                                    'directory for simulation_results.json)')
+
+    rank_parser = subparsers.add_parser('rank', help='Rank the agents by a global score')
+    rank_parser.add_argument('--key', type=str, default='rai_avg_score_composed', help='Global score to rank by')
+    rank_parser.add_argument('--limit', type=int, default=None, help='Number of agents to show')
+
+    cases_parser = subparsers.add_parser('cases', help='Per-case robustness breakdown')
+    cases_parser.add_argument('--agent', type=str, default=None, help='Only show this agent')
+
+    subparsers.add_parser('emissions', help='Compare the average emissions of the agents')
+    arguments = parser.parse_args()
+
+    database = RAIResultsDatabase(arguments.db)
+    try:
+        if arguments.command == 'ingest':
+            checkpoints = find_checkpoints(arguments.checkpoints)
+            n_ingested = 0
+            for checkpoint in checkpoints:
+                try:
+                    n_ingested += database.ingest(checkpoint, arguments.agent)
+                except ValueError as e:
+                    print("\033[93mSkipping: {}\033[0m".format(e))
+            print(f"Ingested {n_ingested} of {len(checkpoints)} checkpoints, the rest were unchanged")
+
+        elif arguments.command == 'rank':
+            rows = database.rankings(arguments.key, arguments.limit)
+            print(tabulate([[idx + 1, agent, '{:.3f}'.format(value), status] for idx, (agent, value, status, _) in enumerate(rows)],
+                           headers=['Rank', 'Agent', arguments.key, 'Entry status'], tablefmt='fancy_grid'))
+
+        elif arguments.command == 'cases':
+            rows = database.case_breakdown(arguments.agent)
+            print(tabulate([[agent, key, '{:.3f}'.format(value)] for agent, key, value in rows],
+                           headers=['Agent', 'Case', 'Score'], tablefmt='fancy_grid'))
+
+        elif arguments.command == 'emissions':
+            rows = database.emissions()
+            print(tabulate([[agent, '{:.6f}'.format(per_sec or 0.0) + 'Kg', '{:.6f}'.format(per_route or 0.0) + 'Kg']
+                            for agent, per_sec, per_route in rows],
+                           headers=['Agent', 'Avg. Emissions Per Sec', 'Avg. Emissions Per Route'], tablefmt='fancy_grid'))
+    finally:
+        database.close()
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,48 @@
+import xml.etree.ElementTree as ET
 
+import carla
 from srunner.scenarioconfigs.route_scenario_configuration import RouteScenarioConfiguration
+from leaderboard.utils.route_parser import RouteParser
+
+
+class RouteSource:
+    """
+    Location of a route element inside a routes file. The element is only parsed
+    when its waypoints or weather are first needed, and the result is shared by
+    all the copies of the configuration
+    """
+    def __init__(self, filename, start, end):
+        self.filename = filename
+        self.start = start
+        self.end = end
+        self._trajectory = None
+        self._weather = None
+
+    def _load(self):
+        with open(self.filename, 'rb') as f:
+            f.seek(self.start)
+            route = ET.fromstring(f.read(self.end - self.start))
+
+        self._weather = RouteParser.parse_weather(route)
+        waypoint_list = []  # the list of waypoints that can be found on this route
+        for waypoint in route.iter('waypoint'):
+            waypoint_list.append(carla.Location(x=float(waypoint.attrib['x']),
+                                                y=float(waypoint.attrib['y']),
+                                                z=float(waypoint.attrib['z'])))
+        self._trajectory = waypoint_list
+
+    @property
+    def trajectory(self):
+        if self._trajectory is None:
+            self._load()
+        return self._trajectory
+
+    @property
+    def weather(self):
+        if self._weather is None:
+            self._load()
+        return self._weather
+
 
 class ExtRouteScenarioConfiguration(RouteScenarioConfiguration):
      #add RAI info
@@ -9,3 +52,38 @@ class ExtRouteScenarioConfiguration(RouteScenarioConfiguration):
     rai_interface = None
     frame_rate = 20
     run_id = None
+    variant = None
+    coverage = None
+    result_key = None
+    frame_recorder = None
+    severity = None
+    early_stop = None
+    route_source = None
+    latency = None
+    deadline = None
+
+    # trajectory and weather are read from route_source on first use, unless set
+    _trajectory = None
+    _weather = None
+
+    @property
+    def trajectory(self):
+        if self._trajectory is None and self.route_source is not None:
+            return self.route_source.trajectory
+        return self._trajectory
+
+    @trajectory.setter
+    def trajectory(self, value):
+        self._trajectory = value
+
+    @property
+    def weather(self):
+        if self._weather is None:
+            if self.route_source is not None:
+                return self.route_source.weather
+            self._weather = carla.WeatherParameters()
+        return self._weather
+
+    @weather.setter
+    def weather(self, value):
+        self._weather = value
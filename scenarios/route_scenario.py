@@ -1,13 +1,22 @@
-from leaderboard.scenarios.route_scenario import RouteScenario
+from srunner.scenariomanager.carla_data_provider import CarlaDataProvider
+
+from leaderboard.scenarios.route_scenario import RouteScenario, convert_transform_to_location
+
+from rai.utils.route_plan import get_route_plan
+from rai.utils.scenario_index import ScenarioAnnotationIndex
 
 class RAIRouteScenario(RouteScenario):
-    def __init__(self, world, config, debug_mode, custom_timeout, criteria_enable=True):
+    def __init__(self, world, config, debug_mode, custom_timeout, criteria_enable=True, route_plan_cache=None,
+                 use_route_plan_cache=True):
         """
         Setup all relevant parameters and create scenarios along route
         """
         self.config = config
         self.route = None
         self.sampled_scenarios_definitions = None
+        # Directory of the cached route plans, None for $RAI_CACHE_DIR/route_plans
+        self.route_plan_cache = route_plan_cache
+        self.use_route_plan_cache = use_route_plan_cache
 
         self._update_route(world, config, debug_mode>0)
 
@@ -29,4 +38,32 @@ class RAIRouteScenario(RouteScenario):
                                             world=world,
                                             debug_mode=debug_mode>1,
                                             terminate_on_failure=False,
-                                            criteria_enable=criteria_enable)
\ No newline at end of file
+                                            criteria_enable=criteria_enable)
+
+    @property
+    def scenario_index(self):
+        """
+        Spatial index of the scenario annotation file of the route
+        """
+        return ScenarioAnnotationIndex.load(self.config.scenario_file)
+
+    def _update_route(self, world, config, debug_mode):
+        """
+        Update the input route, i.e. refine waypoint list, and extract possible scenario locations.
+        The plan is shared by all the runs of the route, only planned by the first one
+        """
+        plan = get_route_plan(world, config, self._scenario_sampling, self.route_plan_cache, self.use_route_plan_cache)
+
+        self.route = plan.route
+        CarlaDataProvider.set_ego_vehicle_route(convert_transform_to_location(self.route))
+
+        config.agent.set_global_plan(plan.gps_route, self.route)
+
+        self.sampled_scenarios_definitions = plan.scenario_definitions
+
+        # Timeout of scenario in seconds
+        self.timeout = self._estimate_route_timeout()
+
+        # Print route in debug mode
+        if debug_mode:
+            self._draw_waypoints(world, self.route, vertical_shift=1.0, persistency=50000.0)
@@ -0,0 +1,140 @@
+from srunner.scenariomanager.carla_data_provider import CarlaDataProvider
+from srunner.scenariomanager.scenarioatomics.atomic_criteria import ActorSpeedAboveThresholdTest
+from srunner.scenariomanager.timer import GameTime
+from srunner.scenariomanager.traffic_events import TrafficEvent, TrafficEventType
+
+from leaderboard.utils.statistics_manager import PENALTY_COLLISION_PEDESTRIAN, PENALTY_COLLISION_VEHICLE, \
+    PENALTY_COLLISION_STATIC, PENALTY_TRAFFIC_LIGHT, PENALTY_STOP
+
+from rai.core.variations import RAIVariation
+from rai.utils.statistics_table import is_scored
+
+# Penalty of every traffic event that is known while the run is going on
+RUNNING_PENALTIES = {
+    TrafficEventType.COLLISION_STATIC: PENALTY_COLLISION_STATIC,
+    TrafficEventType.COLLISION_PEDESTRIAN: PENALTY_COLLISION_PEDESTRIAN,
+    TrafficEventType.COLLISION_VEHICLE: PENALTY_COLLISION_VEHICLE,
+    TrafficEventType.TRAFFIC_LIGHT_INFRACTION: PENALTY_TRAFFIC_LIGHT,
+    TrafficEventType.STOP_INFRACTION: PENALTY_STOP,
+}
+
+def running_scores(criteria):
+    """
+    Route completion and infraction penalty of the traffic events collected so far
+    """
+    score_route = 0.0
+    score_penalty = 1.0
+    for node in criteria:
+        for event in node.list_traffic_events:
+            event_type = event.get_type()
+            if event_type in RUNNING_PENALTIES:
+                score_penalty *= RUNNING_PENALTIES[event_type]
+            elif event_type == TrafficEventType.ROUTE_COMPLETED:
+                score_route = 100.0
+            elif event_type == TrafficEventType.ROUTE_COMPLETION and score_route < 100.0:
+                if event.get_dict():
+                    score_route = event.get_dict()['route_completed']
+    return score_route, score_penalty
+
+
+class RunMonitor:
+    """
+    Base class of the policies that can end a run before its scenario finishes.
+    The scenario manager calls reset() before the run and update() after every tick
+    """
+    def reset(self, config):
+        pass
+
+    def update(self, scenario):
+        """
+        Return a dict describing why the run should be stopped, or None to go on
+        """
+        return None
+
+
+class RAIScoreSettledMonitor(RunMonitor):
+    """
+    Stop a run as soon as its outcome can't change the RAI scores. As infractions
+    can happen until the very end, a running score is never a lower bound of the
+    final one, so a run is only stopped when the minimum score of its case is
+    already 0: the first run with the minimum is kept, so the rest of the run can't
+    change the score of its case. Stopped runs are left out of the global statistics
+    (averages, infractions per km and severity curves), as their drive is incomplete
+    """
+    def __init__(self, statistics_manager, check_every=20):
+        self.statistics_manager = statistics_manager
+        self.check_every = check_every
+        self._reason = None
+        self._ticks = 0
+
+    def reset(self, config):
+        self._reason = None
+        self._ticks = 0
+        # The REGULAR run is the baseline and severity sweep levels build the curves
+        if not config.is_rai or config.route_type == RAIVariation.REGULAR or not is_scored(config.severity):
+            return
+
+        case_min_score = self.statistics_manager.case_min_score(config.route_type)
+        if case_min_score is not None and case_min_score <= 0:
+            self._reason = 'case_min_score_zero'
+
+    def update(self, scenario):
+        if self._reason is None:
+            return None
+        self._ticks += 1
+        if self._ticks % self.check_every:
+            return None
+
+        score_route, score_penalty = running_scores(scenario.get_criteria())
+        return {'reason': self._reason, 'score_route': score_route, 'score_penalty': score_penalty}
+
+
+class StallMonitor(RunMonitor):
+    """
+    Declare the agent blocked when it hasn't made progress for stall_time simulated
+    seconds, i.e. its route completion hasn't increased and it hasn't moved more than
+    stall_distance meters. The ego is sampled every sample_period simulated seconds
+    """
+    def __init__(self, stall_time, stall_distance=1.0, sample_period=1.0):
+        self.stall_time = stall_time
+        self.stall_distance = stall_distance
+        self.sample_period = sample_period
+        self.reset(None)
+
+    def reset(self, config):
+        self._next_sample = None
+        self._progress_time = None
+        self._progress_location = None
+        self._progress_completion = -1.0
+
+    def update(self, scenario):
+        now = GameTime.get_time()
+        if self._next_sample is not None and now < self._next_sample:
+            return None
+        self._next_sample = now + self.sample_period
+
+        location = CarlaDataProvider.get_location(CarlaDataProvider.get_hero_actor())
+        if location is None:
+            return None
+        criteria = scenario.get_criteria()
+        score_route, _ = running_scores(criteria)
+
+        if self._progress_time is None or score_route > self._progress_completion \
+                or location.distance(self._progress_location) > self.stall_distance:
+            self._progress_time = now
+            self._progress_location = location
+            self._progress_completion = score_route
+            return None
+        if now - self._progress_time < self.stall_time:
+            return None
+
+        # Fail the run through the blocked criterion, as if it had detected the stall
+        blocked_criterion = next((node for node in criteria if isinstance(node, ActorSpeedAboveThresholdTest)),
+                                 criteria[0] if criteria else None)
+        if blocked_criterion is not None:
+            blocked_event = TrafficEvent(event_type=TrafficEventType.VEHICLE_BLOCKED)
+            ActorSpeedAboveThresholdTest._set_event_message(blocked_event, location)
+            ActorSpeedAboveThresholdTest._set_event_dict(blocked_event, location)
+            blocked_criterion.list_traffic_events.append(blocked_event)
+
+        return {'reason': 'stall', 'stalled_for': now - self._progress_time, 'score_route': score_route}
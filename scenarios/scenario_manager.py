@@ -13,6 +13,9 @@ from leaderboard.autoagents.agent_wrapper import AgentError
 from leaderboard.envs.sensor_interface import SensorReceivedNoData
 
 from rai.autoagents.agent_wrapper import RAIAgentWrapper
+from rai.autoagents.deadline import DeadlineRunner
+from rai.utils.events import EventBus
+from rai_metric.latency import LatencyHistogram
 
 class RAIScenarioManager(ScenarioManager):
     """
@@ -23,6 +26,16 @@ class RAIScenarioManager(ScenarioManager):
         super().__init__(timeout, debug_mode)
         # new class variable
         self.config = None
+        # policies that can stop a run before the scenario finishes
+        self.run_monitors = []
+        # progress events, with tick_stats every tick_stats_period wall-clock seconds
+        self.events = EventBus()
+        self.tick_stats_period = 5.0
+        self.ticks = 0
+        # per-tick compute budget of the agent in milliseconds, None to wait for every step
+        self.realtime_budget_ms = None
+        # decode the sensor data into preallocated buffers instead of new arrays
+        self.zero_copy_sensors = False
 
     def load_scenario(self, scenario, agent, rep_number):
         """
@@ -30,7 +43,7 @@ class RAIScenarioManager(ScenarioManager):
         """
 
         GameTime.restart()
-        self._agent = RAIAgentWrapper(agent)
+        self._agent = RAIAgentWrapper(agent, self.zero_copy_sensors)
         self.scenario_class = scenario
         self.scenario = scenario.scenario
         self.scenario_tree = self.scenario.scenario_tree
@@ -54,16 +67,33 @@ class RAIScenarioManager(ScenarioManager):
         self._running = True
 
         self.config = config
-
-        while self._running:
-            timestamp = None
-            world = CarlaDataProvider.get_world()
-            if world:
-                snapshot = world.get_snapshot()
-                if snapshot:
-                    timestamp = snapshot.timestamp
-            if timestamp:
-                self._tick_scenario(timestamp)
+        self.config.early_stop = None
+        self.config.latency = LatencyHistogram()
+        self.config.deadline = DeadlineRunner(self.realtime_budget_ms) if self.realtime_budget_ms else None
+        if self.config.rai_interface is not None:
+            # The noise of the sensor distortions is generated for the whole route up front
+            timeout = getattr(self.scenario_class, 'timeout', None) or 0
+            self.config.rai_interface.start_run(self.config, int(timeout * self.config.frame_rate))
+        self.ticks = 0
+        self._stats_time = self.start_system_time
+        self._stats_ticks = 0
+        for monitor in self.run_monitors:
+            monitor.reset(config)
+
+        try:
+            while self._running:
+                timestamp = None
+                world = CarlaDataProvider.get_world()
+                if world:
+                    snapshot = world.get_snapshot()
+                    if snapshot:
+                        timestamp = snapshot.timestamp
+                if timestamp:
+                    self._tick_scenario(timestamp)
+        finally:
+            # The agent may still be computing a step that missed its deadline
+            if self.config.deadline is not None:
+                self.config.deadline.close()
 
     def _tick_scenario(self, timestamp):
         """
@@ -100,8 +130,13 @@ class RAIScenarioManager(ScenarioManager):
                     self.scenario_tree, show_status=True)
                 sys.stdout.flush()
 
+            self.ticks += 1
+            self._emit_tick_stats()
+
             if self.scenario_tree.status != py_trees.common.Status.RUNNING:
                 self._running = False
+            else:
+                self._update_run_monitors()
 
             spectator = CarlaDataProvider.get_world().get_spectator()
             ego_trans = self.ego_vehicles[0].get_transform()
@@ -109,4 +144,42 @@ class RAIScenarioManager(ScenarioManager):
                                                         carla.Rotation(pitch=-90)))
 
         if self._running and self.get_running_status():
-            CarlaDataProvider.get_world().tick(self._timeout)
\ No newline at end of file
+            CarlaDataProvider.get_world().tick(self._timeout)
+
+    def _emit_tick_stats(self):
+        """
+        Report the simulation throughput, at most once per tick_stats_period
+        """
+        now = time.time()
+        if now - self._stats_time < self.tick_stats_period:
+            return
+        game_time = GameTime.get_time() - self.start_game_time
+        system_time = now - self.start_system_time
+        self.events.emit('tick_stats', route_type=self.config.route_type, ticks=self.ticks,
+                         game_time=game_time, system_time=system_time,
+                         ticks_per_second=(self.ticks - self._stats_ticks) / (now - self._stats_time),
+                         realtime_factor=game_time / system_time if system_time > 0 else 0.0)
+        self._stats_time = now
+        self._stats_ticks = self.ticks
+
+    def _update_run_monitors(self):
+        """
+        Stop the run if any of the run monitors asks for it, and record why
+        """
+        for monitor in self.run_monitors:
+            early_stop = monitor.update(self.scenario)
+            if early_stop is not None:
+                game_time = GameTime.get_time() - self.start_game_time
+                system_time = time.time() - self.start_system_time
+                early_stop['game_time'] = game_time
+                early_stop['monitor'] = type(monitor).__name__
+                # The run would have gone on until the route timeout at most
+                timeout = getattr(self.scenario_class, 'timeout', None)
+                if timeout:
+                    early_stop['game_time_saved'] = max(0.0, timeout - game_time)
+                    early_stop['system_time_saved'] = early_stop['game_time_saved'] * system_time / game_time \
+                        if game_time > 0 else 0.0
+                self.config.early_stop = early_stop
+                self._running = False
+                self.events.emit('run_stopped_early', route_type=self.config.route_type, **early_stop)
+                break
\ No newline at end of file
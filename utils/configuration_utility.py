@@ -1,16 +1,59 @@
 
 import copy
 from rai.core.variations import RAIVariation
+from rai.utils.coverage import SensorCoverage
+from rai.utils.events import EventBus
 from rai.utils.weathers import Weathers
 from rai.utils.sensors import RAISensors
 
+# Robustness parameter that can be swept -> perturbation case it changes
+SEVERITY_CASES = {
+    'camera.probability': RAIVariation.DISTORTION1 + RAISensors.CAMERA,
+    'lidar.channel_range_to_remove': RAIVariation.DISTORTION1 + RAISensors.LIDAR,
+    'camera.num_vertices': RAIVariation.DISTORTION2 + RAISensors.CAMERA,
+    'camera.random_seed': RAIVariation.DISTORTION2 + RAISensors.CAMERA,
+    'lidar.theta': RAIVariation.DISTORTION2 + RAISensors.LIDAR,
+    'lidar.phi': RAIVariation.DISTORTION2 + RAISensors.LIDAR,
+    'gnss.noise_level': RAIVariation.DISTORTION3 + RAISensors.GNSS,
+    'imu.acc_noise_lvl': RAIVariation.DISTORTION3 + RAISensors.IMU,
+    'imu.compass_noise_lvl': RAIVariation.DISTORTION3 + RAISensors.IMU,
+    'imu.gyroscope_noise_lvl': RAIVariation.DISTORTION3 + RAISensors.IMU,
+    'speedometer.speed_noise_lvl': RAIVariation.DISTORTION3 + RAISensors.SPEEDOMETER,
+}
+
 class RAIConfigurationUtility:
     """
     A class to collect configurations that are passed to
     load_and_run_scenario to run the simulation
     """
-    def __init__(self) -> None:
-        self.weathers = Weathers()
+    def __init__(self, robustness_config=None, weathers=None, events=None, coverage=None) -> None:
+        self.weathers = weathers if weathers is not None else Weathers()
+        self.events = events if events is not None else EventBus()
+        # sensors perturbed in each run of the camera and LiDAR cases
+        self.coverage = coverage if coverage is not None else SensorCoverage()
+        # route_type -> (swept parameter, levels, configured level)
+        self.severity_sweeps = {}
+        if robustness_config is not None:
+            for parameter, levels in robustness_config.severity.items():
+                route_type = SEVERITY_CASES[parameter]
+                if route_type in self.severity_sweeps:
+                    raise ValueError(f"Only one parameter can be swept per case, found '{parameter}' and "
+                                     f"'{self.severity_sweeps[route_type][0]}' for {route_type}")
+                default_level = robustness_config.default_level(parameter)
+                # The configured level is always run, as it is the one used for the RAI scores
+                if default_level not in levels:
+                    levels = levels + [default_level]
+                    if all(isinstance(level, (int, float)) for level in levels):
+                        levels = sorted(levels)
+                self.severity_sweeps[route_type] = (parameter, levels, default_level)
+
+    def n_severity_levels(self, route_type):
+        """
+        Number of runs of every sensor of a perturbation case
+        """
+        if route_type in self.severity_sweeps:
+            return len(self.severity_sweeps[route_type][1])
+        return 1
 
     def collect_configs(self, config, sensor_types):
         """
@@ -20,19 +63,39 @@ class RAIConfigurationUtility:
         if config.route_type == RAIVariation.WEATHER:
             return self.collect_weather_configs(config)
         elif config.route_type in [RAIVariation.DISTORTION1, RAIVariation.DISTORTION2, RAIVariation.DISTORTION3]:
-            return self.collect_sensor_configs(config, sensor_types)
+            return self.collect_severity_configs(self.collect_sensor_configs(config, sensor_types))
         else:
             return [config]
 
+    def collect_severity_configs(self, configs):
+        """
+        Expand the sensor configs of the swept cases into one config per severity level
+        """
+        severity_configs = []
+        for config in configs:
+            if config.route_type not in self.severity_sweeps:
+                severity_configs.append(config)
+                continue
+
+            parameter, levels, default_level = self.severity_sweeps[config.route_type]
+            for level in levels:
+                new_config = copy.copy(config)
+                new_config.severity = {'parameter': parameter, 'level': level, 'default': level == default_level}
+                self.events.emit('config_collected', route_type=new_config.route_type, severity=new_config.severity)
+                severity_configs.append(new_config)
+
+        return severity_configs
+
     def collect_weather_configs(self, config):
         """
         Collect weather configs
         """
         configs = []
         all_weathers = self.weathers.get_weathers()
-        for weather in all_weathers:
+        for weather_idx, weather in enumerate(all_weathers):
             new_config = copy.copy(config)
             new_config.weather = weather
+            new_config.variant = 'weather_' + str(weather_idx)
             configs.append(new_config)
 
         return configs
@@ -50,7 +113,8 @@ class RAIConfigurationUtility:
                 config_imu.route_type = tmp_route_type + RAISensors.IMU
                 #Run the route and noise the sensors one after the other in each run
                 config_imu.sensor_to_noise = sensor_types['imu'][0]
-                print(f"route_type: {config_imu.route_type}, sensor: {sensor_types['imu'][0]}")
+                config_imu.variant = sensor_types['imu'][0]['id']
+                self.events.emit('config_collected', route_type=config_imu.route_type, sensor=sensor_types['imu'][0])
                 configs.append(config_imu)
 
             if 'gnss' in sensor_types:
@@ -58,7 +122,8 @@ class RAIConfigurationUtility:
                 config_gnss.route_type = tmp_route_type + RAISensors.GNSS
                 #Run the route and noise the sensors one after the other in each run
                 config_gnss.sensor_to_noise = sensor_types['gnss'][0]
-                print(f"route_type: {config_gnss.route_type}, sensor: {sensor_types['gnss'][0]}")
+                config_gnss.variant = sensor_types['gnss'][0]['id']
+                self.events.emit('config_collected', route_type=config_gnss.route_type, sensor=sensor_types['gnss'][0])
                 configs.append(config_gnss)
 
             if 'speedometer' in sensor_types:
@@ -66,35 +131,23 @@ class RAIConfigurationUtility:
                 config_speedometer.route_type = tmp_route_type + RAISensors.SPEEDOMETER
                 #Run the route and noise the sensors one after the other in each run
                 config_speedometer.sensor_to_noise = sensor_types['speedometer'][0]
-                print(f"route_type: {config_speedometer.route_type}, sensor: {sensor_types['speedometer'][0]}")
+                config_speedometer.variant = sensor_types['speedometer'][0]['id']
+                self.events.emit('config_collected', route_type=config_speedometer.route_type, sensor=sensor_types['speedometer'][0])
                 configs.append(config_speedometer)
         else:
-
-            if 'camera' in sensor_types:
-                sensor_len = len(sensor_types['camera'])
-                sensor_itr = 0
-                config_camera = copy.copy(config)
-                config_camera.route_type = tmp_route_type + RAISensors.CAMERA
-                print(tmp_route_type + RAISensors.CAMERA)
-                #Run the route and noise the sensors one after the other in each run
-                while sensor_itr < sensor_len:
-                    config_camera_tmp = copy.copy(config_camera)
-                    config_camera_tmp.sensor_to_noise = sensor_types['camera'][sensor_itr]
-                    print(f"route_type: {config_camera_tmp.route_type}, sensor: {sensor_types['camera'][sensor_itr]}")
-                    configs.append(config_camera_tmp)
-                    sensor_itr += 1
-
-            if 'lidar' in sensor_types:
-                sensor_len = len(sensor_types['lidar'])
-                sensor_itr = 0
-                config_lidar = copy.copy(config)
-                config_lidar.route_type = tmp_route_type + RAISensors.LIDAR
-                #Run the route and noise the sensors one after the other in each run
-                while sensor_itr < sensor_len:
-                    config_lidar_tmp = copy.copy(config_lidar)
-                    config_lidar_tmp.sensor_to_noise = sensor_types['lidar'][sensor_itr]
-                    print(f"route_type: {config_lidar_tmp.route_type}, sensor: {sensor_types['lidar'][sensor_itr]}")
-                    configs.append(config_lidar_tmp)
-                    sensor_itr += 1
+            for sensor_type, sensor_suffix in [('camera', RAISensors.CAMERA), ('lidar', RAISensors.LIDAR)]:
+                if sensor_type not in sensor_types:
+                    continue
+                sensors = sensor_types[sensor_type]
+                #Run the route once per group of sensors of the coverage strategy, noising them together
+                for group in self.coverage.groups(sensors):
+                    config_sensor = copy.copy(config)
+                    config_sensor.route_type = tmp_route_type + sensor_suffix
+                    config_sensor.sensor_to_noise = group[0] if len(group) == 1 else group
+                    config_sensor.variant = '+'.join(sensor['id'] for sensor in group)
+                    config_sensor.coverage = self.coverage.describe(group, len(sensors))
+                    self.events.emit('config_collected', route_type=config_sensor.route_type,
+                                     sensor=config_sensor.sensor_to_noise)
+                    configs.append(config_sensor)
 
         return configs
\ No newline at end of file
@@ -0,0 +1,70 @@
+import random
+
+# Strategies choosing the sensors perturbed in each run of the camera and LiDAR cases
+COVERAGE_STRATEGIES = ['exhaustive', 'grouped', 'sampled']
+
+class SensorCoverage:
+    """
+    Split the sensors of a type into the groups perturbed together, one run per group:
+        exhaustive  every sensor in a run of its own
+        grouped     all the sensors of the type in a single run
+        sampled     `samples` sensors in runs of their own. They are drawn in turn
+                    from seeded permutations of the sensors, so every sensor is
+                    perturbed once every ceil(n / samples) draws (across the cases
+                    and routes) before any sensor is drawn again
+    """
+    def __init__(self, strategy='exhaustive', samples=1, seed=0):
+        if strategy not in COVERAGE_STRATEGIES:
+            raise ValueError(f"Unknown coverage strategy '{strategy}', expected one of {COVERAGE_STRATEGIES}")
+        if samples < 1:
+            raise ValueError(f"The sampled coverage needs at least one sensor per case, got {samples}")
+        self.strategy = strategy
+        self.samples = samples
+        self.seed = seed
+        self._rng = random.Random(seed)
+        # sensor ids -> sensors left in the current permutation
+        self._queues = {}
+
+    def n_runs(self, n_sensors):
+        """
+        Number of runs of a case for a sensor type with n_sensors sensors
+        """
+        if not n_sensors:
+            return 0
+        if self.strategy == 'grouped':
+            return 1
+        elif self.strategy == 'sampled':
+            return min(self.samples, n_sensors)
+        return n_sensors
+
+    def groups(self, sensors):
+        """
+        Groups of sensors of one type, each perturbed in a run of its own
+        """
+        if self.strategy == 'exhaustive':
+            return [[sensor] for sensor in sensors]
+        elif self.strategy == 'grouped':
+            return [list(sensors)]
+
+        key = tuple(sensor['id'] for sensor in sensors)
+        queue = self._queues.setdefault(key, [])
+        chosen = []
+        while len(chosen) < self.n_runs(len(sensors)):
+            if not queue:
+                permutation = list(sensors)
+                self._rng.shuffle(permutation)
+                # Sensors already drawn for this case go to the end of the new permutation
+                queue.extend([sensor for sensor in permutation if sensor not in chosen] +
+                             [sensor for sensor in permutation if sensor in chosen])
+            chosen.append(queue.pop(0))
+        return [[sensor] for sensor in chosen]
+
+    def describe(self, group, n_sensors):
+        """
+        Coverage of a run perturbing a group of sensors, out of the n_sensors of its type
+        """
+        coverage = {'strategy': self.strategy, 'sensors': [sensor['id'] for sensor in group], 'of': n_sensors}
+        if self.strategy == 'sampled':
+            coverage['samples'] = self.samples
+            coverage['seed'] = self.seed
+        return coverage
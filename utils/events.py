@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+
+"""
+Structured progress events of the RAI leaderboard. The evaluator emits typed
+events (run_started, world_loaded, tick_stats, run_finished, ...) to an EventBus,
+which forwards them to its sinks:
+    ConsoleSink    human readable messages on stdout
+    JsonlSink      one json object per line, buffered
+    MetricsSink    Prometheus text metrics served on a local port
+
+Every event is a dict with its type in 'event', the unix time in 'time' and
+its own fields.
+"""
+import atexit
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+from tabulate import tabulate
+
+
+class EventBus:
+    """
+    Send every emitted event to all the sinks
+    """
+    def __init__(self, sinks=None):
+        self.sinks = list(sinks) if sinks is not None else [ConsoleSink()]
+
+    def add_sink(self, sink):
+        self.sinks.append(sink)
+
+    def emit(self, event_type, **fields):
+        event = {'event': event_type, 'time': time.time()}
+        event.update(fields)
+        for sink in self.sinks:
+            sink.handle(event)
+        return event
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+
+class EventSink:
+    """
+    Base class of the event sinks
+    """
+    def handle(self, event):
+        pass
+
+    def close(self):
+        pass
+
+
+class ConsoleSink(EventSink):
+    """
+    Render the events as the console messages of the leaderboard. Events without
+    a render_<event> method, such as tick_stats, are not shown
+    """
+    def handle(self, event):
+        render = getattr(self, 'render_' + event['event'], None)
+        if render is not None:
+            message = render(event)
+            if message is not None:
+                print(message, flush=True)
+
+    @staticmethod
+    def render_run_started(event):
+        message = "Executing: {} ".format(event['route_type'])
+        if event.get('sensor_id') is not None:
+            message += "\n... with sensor ID: {}".format(event['sensor_id'])
+        return message
+
+    @staticmethod
+    def render_run_preparing(event):
+        return "\n\033[1m========= Preparing {} (repetition {}) =========\n> Setting up the agent\033[0m".format(
+            event['route'], event['repetition'])
+
+    @staticmethod
+    def render_route_set(event):
+        return "Route setting completed..."
+
+    @staticmethod
+    def render_agent_ready(event):
+        return "Sensor data inspected and stored..."
+
+    @staticmethod
+    def render_world_loading(event):
+        return "\033[1m> Loading the world\033[0m"
+
+    @staticmethod
+    def render_world_reused(event):
+        return "Reusing the loaded world..."
+
+    @staticmethod
+    def render_world_loaded(event):
+        return "Scenario instance created..."
+
+    @staticmethod
+    def render_scenario_loading(event):
+        return "Loading scenario..."
+
+    @staticmethod
+    def render_scenario_loaded(event):
+        return "Scenario loading complete..."
+
+    @staticmethod
+    def render_run_running(event):
+        return "\033[1m> Running the route\033[0m"
+
+    @staticmethod
+    def render_run_stopping(event):
+        return "\033[1m> Stopping the route\033[0m"
+
+    @staticmethod
+    def render_run_stopped_early(event):
+        return "\033[93mStopping the run early: {}\033[0m".format(event['reason'])
+
+    @staticmethod
+    def render_run_cached(event):
+        return "\033[1m> Reusing the result of an identical earlier run ({})\033[0m".format(event['key'][:12])
+
+    @staticmethod
+    def render_run_finished(event):
+        progress = event.get('progress')
+        if progress is None or event.get('provisional_score') is None:
+            return None
+        return "\033[1m> Provisional RAI avg. driving score: {:.3f} ({} of {} runs)\033[0m".format(
+            event['provisional_score'], progress[0], progress[1])
+
+    @staticmethod
+    def render_config_collected(event):
+        if 'severity' in event:
+            return "route_type: {}, severity: {}={}".format(event['route_type'], event['severity']['parameter'],
+                                                            event['severity']['level'])
+        return "route_type: {}, sensor: {}".format(event['route_type'], event['sensor'])
+
+    @staticmethod
+    def render_warning(event):
+        return "\033[93m{}\033[0m".format(event['message'])
+
+    @staticmethod
+    def render_error(event):
+        return "\n\033[91m{}:\n> {}\033[0m\n".format(event['error'], event['message'])
+
+    @staticmethod
+    def render_global_statistics_started(event):
+        return "\033[1m> Registering the global statistics\033[0m"
+
+    @staticmethod
+    def render_global_statistics(event):
+        return tabulate(event['table'], tablefmt='fancy_grid') + "\n"
+
+
+class JsonlSink(EventSink):
+    """
+    Append the events to a JSON-lines file. Lines are buffered and flushed at the
+    end of every run, on errors and when the bus is closed
+    """
+    FLUSH_EVENTS = ('run_finished', 'error', 'global_statistics')
+
+    def __init__(self, path, buffer_size=1 << 16):
+        self.path = path
+        self._file = open(path, 'a', buffering=buffer_size)
+        atexit.register(self.close)
+
+    def handle(self, event):
+        if self._file is None:
+            return
+        self._file.write(json.dumps(event, default=str) + '\n')
+        if event['event'] in self.FLUSH_EVENTS:
+            self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+# Metrics served by the MetricsSink: name, Prometheus type and help
+METRICS = [
+    ('rai_runs_planned', 'gauge', 'Runs planned for the evaluation'),
+    ('rai_runs_started_total', 'counter', 'Runs started'),
+    ('rai_runs_finished_total', 'counter', 'Runs finished, including the cached ones'),
+    ('rai_runs_failed_total', 'counter', 'Runs finished with a failed status'),
+    ('rai_runs_stopped_early_total', 'counter', 'Runs stopped by a run monitor'),
+    ('rai_runs_cached_total', 'counter', 'Runs reused from the result cache'),
+    ('rai_errors_total', 'counter', 'Errors reported by the evaluator'),
+    ('rai_ticks_total', 'counter', 'Simulation ticks of the finished and current runs'),
+    ('rai_game_time_seconds_total', 'counter', 'Simulated seconds of the finished runs'),
+    ('rai_system_time_seconds_total', 'counter', 'Wall-clock seconds of the finished runs'),
+    ('rai_ticks_per_second', 'gauge', 'Ticks per second of the current run'),
+    ('rai_realtime_factor', 'gauge', 'Simulated seconds per wall-clock second of the current run'),
+    ('rai_last_score_composed', 'gauge', 'Driving score of the last finished run'),
+    ('rai_provisional_score', 'gauge', 'Provisional RAI average score of the evaluation'),
+]
+
+
+class MetricsSink(EventSink):
+    """
+    Keep counters of the events and serve them in the Prometheus text format on
+    http://<host>:<port>/metrics, so dashboards can follow the throughput of a job
+    """
+    def __init__(self, port, host='127.0.0.1'):
+        self._lock = threading.Lock()
+        self._metrics = {name: 0 if metric_type == 'counter' else 0.0 for name, metric_type, _ in METRICS}
+        # Ticks of the finished runs, the current run only reports its own
+        self._finished_ticks = 0
+
+        sink = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path not in ['/', '/metrics']:
+                    self.send_error(404)
+                    return
+                body = sink.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = _ThreadingHTTPServer((host, port), MetricsHandler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def handle(self, event):
+        event_type = event['event']
+        with self._lock:
+            metrics = self._metrics
+            if event_type == 'run_started':
+                metrics['rai_runs_started_total'] += 1
+                if event.get('total_runs'):
+                    metrics['rai_runs_planned'] = event['total_runs']
+            elif event_type == 'tick_stats':
+                metrics['rai_ticks_total'] = self._finished_ticks + event['ticks']
+                metrics['rai_ticks_per_second'] = event['ticks_per_second']
+                metrics['rai_realtime_factor'] = event['realtime_factor']
+            elif event_type == 'run_finished':
+                metrics['rai_runs_finished_total'] += 1
+                self._finished_ticks += event.get('ticks', 0)
+                metrics['rai_ticks_total'] = self._finished_ticks
+                if not event.get('cached'):
+                    metrics['rai_game_time_seconds_total'] += event.get('duration_game', 0.0)
+                    metrics['rai_system_time_seconds_total'] += event.get('duration_system', 0.0)
+                metrics['rai_last_score_composed'] = event['scores']['score_composed']
+                if event.get('provisional_score') is not None:
+                    metrics['rai_provisional_score'] = event['provisional_score']
+                if event['status'].startswith('Failed'):
+                    metrics['rai_runs_failed_total'] += 1
+            elif event_type == 'run_stopped_early':
+                metrics['rai_runs_stopped_early_total'] += 1
+            elif event_type == 'run_cached':
+                metrics['rai_runs_cached_total'] += 1
+            elif event_type == 'error':
+                metrics['rai_errors_total'] += 1
+
+    def render(self):
+        with self._lock:
+            return ''.join('# HELP {0} {1}\n# TYPE {0} {2}\n{0} {3}\n'.format(name, description, metric_type,
+                                                                                 self._metrics[name])
+                           for name, metric_type, description in METRICS)
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
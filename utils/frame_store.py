@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+
+"""
+Compact on-disk store for raw sensor frames, used for debugging, offline
+perturbation tests and replaying a recorded run without the simulator.
+
+Every sensor is stored in its own set of flat files, keyed by frame:
+    camera  <id>.data    fixed-shape uint8 frames, read as a (n, H, W, C) memmap
+    lidar   <id>.data    float32 points of all frames, read as a (points, 4) memmap
+            <id>.offs    start row of every frame inside <id>.data (n + 1 entries)
+    gnss, imu, speedometer
+            <id>.data    float64 columns, read as a (n, width) memmap
+    all     <id>.frame   CARLA frame number of every stored frame
+
+Besides the sensors, the store keeps the game time and the (steer, throttle, brake)
+applied at every frame, the global plan given to the agent and an index.json.
+"""
+import json
+import os
+import queue
+import threading
+
+import numpy as np
+
+STORE_INDEX = 'index.json'
+
+class FrameKind:
+    CAMERA = 'camera'
+    LIDAR = 'lidar'
+    COLUMNS = 'columns'
+    SPEED = 'speed'
+
+
+def _sensor_file(sensor_id, suffix):
+    """
+    Sensor ids are used as file names, keep them path-safe
+    """
+    return str(sensor_id).replace(os.sep, '_') + suffix
+
+
+def _frame_kind(data):
+    if isinstance(data, dict):
+        return FrameKind.SPEED
+    if data.ndim == 3 and data.dtype == np.uint8:
+        return FrameKind.CAMERA
+    if data.ndim == 2:
+        return FrameKind.LIDAR
+    return FrameKind.COLUMNS
+
+
+class SensorFrameWriter:
+    """
+    Write the raw sensor_interface data of a run to the store. The calling thread
+    only snapshots the data, the files are written by a background thread fed
+    through a bounded queue, so a slow disk throttles the run instead of growing memory
+    """
+    def __init__(self, path, route_type=None, max_queued_frames=64):
+        self.path = path
+        self.route_type = route_type
+        self.n_frames = 0
+        self._sensors = {}
+        self._global_plan = None
+        self._error = None
+        os.makedirs(self.path, exist_ok=True)
+
+        self._timestamps = open(os.path.join(self.path, 'timestamps.data'), 'wb')
+        self._controls = open(os.path.join(self.path, 'controls.data'), 'wb')
+
+        self._queue = queue.Queue(maxsize=max_queued_frames)
+        self._thread = threading.Thread(target=self._write_loop, name='SensorFrameWriter', daemon=True)
+        self._thread.start()
+
+    def add_frame(self, timestamp, input_data):
+        """
+        Snapshot the data of all sensors for one frame and queue it for writing.
+        The data has to be copied, as the perturbations modify it in place
+        """
+        snapshot = []
+        for sensor_id, (frame, data) in input_data.items():
+            if isinstance(data, dict):
+                data = np.array([data['speed']], dtype=np.float64)
+                kind = FrameKind.SPEED
+            else:
+                data = np.array(data, copy=True)
+                kind = _frame_kind(data)
+            snapshot.append((sensor_id, kind, frame, data))
+        self._queue.put(('frame', timestamp, snapshot))
+        self.n_frames += 1
+
+    def add_control(self, control):
+        """
+        Store the control the agent produced for the latest frame
+        """
+        self._queue.put(('control', (control.steer, control.throttle, control.brake)))
+
+    def set_global_plan(self, global_plan, global_plan_world_coord):
+        """
+        Store the route given to the agent. Only the first call is kept
+        """
+        if self._global_plan is not None:
+            return
+        self._global_plan = {
+            'gps': [[point['lat'], point['lon'], point['z'], option.value] for point, option in global_plan],
+            'world': [[transform.location.x, transform.location.y, transform.location.z,
+                       transform.rotation.pitch, transform.rotation.yaw, transform.rotation.roll, option.value]
+                      for transform, option in global_plan_world_coord]
+        }
+
+    def _open_sensor(self, sensor_id, kind, data):
+        sensor = {'kind': kind, 'dtype': data.dtype.str, 'shape': list(data.shape), 'points': 0,
+                  'data': open(os.path.join(self.path, _sensor_file(sensor_id, '.data')), 'wb'),
+                  'frame': open(os.path.join(self.path, _sensor_file(sensor_id, '.frame')), 'wb'),
+                  'offs': None}
+        if kind == FrameKind.LIDAR:
+            sensor['shape'] = [data.shape[1]]
+            sensor['offs'] = open(os.path.join(self.path, _sensor_file(sensor_id, '.offs')), 'wb')
+            sensor['offs'].write(np.int64(0).tobytes())
+        self._sensors[sensor_id] = sensor
+        return sensor
+
+    def _write_frame(self, timestamp, snapshot):
+        self._timestamps.write(np.float64(timestamp).tobytes())
+        for sensor_id, kind, frame, data in snapshot:
+            sensor = self._sensors.get(sensor_id)
+            if sensor is None:
+                sensor = self._open_sensor(sensor_id, kind, data)
+            elif kind != FrameKind.LIDAR and list(data.shape) != sensor['shape']:
+                raise ValueError(f"Sensor '{sensor_id}' changed its data shape from {sensor['shape']} to {list(data.shape)}")
+
+            sensor['data'].write(np.ascontiguousarray(data, dtype=sensor['dtype']).tobytes())
+            sensor['frame'].write(np.int64(frame).tobytes())
+            if kind == FrameKind.LIDAR:
+                sensor['points'] += len(data)
+                sensor['offs'].write(np.int64(sensor['points']).tobytes())
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            if self._error is not None:
+                continue
+            try:
+                if item[0] == 'frame':
+                    self._write_frame(item[1], item[2])
+                else:
+                    self._controls.write(np.array(item[1], dtype=np.float64).tobytes())
+            except Exception as e:
+                self._error = e
+
+    def close(self):
+        """
+        Wait for the queued frames to be written and write the index
+        """
+        self._queue.put(None)
+        self._thread.join()
+
+        index = {'n_frames': self.n_frames, 'route_type': self.route_type, 'sensors': {}}
+        for sensor_id, sensor in self._sensors.items():
+            for name in ['data', 'frame', 'offs']:
+                if sensor[name] is not None:
+                    sensor[name].close()
+            index['sensors'][sensor_id] = {'kind': sensor['kind'], 'dtype': sensor['dtype'],
+                                           'shape': sensor['shape'], 'points': sensor['points']}
+        self._timestamps.close()
+        self._controls.close()
+
+        if self._global_plan is not None:
+            with open(os.path.join(self.path, 'global_plan.json'), 'w') as f:
+                json.dump(self._global_plan, f)
+        with open(os.path.join(self.path, STORE_INDEX), 'w') as f:
+            json.dump(index, f, indent=2)
+
+        if self._error is not None:
+            raise self._error
+
+
+class SensorFrameReader:
+    """
+    Zero-copy, random access to a store written by SensorFrameWriter. All data
+    is memory-mapped read-only, so frames are views until they are copied
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, STORE_INDEX), 'r') as f:
+            index = json.load(f)
+        self.n_frames = index['n_frames']
+        self.route_type = index.get('route_type')
+        self.sensors = index['sensors']
+        self.timestamps = self._memmap('timestamps.data', np.float64, (self.n_frames,))
+        n_controls = os.path.getsize(os.path.join(path, 'controls.data')) // (3 * 8)
+        self.controls = self._memmap('controls.data', np.float64, (n_controls, 3))
+
+        self._data = {}
+        self._frames = {}
+        self._offsets = {}
+        for sensor_id, sensor in self.sensors.items():
+            self._frames[sensor_id] = self._memmap(_sensor_file(sensor_id, '.frame'), np.int64, (self.n_frames,))
+            if sensor['kind'] == FrameKind.LIDAR:
+                self._offsets[sensor_id] = self._memmap(_sensor_file(sensor_id, '.offs'), np.int64, (self.n_frames + 1,))
+                shape = tuple([sensor['points']] + sensor['shape'])
+            else:
+                shape = tuple([self.n_frames] + sensor['shape'])
+            self._data[sensor_id] = self._memmap(_sensor_file(sensor_id, '.data'), sensor['dtype'], shape)
+
+        self.global_plan = None
+        global_plan_path = os.path.join(path, 'global_plan.json')
+        if os.path.exists(global_plan_path):
+            with open(global_plan_path, 'r') as f:
+                self.global_plan = json.load(f)
+
+    def _memmap(self, name, dtype, shape):
+        if 0 in shape:
+            return np.zeros(shape, dtype=dtype)
+        return np.memmap(os.path.join(self.path, name), dtype=dtype, mode='r', shape=shape)
+
+    def __len__(self):
+        return self.n_frames
+
+    def frames(self, sensor_id):
+        """
+        CARLA frame numbers of a sensor, for frame -> index lookups
+        """
+        return self._frames[sensor_id]
+
+    def index_of(self, sensor_id, frame):
+        """
+        Return the store index of a CARLA frame number, or None if it wasn't recorded
+        """
+        frames = self._frames[sensor_id]
+        index = int(np.searchsorted(frames, frame))
+        if index < len(frames) and frames[index] == frame:
+            return index
+        return None
+
+    def get_sensor(self, sensor_id, index, copy=False):
+        """
+        Return the (frame, data) tuple of one sensor, in the sensor_interface format
+        """
+        sensor = self.sensors[sensor_id]
+        frame = int(self._frames[sensor_id][index])
+        if sensor['kind'] == FrameKind.SPEED:
+            return (frame, {'speed': float(self._data[sensor_id][index, 0])})
+        if sensor['kind'] == FrameKind.LIDAR:
+            offsets = self._offsets[sensor_id]
+            data = self._data[sensor_id][offsets[index]:offsets[index + 1]]
+        else:
+            data = self._data[sensor_id][index]
+        if copy:
+            data = np.array(data)
+        return (frame, data)
+
+    def get_frame(self, index, copy=False):
+        """
+        Return the input_data dict of one frame as given by sensor_interface.get_data()
+        """
+        return {sensor_id: self.get_sensor(sensor_id, index, copy) for sensor_id in self.sensors}
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+
+"""
+Content-addressed cache of finished runs. A run of the RAI matrix only depends on
+the agent (code and weights), the route, the RAI case and variant, the weather,
+the seeds, the robustness config and the leaderboard code, so its route record is
+stored under a hash of all of them and reused by later evaluations instead of
+running the simulation again. Entries are JSON files, evicted least recently used
+first once the cache goes over its size or entry limits.
+"""
+import hashlib
+import json
+import logging
+import os
+import site
+import sys
+
+from rai.utils.utility import get_cache_dir
+
+RESULT_CACHE_VERSION = 2
+
+# Code and model files of the agent directory, hashed with the agent
+AGENT_FILE_EXTENSIONS = ('.py', '.pt', '.pth', '.ckpt', '.onnx', '.h5', '.pb', '.tflite', '.engine', '.pkl',
+                         '.npy', '.npz', '.bin', '.safetensors', '.json', '.yaml', '.yml', '.txt', '.cfg', '.ini')
+
+# (path, size, mtime) -> sha1 of a file
+_file_hashes = {}
+
+def _hash_file(path):
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime)
+    if key not in _file_hashes:
+        sha1 = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                sha1.update(chunk)
+        _file_hashes[key] = sha1.hexdigest()
+    return _file_hashes[key]
+
+def file_fingerprint(path, extensions=None):
+    """
+    Hash of the contents of a file, or of all the files of a directory (with
+    one of the extensions, if given). None for paths that don't exist
+    """
+    if not path or not os.path.exists(path):
+        return None
+    if os.path.isfile(path):
+        return _hash_file(path)
+
+    sha1 = hashlib.sha1()
+    for root, dirs, files in os.walk(path):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.') and d != '__pycache__')
+        for name in sorted(files):
+            if extensions is not None and not name.endswith(extensions):
+                continue
+            file_path = os.path.join(root, name)
+            sha1.update(os.path.relpath(file_path, path).encode('utf-8'))
+            sha1.update(_hash_file(file_path).encode('utf-8'))
+    return sha1.hexdigest()
+
+def _python_prefixes():
+    prefixes = {sys.prefix, sys.base_prefix, sys.exec_prefix}
+    prefixes.update(site.getsitepackages() if hasattr(site, 'getsitepackages') else [])
+    prefixes.add(site.getusersitepackages())
+    return tuple(os.path.abspath(prefix) + os.sep for prefix in prefixes if prefix)
+
+def agent_fingerprint(agent, agent_config):
+    """
+    Hash of the code and models of an agent: the code and model files of the directory
+    of its entry file, its config (a file or a directory of weights) and the modules
+    loaded from outside the Python installation, e.g. an agent package imported by the entry file
+    """
+    prefixes = _python_prefixes()
+    modules = set()
+    for module in list(sys.modules.values()):
+        path = getattr(module, '__file__', None)
+        if path and path.endswith('.py') and os.path.isfile(path):
+            path = os.path.abspath(path)
+            if not path.startswith(prefixes):
+                modules.add(path)
+
+    sha1 = hashlib.sha1()
+    for part in [file_fingerprint(os.path.dirname(os.path.abspath(agent)), AGENT_FILE_EXTENSIONS),
+                 file_fingerprint(agent), file_fingerprint(agent_config)]:
+        sha1.update(str(part).encode('utf-8'))
+    for path in sorted(modules):
+        sha1.update(path.encode('utf-8'))
+        sha1.update(_hash_file(path).encode('utf-8'))
+    return sha1.hexdigest()
+
+
+class ResultCache:
+    """
+    Route records of finished runs, keyed by the fingerprint of the run
+    """
+    def __init__(self, cache_dir=None, max_mb=512, max_entries=20000):
+        self.cache_dir = cache_dir or get_cache_dir('results')
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(fingerprint):
+        description = json.dumps([RESULT_CACHE_VERSION, fingerprint], sort_keys=True, default=str)
+        return hashlib.sha256(description.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + '.json')
+
+    def get(self, key):
+        """
+        Cached route record of a run as a dict, None if the run is not cached
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'r') as f:
+                record = json.load(f)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except ValueError as e:
+            logging.warning('Ignoring corrupted cached result %s: %s', path, e)
+            self.misses += 1
+            return None
+        # The modification time orders the entries for the eviction
+        os.utime(path)
+        self.hits += 1
+        return record
+
+    def put(self, key, record):
+        path = self._path(key)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(record, f)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache is within its limits
+        """
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total_bytes = sum(size for _, size, _ in entries)
+        entries.sort()
+        while entries and (total_bytes > self.max_bytes or len(entries) > self.max_entries):
+            _, size, path = entries.pop(0)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+
+"""
+Local SQLite database of RAI leaderboard checkpoints, for leaderboard queries
+across submissions without re-parsing every simulation_results.json.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from dictor import dictor
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS submissions (
+    id INTEGER PRIMARY KEY,
+    agent TEXT NOT NULL,
+    checkpoint TEXT NOT NULL UNIQUE,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    entry_status TEXT,
+    eligible INTEGER,
+    provisional INTEGER,
+    ingested_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS records (
+    submission_id INTEGER NOT NULL REFERENCES submissions(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    route_id TEXT,
+    route TEXT,
+    route_type TEXT,
+    sensor TEXT,
+    status TEXT,
+    score_composed REAL,
+    score_route REAL,
+    score_penalty REAL,
+    duration_game REAL,
+    duration_system REAL,
+    route_length REAL,
+    emission_per_sec REAL,
+    emission_per_route REAL,
+    n_infractions INTEGER,
+    infractions TEXT
+);
+CREATE TABLE IF NOT EXISTS global_scores (
+    submission_id INTEGER NOT NULL REFERENCES submissions(id) ON DELETE CASCADE,
+    key TEXT NOT NULL,
+    value REAL
+);
+CREATE TABLE IF NOT EXISTS labels (
+    submission_id INTEGER NOT NULL REFERENCES submissions(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    label TEXT,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS sensors (
+    submission_id INTEGER NOT NULL REFERENCES submissions(id) ON DELETE CASCADE,
+    sensor TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_submissions_agent ON submissions(agent);
+CREATE INDEX IF NOT EXISTS idx_records_submission ON records(submission_id);
+CREATE INDEX IF NOT EXISTS idx_records_route ON records(route);
+CREATE INDEX IF NOT EXISTS idx_records_route_type ON records(route_type);
+CREATE INDEX IF NOT EXISTS idx_records_sensor ON records(sensor);
+CREATE INDEX IF NOT EXISTS idx_global_scores_key ON global_scores(key, submission_id);
+CREATE INDEX IF NOT EXISTS idx_labels_submission ON labels(submission_id);
+CREATE INDEX IF NOT EXISTS idx_sensors_sensor ON sensors(sensor);
+"""
+
+# Name of the checkpoints written by main.py, without its extension
+DEFAULT_CHECKPOINT_NAME = 'simulation_results'
+
+# Latest ingested submission of every agent
+LATEST_SUBMISSIONS = """
+SELECT s.* FROM submissions s
+WHERE s.ingested_at = (SELECT MAX(ingested_at) FROM submissions WHERE agent = s.agent)
+"""
+
+
+def file_sha256(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def agent_name(checkpoint):
+    """
+    Agent of a checkpoint: its file name, or its directory for checkpoints with the
+    default simulation_results.json name, as every submission has one
+    """
+    name = os.path.splitext(os.path.basename(checkpoint))[0]
+    if name == DEFAULT_CHECKPOINT_NAME:
+        name = os.path.basename(os.path.dirname(os.path.abspath(checkpoint))) or name
+    return name
+
+
+def find_checkpoints(paths):
+    """
+    Expand directories into the json files they contain, in a deterministic order
+    """
+    checkpoints = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                checkpoints.extend(os.path.join(root, name) for name in sorted(files) if name.endswith('.json'))
+        else:
+            checkpoints.append(path)
+    return checkpoints
+
+
+class RAIResultsDatabase:
+    """
+    Ingest checkpoints into SQLite and answer the leaderboard queries
+    """
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('PRAGMA foreign_keys = ON')
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def ingest(self, checkpoint, agent=None):
+        """
+        Load one checkpoint. Unchanged files are skipped and changed files replace
+        their previous rows, so ingesting is idempotent. Returns True if rows were written
+        """
+        checkpoint = os.path.abspath(checkpoint)
+        if agent is None:
+            agent = agent_name(checkpoint)
+        stat = os.stat(checkpoint)
+
+        row = self.connection.execute('SELECT id, mtime, size, sha256, agent FROM submissions WHERE checkpoint = ?',
+                                      (checkpoint,)).fetchone()
+        if row and row[1] == stat.st_mtime and row[2] == stat.st_size and row[4] == agent:
+            return False
+        sha256 = file_sha256(checkpoint)
+        if row and row[3] == sha256:
+            with self.connection:
+                self.connection.execute('UPDATE submissions SET mtime = ?, agent = ? WHERE id = ?',
+                                        (stat.st_mtime, agent, row[0]))
+            return False
+
+        with open(checkpoint, 'r') as f:
+            data = json.load(f)
+        if '_checkpoint' not in data:
+            raise ValueError(f"'{checkpoint}' is not a leaderboard checkpoint")
+        # Checkpoints of unfinished evaluations only have a provisional global record
+        provisional = dictor(data, '_checkpoint.global_record.meta.provisional')
+
+        with self.connection:
+            if row:
+                self.connection.execute('DELETE FROM submissions WHERE id = ?', (row[0],))
+            submission_id = self.connection.execute(
+                'INSERT INTO submissions (agent, checkpoint, mtime, size, sha256, entry_status, eligible, provisional, '
+                'ingested_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (agent, checkpoint, stat.st_mtime, stat.st_size, sha256, data.get('entry_status'),
+                 int(bool(data.get('eligible'))), int(bool(provisional)), time.time())).lastrowid
+            self._insert_checkpoint(submission_id, data)
+        return True
+
+    def _insert_checkpoint(self, submission_id, data):
+        records = []
+        for position, record in enumerate(data['_checkpoint'].get('records', [])):
+            rai_scores = record.get('rai_scores', {})
+            route_type = next((key for key in rai_scores if 'emission' not in key), None)
+            meta = record.get('meta', {})
+            scores = record.get('scores', {})
+            # Records with capped messages have their totals in infraction_counts
+            infractions = {key: len(value) if isinstance(value, list) else value
+                           for key, value in record.get('infractions', {}).items()}
+            infractions.update(record.get('infraction_counts', {}))
+            records.append((submission_id, position, str(record.get('route_id')), meta.get('route_name'), route_type,
+                            meta.get('variant'), record.get('status'), scores.get('score_composed'),
+                            scores.get('score_route'), scores.get('score_penalty'), meta.get('duration_game'),
+                            meta.get('duration_system'), meta.get('route_length'), rai_scores.get('emission_per_sec'),
+                            rai_scores.get('emission_per_route'), sum(infractions.values()), json.dumps(infractions)))
+        self.connection.executemany('INSERT INTO records VALUES ({})'.format(', '.join(['?'] * 17)), records)
+
+        global_record = data['_checkpoint'].get('global_record') or {}
+        global_scores = dict(global_record.get('scores', {}))
+        global_scores.update(global_record.get('rai_scores', {}))
+        self.connection.executemany('INSERT INTO global_scores VALUES (?, ?, ?)',
+                                    [(submission_id, key, value) for key, value in global_scores.items()])
+
+        self.connection.executemany('INSERT INTO labels VALUES (?, ?, ?, ?)',
+                                    [(submission_id, position, label, value) for position, (label, value)
+                                     in enumerate(zip(data.get('labels', []), data.get('values', [])))])
+        sensors = data.get('sensors', [])
+        if isinstance(sensors, dict):
+            sensors = list(sensors.keys())
+        self.connection.executemany('INSERT INTO sensors VALUES (?, ?)',
+                                    [(submission_id, str(sensor)) for sensor in sensors])
+
+    def rankings(self, key='rai_avg_score_composed', limit=None):
+        """
+        Agents ranked by a global score of their latest submission
+        """
+        query = ('SELECT s.agent, g.value, s.entry_status, s.checkpoint FROM ({}) s '
+                 'JOIN global_scores g ON g.submission_id = s.id AND g.key = ? '
+                 'ORDER BY g.value DESC').format(LATEST_SUBMISSIONS)
+        if limit:
+            query += ' LIMIT {:d}'.format(limit)
+        return self.connection.execute(query, (key,)).fetchall()
+
+    def case_breakdown(self, agent=None):
+        """
+        Per-case robustness ratios (REGULAR_* global scores) of the latest submissions
+        """
+        query = ('SELECT s.agent, g.key, g.value FROM ({}) s '
+                 'JOIN global_scores g ON g.submission_id = s.id '
+                 "WHERE g.key LIKE 'REGULAR%'").format(LATEST_SUBMISSIONS)
+        params = ()
+        if agent:
+            query += ' AND s.agent = ?'
+            params = (agent,)
+        return self.connection.execute(query + ' ORDER BY s.agent, g.key', params).fetchall()
+
+    def emissions(self):
+        """
+        Average emissions of the latest submissions, lowest first
+        """
+        query = ('SELECT s.agent, '
+                 "MAX(CASE WHEN g.key = 'rai_avg_emission_per_sec' THEN g.value END) AS per_sec, "
+                 "MAX(CASE WHEN g.key = 'rai_avg_emission_per_route' THEN g.value END) AS per_route "
+                 'FROM ({}) s JOIN global_scores g ON g.submission_id = s.id '
+                 'GROUP BY s.agent ORDER BY per_sec').format(LATEST_SUBMISSIONS)
+        return self.connection.execute(query).fetchall()
@@ -6,12 +6,150 @@
 """
 Module used to parse all the route and scenario configuration parameters.
 """
-import xml.etree.ElementTree as ET
+import hashlib
+import json
+import mmap
+import os
+import re
 
-import carla
 from leaderboard.utils.route_parser import RouteParser
 
-from rai.scenarioconfigs.route_scenario_configuration import ExtRouteScenarioConfiguration
+from rai.scenarioconfigs.route_scenario_configuration import ExtRouteScenarioConfiguration, RouteSource
+from rai.utils.utility import get_cache_dir
+
+ROUTE_INDEX_VERSION = 2
+# Comments and CDATA sections are matched first, so the route tags inside them are skipped
+ROUTE_TOKEN = re.compile(rb'''<!--.*?-->|<!\[CDATA\[.*?\]\]>|<route\b((?:[^>"']|"[^"]*"|'[^']*')*)>|</route\s*>''',
+                         re.DOTALL)
+ATTRIBUTE = re.compile(rb'''([\w:.-]+)\s*=\s*(?:"([^"]*)"|'([^']*)')''')
+ENTITY = re.compile(r'&(#x[0-9a-fA-F]+|#[0-9]+|lt|gt|amp|quot|apos);')
+XML_ENTITIES = {'lt': '<', 'gt': '>', 'amp': '&', 'quot': '"', 'apos': "'"}
+
+
+def _unescape(value):
+    """
+    Replace the character and predefined entity references of an XML attribute value
+    """
+    def replace(match):
+        entity = match.group(1)
+        if entity.startswith('#x'):
+            return chr(int(entity[2:], 16))
+        if entity.startswith('#'):
+            return chr(int(entity[1:]))
+        return XML_ENTITIES[entity]
+    return ENTITY.sub(replace, value)
+
+
+class RouteIndex:
+    """
+    Ordered index of the routes of a file: id, town and the byte range of every
+    route element. It is built with a single streaming scan of the file and cached
+    on disk, keyed by the file path, size and mtime
+    """
+    def __init__(self, filename, routes):
+        self.filename = filename
+        # [id, town, start, end] in file order
+        self.routes = routes
+        self.positions = {}
+        for position, route in enumerate(routes):
+            self.positions.setdefault(route[0], []).append(position)
+
+    @staticmethod
+    def _scan(filename):
+        routes = []
+        with open(filename, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return routes
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                route = None
+                for match in ROUTE_TOKEN.finditer(data):
+                    token = match.group(0)
+                    if token.startswith(b'<!'):
+                        continue
+                    if token.startswith(b'</'):
+                        if route is not None:
+                            route[3] = match.end()
+                            routes.append(route)
+                            route = None
+                        continue
+                    if route is not None:
+                        raise ValueError(f"Route '{route[0]}' is not closed in '{filename}'")
+
+                    attributes = {m.group(1).decode(): _unescape((m.group(2) if m.group(3) is None
+                                                                  else m.group(3)).decode())
+                                  for m in ATTRIBUTE.finditer(match.group(1))}
+                    route = [attributes['id'], attributes['town'], match.start(), match.end()]
+                    if match.group(1).rstrip().endswith(b'/'):
+                        routes.append(route)
+                        route = None
+                if route is not None:
+                    raise ValueError(f"Route '{route[0]}' is not closed in '{filename}'")
+        return routes
+
+    @classmethod
+    def load(cls, filename, use_cache=True):
+        filename = os.path.abspath(filename)
+        stat = os.stat(filename)
+        key = [ROUTE_INDEX_VERSION, filename, stat.st_size, stat.st_mtime]
+        cache_path = None
+        if use_cache:
+            cache_name = hashlib.sha1(filename.encode('utf-8')).hexdigest() + '.json'
+            cache_path = os.path.join(get_cache_dir('route_index'), cache_name)
+            if os.path.exists(cache_path):
+                try:
+                    with open(cache_path, 'r') as f:
+                        cached = json.load(f)
+                    if cached['key'] == key:
+                        return cls(filename, cached['routes'])
+                except (ValueError, KeyError):
+                    pass
+
+        index = cls(filename, cls._scan(filename))
+        if cache_path is not None:
+            tmp_path = cache_path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump({'key': key, 'routes': index.routes}, f)
+            os.replace(tmp_path, cache_path)
+        return index
+
+    def resolve_subset(self, routes_subset):
+        """
+        The route subset can be indicated by single routes separated by commas,
+        or group of routes separated by dashes (or a combination of the two).
+        Returns the selected positions in file order
+        """
+        selected_ids = set()
+
+        def select(position):
+            route_id = self.routes[position][0]
+            if route_id in selected_ids:
+                raise ValueError(f"Found a repeated route with id '{route_id}'")
+            selected_ids.add(route_id)
+
+        for group in routes_subset.replace(" ","").split(','):
+            if "-" in group:
+                # Group of route, select from start to end, making sure both ids exist
+                start, end = group.split('-')
+                start_positions = self.positions.get(start, [])
+                end_positions = self.positions.get(end, [])
+                if end_positions and (not start_positions or end_positions[0] <= start_positions[0]):
+                    raise ValueError(f"Malformed route subset '{group}', found the end id before the starting one")
+                if not start_positions:
+                    raise ValueError(f"Couldn\'t find the route with id '{start}' inside the given routes file")
+                if not end_positions:
+                    raise ValueError(f"Couldn\'t find the route with id '{end}' inside the given routes file")
+
+                for position in range(start_positions[0], end_positions[0] + 1):
+                    select(position)
+
+            else:
+                # Just one route, making sure it exists
+                if group not in self.positions:
+                    raise ValueError(f"Couldn't find the route with id '{group}' inside the given routes file")
+                for position in self.positions[group]:
+                    select(position)
+
+        return [position for position, route in enumerate(self.routes) if route[0] in selected_ids]
 
 
 class RAIRouteParser(RouteParser):
@@ -26,81 +164,24 @@ class RAIRouteParser(RouteParser):
         Returns a list of route elements.
         :param route_filename: the path to a set of routes.
         :param routes_subset: If provided, these routes shall be returned
-        :return: List of dicts containing the waypoints, id and town of the routes
+        :return: List of configs with the id and town of the routes. Their waypoints
+                 and weather are only parsed when first used
         """
-        def get_routes_subset():
-            """
-            The route subset can be indicated by single routes separated by commas,
-            or group of routes separated by dashes (or a combination of the two)"""
-            subset_ids = []
-            subset_groups = routes_subset.replace(" ","").split(',')
-            for group in subset_groups:
-                if "-" in group:
-                    # Group of route, iterate from start to end, making sure both ids exist
-                    start, end = group.split('-')
-                    found_start, found_end = (False, False)
-
-                    for route in tree.iter("route"):
-                        route_id = route.attrib['id']
-                        if not found_start and route_id == end:
-                            raise ValueError(f"Malformed route subset '{group}', found the end id before the starting one")
-                        elif not found_start and route_id == start:
-                            found_start = True
-                        if not found_end and found_start:
-                            if route_id in subset_ids:
-                                raise ValueError(f"Found a repeated route with id '{route_id}'")
-                            else:
-                                subset_ids.append(route_id)
-                            if route_id == end:
-                                found_end = True
-
-                    if not found_start:
-                        raise ValueError(f"Couldn\'t find the route with id '{start}' inside the given routes file")
-                    if not found_end:
-                        raise ValueError(f"Couldn\'t find the route with id '{end}' inside the given routes file")
-
-                else:
-                    # Just one route, get its id while making sure it exists
-
-                    found = False
-                    for route in tree.iter("route"):
-                        route_id = route.attrib['id']
-                        if route_id == group:
-                            if route_id in subset_ids:
-                                raise ValueError(f"Found a repeated route with id '{route_id}'")
-                            else:
-                                subset_ids.append(route_id)
-                            found = True
-
-                    if not found:
-                        raise ValueError(f"Couldn't find the route with id '{group}' inside the given routes file")
-
-            subset_ids.sort()
-            return subset_ids
-
-        list_route_descriptions = []
-        tree = ET.parse(route_filename)
+        index = RouteIndex.load(route_filename)
         if routes_subset:
-            subset_list = get_routes_subset()
-        for route in tree.iter("route"):
+            positions = index.resolve_subset(routes_subset)
+        else:
+            positions = range(len(index.routes))
 
-            route_id = route.attrib['id']
-            if routes_subset and route_id not in subset_list:
-                continue
+        list_route_descriptions = []
+        for position in positions:
+            route_id, town, start, end = index.routes[position]
 
             new_config = ExtRouteScenarioConfiguration()
-            new_config.town = route.attrib['town']
+            new_config.town = town
             new_config.name = "RouteScenario_{}".format(route_id)
-            new_config.weather = RouteParser.parse_weather(route)
             new_config.scenario_file = scenario_file
-
-            waypoint_list = []  # the list of waypoints that can be found on this route
-            for waypoint in route.iter('waypoint'):
-                waypoint_list.append(carla.Location(x=float(waypoint.attrib['x']),
-                                                    y=float(waypoint.attrib['y']),
-                                                    z=float(waypoint.attrib['z'])))
-
-            new_config.trajectory = waypoint_list
+            new_config.route_source = RouteSource(index.filename, start, end)
 
             list_route_descriptions.append(new_config)
 
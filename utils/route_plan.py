@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+
+"""
+Cached route plans. Every RAI case runs the same routes, and planning one needs
+the global route planner to interpolate the trajectory, the scenario file to be
+parsed and the route to be scanned for scenarios. None of it depends on the case,
+so the interpolated route and the sampled scenario definitions are kept in memory
+and on disk per (town, trajectory, scenario file, seed), and only the actors are
+spawned again by each run.
+"""
+import copy
+import hashlib
+import json
+import logging
+import os
+
+import carla
+from agents.navigation.local_planner import RoadOption
+
+from leaderboard.utils.route_manipulation import interpolate_trajectory
+
+from rai.utils.scenario_index import ScenarioAnnotationIndex
+from rai.utils.utility import get_cache_dir
+
+ROUTE_PLAN_VERSION = 1
+
+# Seed of the scenario sampling, the one RouteScenario uses
+SCENARIO_SAMPLING_SEED = 0
+
+# key -> route plans of the routes planned by this process
+_route_plans = {}
+# (path, size, mtime) -> sha1 of a scenario file
+_file_hashes = {}
+
+def _file_hash(path):
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime)
+    if key not in _file_hashes:
+        with open(path, 'rb') as f:
+            _file_hashes[key] = hashlib.sha1(f.read()).hexdigest()
+    return _file_hashes[key]
+
+
+class RoutePlan:
+    """
+    Interpolated route, GPS route and sampled scenario definitions of a route
+    """
+    def __init__(self, route, gps_route, scenario_definitions):
+        # [(carla.Transform, RoadOption)]
+        self.route = route
+        # [({'lat', 'lon', 'z'}, RoadOption)]
+        self.gps_route = gps_route
+        self.scenario_definitions = scenario_definitions
+
+    @staticmethod
+    def key(town, trajectory, scenario_file, seed):
+        description = json.dumps([ROUTE_PLAN_VERSION, town,
+                                  [[location.x, location.y, location.z] for location in trajectory],
+                                  _file_hash(scenario_file), seed])
+        return hashlib.sha1(description.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r') as f:
+            data = json.load(f)
+        route = [(carla.Transform(carla.Location(x=x, y=y, z=z), carla.Rotation(pitch=pitch, yaw=yaw, roll=roll)),
+                  RoadOption(option))
+                 for x, y, z, pitch, yaw, roll, option in data['route']]
+        gps_route = [({'lat': lat, 'lon': lon, 'z': z}, RoadOption(option)) for lat, lon, z, option in data['gps_route']]
+        return cls(route, gps_route, data['scenario_definitions'])
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'route': [[transform.location.x, transform.location.y, transform.location.z,
+                                  transform.rotation.pitch, transform.rotation.yaw, transform.rotation.roll,
+                                  option.value] for transform, option in self.route],
+                       'gps_route': [[point['lat'], point['lon'], point['z'], option.value]
+                                     for point, option in self.gps_route],
+                       'scenario_definitions': self.scenario_definitions}, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def build(cls, world, config, sample_scenarios):
+        """
+        Plan a route as RouteScenario._update_route does, matching the scenario
+        annotations with their spatial index
+        """
+        gps_route, route = interpolate_trajectory(world, config.trajectory)
+        scenario_index = ScenarioAnnotationIndex.load(config.scenario_file)
+        potential_scenarios_definitions, _ = scenario_index.scan_route_for_scenarios(config.town, route)
+        return cls(route, gps_route, sample_scenarios(potential_scenarios_definitions, SCENARIO_SAMPLING_SEED))
+
+    def copy(self):
+        """
+        Copy of the plan for a run, as the scenarios may change their definitions
+        """
+        return RoutePlan(list(self.route), list(self.gps_route), copy.deepcopy(self.scenario_definitions))
+
+
+def get_route_plan(world, config, sample_scenarios, cache_dir=None, use_disk=True):
+    """
+    Return a copy of the route plan of a route config, planning and caching it if needed.
+    sample_scenarios is RouteScenario._scenario_sampling
+    """
+    key = RoutePlan.key(config.town, config.trajectory, config.scenario_file, SCENARIO_SAMPLING_SEED)
+    if key in _route_plans:
+        return _route_plans[key].copy()
+
+    path = None
+    if use_disk:
+        if cache_dir is None:
+            cache_dir = get_cache_dir('route_plans')
+        path = os.path.join(cache_dir, key + '.json')
+        if os.path.exists(path):
+            try:
+                _route_plans[key] = RoutePlan.load(path)
+                return _route_plans[key].copy()
+            except (ValueError, KeyError, TypeError) as e:
+                logging.warning('Ignoring corrupted route plan %s: %s', path, e)
+
+    plan = RoutePlan.build(world, config, sample_scenarios)
+    _route_plans[key] = plan
+    if path is not None:
+        try:
+            json.dumps(plan.scenario_definitions)
+        except TypeError as e:
+            # Scenario definitions that are not JSON serializable are only kept in memory
+            logging.warning('Route plan %s is only cached in memory: %s', key, e)
+        else:
+            plan.save(path)
+    return plan.copy()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+
+"""
+Spatial index of the scenario annotation file. RouteParser.scan_route_for_scenarios
+compares every trigger position of the file with every waypoint of the route. Here
+the file is parsed once, the triggers of every town are hashed into a grid of
+TRIGGER_THRESHOLD sized cells, and each route waypoint is only compared with the
+triggers of its own and neighbouring cells. The scenarios found, their order and
+their trigger ids are the same as with RouteParser.
+"""
+import copy
+import math
+import os
+
+from leaderboard.utils.route_parser import RouteParser, TRIGGER_THRESHOLD, TRIGGER_ANGLE_THRESHOLD
+
+# (path, size, mtime) -> index of an annotation file
+_scenario_indexes = {}
+
+def match_waypoint(waypoint, transform):
+    """
+    Same test as RouteParser.match_world_location_to_route
+    """
+    dx = waypoint['x'] - transform.location.x
+    dy = waypoint['y'] - transform.location.y
+    dz = waypoint['z'] - transform.location.z
+    dpos = math.sqrt(dx * dx + dy * dy + dz * dz)
+
+    dyaw = (waypoint['yaw'] - transform.rotation.yaw) % 360
+
+    return dpos < TRIGGER_THRESHOLD \
+        and (dyaw < TRIGGER_ANGLE_THRESHOLD or dyaw > (360 - TRIGGER_ANGLE_THRESHOLD))
+
+
+class ScenarioAnnotationIndex:
+    """
+    Triggers of the scenario annotations, hashed per town into a grid of cells
+    """
+    def __init__(self, world_annotations, cell_size=TRIGGER_THRESHOLD):
+        self.cell_size = cell_size
+        # town -> [(scenario name, event)] in file order
+        self.events = {}
+        # town -> (cell x, cell y) -> [event index]
+        self.grids = {}
+        for town, scenarios in world_annotations.items():
+            events = []
+            for scenario in scenarios:
+                if "scenario_type" not in scenario:
+                    break
+                for event in scenario["available_event_configurations"]:
+                    RouteParser.convert_waypoint_float(event['transform'])
+                    events.append((scenario["scenario_type"], event))
+
+            grid = {}
+            for event_index, (_, event) in enumerate(events):
+                waypoint = event['transform']
+                grid.setdefault(self._cell(waypoint['x'], waypoint['y']), []).append(event_index)
+            self.events[town] = events
+            self.grids[town] = grid
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Index of an annotation file, only parsed again when the file changes
+        """
+        stat = os.stat(filename)
+        key = (os.path.abspath(filename), stat.st_size, stat.st_mtime)
+        if key not in _scenario_indexes:
+            _scenario_indexes[key] = cls(RouteParser.parse_annotations_file(filename))
+        return _scenario_indexes[key]
+
+    def _cell(self, x, y):
+        return int(math.floor(x / self.cell_size)), int(math.floor(y / self.cell_size))
+
+    def match_positions(self, town, trajectory):
+        """
+        Position of the first route waypoint matching each trigger of a town, None if there is none
+        """
+        events = self.events.get(town, [])
+        grid = self.grids.get(town, {})
+        positions = [None] * len(events)
+        for position, (transform, _) in enumerate(trajectory):
+            cell_x, cell_y = self._cell(transform.location.x, transform.location.y)
+            for neighbour_x in (cell_x - 1, cell_x, cell_x + 1):
+                for neighbour_y in (cell_y - 1, cell_y, cell_y + 1):
+                    for event_index in grid.get((neighbour_x, neighbour_y), ()):
+                        if positions[event_index] is None and \
+                                match_waypoint(events[event_index][1]['transform'], transform):
+                            positions[event_index] = position
+        return positions
+
+    def scan_route_for_scenarios(self, town, trajectory):
+        """
+        Same result as RouteParser.scan_route_for_scenarios: the possible scenarios
+        of the route per trigger id, and the position of every trigger id
+        """
+        existent_triggers = {}
+        possible_scenarios = {}
+        latest_trigger_id = 0
+
+        events = self.events.get(town, [])
+        for (scenario_name, event), match_position in zip(events, self.match_positions(town, trajectory)):
+            if match_position is None:
+                continue
+            scenario_subtype = RouteParser.get_scenario_type(scenario_name, match_position, trajectory)
+            if scenario_subtype is None:
+                continue
+            # The events are shared by all the routes, so each route gets copies
+            waypoint = dict(event['transform'])
+            scenario_description = {
+                'name': scenario_name,
+                'other_actors': copy.deepcopy(event['other_actors']) if 'other_actors' in event else None,
+                'trigger_position': waypoint,
+                'scenario_type': scenario_subtype,
+            }
+
+            trigger_id = RouteParser.check_trigger_position(waypoint, existent_triggers)
+            if trigger_id is None:
+                existent_triggers[latest_trigger_id] = waypoint
+                possible_scenarios[latest_trigger_id] = []
+                trigger_id = latest_trigger_id
+                latest_trigger_id += 1
+
+            possible_scenarios[trigger_id].append(scenario_description)
+
+        return possible_scenarios, existent_triggers
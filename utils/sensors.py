@@ -5,4 +5,36 @@ class RAISensors:
     LIDAR = '_LID'
     IMU = '_IMU'
     GNSS = '_GNSS'
-    SPEEDOMETER = '_SPEED'
\ No newline at end of file
+    SPEEDOMETER = '_SPEED'
+
+# Map CARLA sensor types to the RAI sensor type names
+SENSOR_TYPES = {
+    'sensor.camera.rgb': 'camera',
+    'sensor.lidar.ray_cast': 'lidar',
+    'sensor.other.gnss': 'gnss',
+    'sensor.other.imu': 'imu',
+    'sensor.speedometer': 'speedometer',
+}
+
+def sensor_ids(sensor_to_noise):
+    """
+    Ids of the sensors perturbed by a run, given one sensor or a group of them
+    """
+    if sensor_to_noise is None:
+        return []
+    if isinstance(sensor_to_noise, list):
+        return [sensor['id'] for sensor in sensor_to_noise]
+    return [sensor_to_noise['id']]
+
+def organise_sensors(sensors, sensor_types=None):
+    """
+    Collect meta sensors info to inform perturbation process
+    """
+    if sensor_types is None:
+        sensor_types = {}
+    for sensor in sensors:
+        sensor_type = SENSOR_TYPES.get(sensor['type'])
+        if sensor_type is None:
+            continue
+        sensor_types.setdefault(sensor_type, []).append({'type': sensor_type, 'id': sensor['id']})
+    return sensor_types
@@ -0,0 +1,285 @@
+#!/usr/bin/env python
+
+"""
+Precomputed distribution shift actors. Building a plan needs one navigation
+query per walker spawn point and destination, applying it only needs the
+batched spawn commands, and plans are cached on disk per (town, seed, actors).
+"""
+import hashlib
+import json
+import logging
+import os
+import random
+
+import carla
+
+from rai.utils.utility import Actors, get_actor_blueprints, get_cache_dir
+
+SHIFT_PLAN_VERSION = 1
+
+def _location_to_list(location):
+    return [location.x, location.y, location.z]
+
+def _transform_to_list(transform):
+    return [transform.location.x, transform.location.y, transform.location.z,
+            transform.rotation.pitch, transform.rotation.yaw, transform.rotation.roll]
+
+def _list_to_transform(values):
+    return carla.Transform(carla.Location(x=values[0], y=values[1], z=values[2]),
+                           carla.Rotation(pitch=values[3], yaw=values[4], roll=values[5]))
+
+
+class ShiftPlan:
+    """
+    Spawn locations, destinations, blueprints and speeds of the actors used to
+    shift the environment
+    """
+    def __init__(self, town, seed, actors_dict):
+        self.town = town
+        self.seed = seed
+        self.actors_dict = actors_dict
+        # [blueprint id, {attribute: value}, transform]
+        self.vehicles = []
+        # [blueprint id, {attribute: value}, location, destination, max speed]
+        self.walkers = []
+        self.cross_factor = 0
+
+    @staticmethod
+    def key(town, seed, actors_dict):
+        description = json.dumps([SHIFT_PLAN_VERSION, town, str(seed), actors_dict], sort_keys=True)
+        return hashlib.sha1(description.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r') as f:
+            data = json.load(f)
+        plan = cls(data['town'], data['seed'], data['actors_dict'])
+        plan.vehicles = data['vehicles']
+        plan.walkers = data['walkers']
+        plan.cross_factor = data['cross_factor']
+        return plan
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'town': self.town, 'seed': self.seed, 'actors_dict': self.actors_dict,
+                       'vehicles': self.vehicles, 'walkers': self.walkers,
+                       'cross_factor': self.cross_factor}, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def build(cls, world, _map, seed, actors_dict):
+        """
+        Draw all the random choices of the plan with a generator of its own, so
+        the plan only depends on (town, seed, actors)
+        """
+        plan = cls(_map.name, seed, actors_dict)
+        rng = random.Random(seed)
+
+        if Actors.vehicle in actors_dict:
+            v_filter, v_generation, n_vehicles = actors_dict[Actors.vehicle]
+            blueprints = get_actor_blueprints(world, v_filter, v_generation)
+            blueprints = [x for x in blueprints if x.get_attribute('base_type') == 'car']
+            blueprints = sorted(blueprints, key=lambda bp: bp.id)
+
+            spawn_points = _map.get_spawn_points()
+            number_of_spawn_points = len(spawn_points)
+            if n_vehicles < number_of_spawn_points:
+                rng.shuffle(spawn_points)
+            elif n_vehicles > number_of_spawn_points:
+                msg = 'requested %d vehicles, but could only find %d spawn points'
+                logging.warning(msg, n_vehicles, number_of_spawn_points)
+                n_vehicles = number_of_spawn_points
+
+            for transform in spawn_points[:n_vehicles]:
+                blueprint = rng.choice(blueprints)
+                attributes = {'role_name': 'autopilot'}
+                if blueprint.has_attribute('color'):
+                    attributes['color'] = rng.choice(blueprint.get_attribute('color').recommended_values)
+                if blueprint.has_attribute('driver_id'):
+                    attributes['driver_id'] = rng.choice(blueprint.get_attribute('driver_id').recommended_values)
+                plan.vehicles.append([blueprint.id, attributes, _transform_to_list(transform)])
+
+        if Actors.walkers in actors_dict:
+            w_filter, w_generation, n_walkers = actors_dict[Actors.walkers]
+            blueprints_walkers = get_actor_blueprints(world, w_filter, w_generation)
+            n_running = n_walkers      # how many pedestrians will run
+            plan.cross_factor = int(n_walkers/2.0)     # how many pedestrians will walk through the road
+
+            for _ in range(n_walkers):
+                location = world.get_random_location_from_navigation()
+                if location is None:
+                    continue
+                destination = world.get_random_location_from_navigation()
+                walker_bp = rng.choice(blueprints_walkers)
+                attributes = {}
+                # set as not invincible
+                if walker_bp.has_attribute('is_invincible'):
+                    attributes['is_invincible'] = 'false'
+                # set the max speed
+                if walker_bp.has_attribute('speed'):
+                    if n_running > 0:
+                        # running
+                        speed = walker_bp.get_attribute('speed').recommended_values[2]
+                        n_running -= 1
+                    else:
+                        # walking
+                        speed = walker_bp.get_attribute('speed').recommended_values[1]
+                else:
+                    speed = 0.0
+                plan.walkers.append([walker_bp.id, attributes, _location_to_list(location),
+                                     _location_to_list(destination) if destination is not None else None,
+                                     float(speed)])
+
+        return plan
+
+    def apply(self, world, client, traffic_manager, handle):
+        """
+        Spawn the planned actors with as few round trips as possible: one batch for
+        the vehicles (with their autopilot), one for the walkers and one for their
+        controllers. The ids are added to the handle as soon as they exist
+        """
+        SpawnActor = carla.command.SpawnActor
+        SetAutopilot = carla.command.SetAutopilot
+        FutureActor = carla.command.FutureActor
+
+        blueprint_library = world.get_blueprint_library()
+        blueprints = {}
+
+        def get_blueprint(blueprint_id, attributes):
+            if blueprint_id not in blueprints:
+                blueprints[blueprint_id] = blueprint_library.find(blueprint_id)
+            blueprint = blueprints[blueprint_id]
+            for name, value in attributes.items():
+                blueprint.set_attribute(name, value)
+            return blueprint
+
+        if self.vehicles:
+            batch = [SpawnActor(get_blueprint(blueprint_id, attributes), _list_to_transform(transform))
+                     .then(SetAutopilot(FutureActor, True, traffic_manager.get_port()))
+                     for blueprint_id, attributes, transform in self.vehicles]
+            for response in client.apply_batch_sync(batch, False):
+                if response.error:
+                    logging.error(response.error)
+                else:
+                    handle.vehicles.append(response.actor_id)
+
+            for actor in world.get_actors(handle.vehicles):
+                traffic_manager.update_vehicle_lights(actor, True)
+            print('spawned %d vehicles' % (len(handle.vehicles)))
+
+        if self.walkers:
+            batch = [SpawnActor(get_blueprint(blueprint_id, attributes), carla.Transform(carla.Location(*location)))
+                     for blueprint_id, attributes, location, _, _ in self.walkers]
+            spawned = []
+            for walker, response in zip(self.walkers, client.apply_batch_sync(batch, True)):
+                if response.error:
+                    logging.error(response.error)
+                else:
+                    handle.walkers.append(response.actor_id)
+                    spawned.append((response.actor_id, walker))
+
+            walker_controller_bp = blueprint_library.find('controller.ai.walker')
+            batch = [SpawnActor(walker_controller_bp, carla.Transform(), walker_id) for walker_id, _ in spawned]
+            started = []
+            for (_, walker), response in zip(spawned, client.apply_batch_sync(batch, True)):
+                if response.error:
+                    logging.error(response.error)
+                else:
+                    handle.controllers.append(response.actor_id)
+                    started.append(walker)
+
+            # wait for a tick to ensure client receives the last transform of the walkers we have just created
+            world.tick()
+
+            # initialize each controller and set the planned target to walk to
+            world.set_pedestrians_cross_factor(self.cross_factor)
+            controllers = {actor.id: actor for actor in world.get_actors(handle.controllers)}
+            for controller_id, walker in zip(handle.controllers, started):
+                controller = controllers[controller_id]
+                controller.start()
+                if walker[3] is not None:
+                    controller.go_to_location(carla.Location(*walker[3]))
+                controller.set_max_speed(walker[4])
+            print('spawned %d walkers' % (len(handle.walkers)))
+
+        return handle
+
+
+class ShiftActorsHandle:
+    """
+    Ids of the actors spawned to shift the environment, so they can be
+    destroyed at the end of the SHIFT run
+    """
+    def __init__(self):
+        self.vehicles = []
+        self.walkers = []
+        self.controllers = []
+
+    def __len__(self):
+        return len(self.vehicles) + len(self.walkers) + len(self.controllers)
+
+    def destroy(self, client, world):
+        """
+        Stop the walker controllers and destroy all the actors with a single batch
+        """
+        if not len(self):
+            return
+        for controller in world.get_actors(self.controllers):
+            controller.stop()
+
+        batch = [carla.command.DestroyActor(actor_id)
+                 for actor_id in self.controllers + self.walkers + self.vehicles]
+        for response in client.apply_batch_sync(batch, False):
+            if response.error:
+                logging.error(response.error)
+        print('destroyed %d distribution shift actors' % (len(batch)))
+
+        self.vehicles = []
+        self.walkers = []
+        self.controllers = []
+
+
+def get_shift_plan(world, _map, seed, actors_dict, cache_dir=None):
+    """
+    Return the shift plan of (town, seed, actors), building and caching it on disk if needed
+    """
+    if cache_dir is None:
+        cache_dir = get_cache_dir('shift_plans')
+    key = ShiftPlan.key(_map.name, seed, actors_dict)
+    path = os.path.join(cache_dir, key + '.json')
+    if os.path.exists(path):
+        try:
+            return ShiftPlan.load(path)
+        except (ValueError, KeyError) as e:
+            logging.warning('Ignoring corrupted shift plan %s: %s', path, e)
+
+    plan = ShiftPlan.build(world, _map, seed, actors_dict)
+    plan.save(path)
+    return plan
+
+
+def shift_environment(world, _map, client, traffic_manager, args, actors_dict={Actors.walkers : ['walker', 'all', 200]}):
+    """
+    Introduce a distribution shift in the environment. Returns a ShiftActorsHandle
+    with all the spawned actors
+    """
+    handle = ShiftActorsHandle()
+    if _map == None:
+        _map = world.get_map()
+
+    # Kept for the rest of the run, the plan itself uses its own generator
+    random.seed(args.carlaProviderSeed)
+
+    try:
+        plan = get_shift_plan(world, _map, int(args.carlaProviderSeed), actors_dict, args.shift_cache or None)
+        plan.apply(world, client, traffic_manager, handle)
+
+        # Example of how to use Traffic Manager parameters
+        traffic_manager.global_percentage_speed_difference(30.0)
+
+    except Exception:
+        print('Error while setting up actors')
+
+    return handle
@@ -1,4 +1,7 @@
-import copy
+import os
+import sys
+
+import numpy as np
 from dictor import dictor
 
 from srunner.scenariomanager.traffic_events import TrafficEventType
@@ -11,17 +14,115 @@ from leaderboard.utils.checkpoint_tools import fetch_dict, save_dict, create_def
 
 from rai.core.variations import RAIVariation, RAI_CASES
 from rai.utils.sensors import RAISensors
+from rai.utils.statistics_table import EARLY_STOP_STATUS, RAIOnlineAggregator, RAIRecordTable, first_appearance, \
+    record_case
+from rai_metric.latency import LatencyHistogram
 
 
-class RAIRouteRecord(RouteRecord):
-    def __init__(self):
-        super().__init__()
+# Keys of the infractions, in the order of the leaderboard route records
+INFRACTION_KEYS = tuple(RouteRecord().infractions.keys())
+# Messages kept per infraction type of a record, the others are only counted
+INFRACTION_SAMPLES = 10
+
+
+class InfractionLog:
+    """
+    Number of infractions of one type, with the messages of the first few as
+    samples. Messages are interned, as the same texts repeat across runs
+    """
+    __slots__ = ('count', 'samples', 'max_samples')
+
+    def __init__(self, max_samples=INFRACTION_SAMPLES):
+        self.count = 0
+        self.samples = []
+        self.max_samples = max_samples
+
+    @classmethod
+    def from_samples(cls, samples, count=None, max_samples=INFRACTION_SAMPLES):
+        log = cls(max_samples)
+        for message in samples:
+            log.append(message)
+        if count is not None:
+            log.count = count
+        return log
+
+    def append(self, message):
+        self.count += 1
+        if len(self.samples) < self.max_samples:
+            self.samples.append(sys.intern(message) if isinstance(message, str) else message)
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        return iter(self.samples)
+
+    def __repr__(self):
+        return 'InfractionLog(count={}, samples={!r})'.format(self.count, self.samples)
+
+
+class RAIRouteRecord:
+    """
+    Route record of the RAI leaderboard. Same fields as the leaderboard RouteRecord,
+    plus the RAI scores, with slots and capped infraction messages to bound the
+    memory of long evaluations
+    """
+    __slots__ = ('route_id', 'index', 'status', 'infractions', 'scores', 'meta', 'rai_scores')
+
+    def __init__(self, max_infraction_samples=INFRACTION_SAMPLES):
+        self.route_id = None
+        self.index = None
+        self.status = 'Started'
+        self.infractions = {key: InfractionLog(max_infraction_samples) for key in INFRACTION_KEYS}
+        self.scores = {
+            'score_route': 0,
+            'score_penalty': 0,
+            'score_composed': 0
+        }
+        self.meta = {}
         self.rai_scores = {}
 
-def to_route_record(record_dict):
-    record = RAIRouteRecord()
+    def to_dict(self):
+        """
+        Checkpoint entry of the record. The infractions keep the sampled messages
+        and their total numbers are saved in infraction_counts
+        """
+        infractions = {}
+        infraction_counts = {}
+        for key, value in self.infractions.items():
+            if isinstance(value, InfractionLog):
+                infractions[key] = list(value.samples)
+                infraction_counts[key] = value.count
+            else:
+                infractions[key] = value
+
+        record_dict = {
+            'route_id': self.route_id,
+            'index': self.index,
+            'status': self.status,
+            'infractions': infractions,
+            'scores': self.scores,
+            'meta': self.meta,
+            'rai_scores': self.rai_scores
+        }
+        if infraction_counts:
+            record_dict['infraction_counts'] = infraction_counts
+        return record_dict
+
+def to_route_record(record_dict, max_infraction_samples=INFRACTION_SAMPLES):
+    """
+    Route record of a checkpoint entry. Older checkpoints have all the messages
+    and no infraction_counts
+    """
+    record = RAIRouteRecord(max_infraction_samples)
+    infraction_counts = record_dict.get('infraction_counts', {})
     for key, value in record_dict.items():
-        setattr(record, key, value)
+        if key == 'infractions':
+            for infraction, messages in value.items():
+                record.infractions[infraction] = InfractionLog.from_samples(
+                    messages, infraction_counts.get(infraction), max_infraction_samples)
+        elif key in RAIRouteRecord.__slots__:
+            setattr(record, key, value)
 
     return record
 
@@ -29,11 +130,33 @@ class RAIStatisticsManager(StatisticsManager):
     """
     Statistics manager for the RAI Carla leaderboard
     """
-    def __init__(self, is_rai=True):
+    def __init__(self, is_rai=True, max_infraction_samples=INFRACTION_SAMPLES, spill_records=False):
         self.unique_id = 0
         super().__init__()
         self.is_rai = is_rai
-        
+        self.max_infraction_samples = max_infraction_samples
+        # Drop the records once saved in the checkpoint, only keeping the table and aggregator
+        self.spill_records = spill_records and is_rai
+        # Columnar copy of the finished route records, used for the global statistics
+        self._record_table = RAIRecordTable(INFRACTION_KEYS)
+        # Running global statistics, for the provisional global record
+        self._aggregator = RAIOnlineAggregator(INFRACTION_KEYS)
+        # Record of the last finished run, kept even when the records are spilled
+        self.last_route_record = None
+        # RAI case -> latency histogram of the agent steps of all its runs
+        self._latency_per_case = {}
+        # Step latency budget of the real-time feasibility, the frame period by default
+        self.realtime_budget_ms = None
+        self._frame_period_ms = 1000.0 / 20
+        # Ticks and deadline misses of the runs with a compute budget
+        self._deadline_ticks = 0
+        self._deadline_misses = 0
+        # RAI case -> strategy, runs and sensors perturbed by the camera and LiDAR runs
+        self._coverage_per_case = {}
+        # Directory the noise timelines of the sensor distortion runs are saved in, None to not save them
+        self.noise_timeline_dir = None
+
+
     def resume(self, endpoint):
         data = fetch_dict(endpoint)
 
@@ -41,11 +164,60 @@ class RAIStatisticsManager(StatisticsManager):
             records = data['_checkpoint']['records']
 
             for record in records:
-                self._registry_route_records.append(to_route_record(record))
+                route_record = to_route_record(record, self.max_infraction_samples)
+                if not self.spill_records:
+                    self._registry_route_records.append(route_record)
+                self._add_record(route_record)
+
+    def _add_record(self, route_record):
+        """
+        Add a finished record of an earlier evaluation to the statistics
+        """
+        self._record_table.append(route_record)
+        self._aggregator.update(route_record)
+        if 'latency' in route_record.meta:
+            self._add_latency(route_record, LatencyHistogram.from_dict(route_record.meta['latency']))
+        if 'deadline' in route_record.meta:
+            self._add_deadline(route_record.meta['deadline'])
+        if route_record.meta.get('coverage'):
+            self._add_coverage(route_record)
+
+    def add_cached_record(self, record_dict, route_id, index, key, endpoint):
+        """
+        Register the cached record of a run instead of running it, and save it in the checkpoint
+        """
+        route_record = to_route_record(record_dict, self.max_infraction_samples)
+        route_record.meta['cached'] = {'key': key, 'route_id': route_record.route_id}
+        route_record.route_id = route_id
+        route_record.index = index
+        self._registry_route_records.append(route_record)
+        self._add_record(route_record)
+        self.last_route_record = route_record
+        self.save_record(route_record, index, endpoint)
+        return route_record
+
+    def _add_latency(self, route_record, latency):
+        case = record_case(route_record)
+        if case is None:
+            return
+        if case not in self._latency_per_case:
+            self._latency_per_case[case] = LatencyHistogram(latency.sub_bucket_bits)
+        self._latency_per_case[case].merge(latency)
+
+    def _add_coverage(self, route_record):
+        coverage = route_record.meta['coverage']
+        case = self._coverage_per_case.setdefault(record_case(route_record), {
+            'strategy': coverage['strategy'], 'runs': 0, 'sensors': [], 'of': coverage['of']})
+        case['runs'] += 1
+        case['sensors'] += [sensor for sensor in coverage['sensors'] if sensor not in case['sensors']]
+
+    def _add_deadline(self, deadline):
+        self._deadline_ticks += deadline['ticks']
+        self._deadline_misses += deadline['misses']
 
     def set_route(self, route_id, index):
         self._master_scenario = None
-        route_record = RAIRouteRecord()
+        route_record = RAIRouteRecord(self.max_infraction_samples)
         route_record.route_id = route_id
         route_record.index = index
         if self.is_rai:
@@ -78,6 +250,12 @@ class RAIStatisticsManager(StatisticsManager):
         route_record.meta['duration_system'] = duration_time_system
         route_record.meta['duration_game'] = duration_time_game
         route_record.meta['route_length'] = compute_route_length(config)
+        route_record.meta['route_name'] = config.name
+        route_record.meta['variant'] = config.variant
+        route_record.meta['severity'] = config.severity
+        route_record.meta['early_stop'] = config.early_stop
+        route_record.meta['coverage'] = config.coverage
+        route_record.meta['cached'] = None
 
         if self._master_scenario:
             if self._master_scenario.timeout_node.timeout:
@@ -148,11 +326,39 @@ class RAIStatisticsManager(StatisticsManager):
         # update status
         if target_reached:
             route_record.status = 'Completed'
+        elif config.early_stop is not None and not failure:
+            route_record.status = EARLY_STOP_STATUS
         else:
             route_record.status = 'Failed'
             if failure:
                 route_record.status += ' - ' + failure
 
+        # Inference latency of the agent steps
+        self._frame_period_ms = 1000.0 / config.frame_rate
+        if config.latency is not None and config.latency.count:
+            route_record.meta['latency'] = config.latency.to_dict()
+            self._add_latency(route_record, config.latency)
+        # Frames received, dropped and late per sensor
+        sensor_interface = getattr(getattr(config, 'agent', None), 'sensor_interface', None)
+        if hasattr(sensor_interface, 'frame_stats'):
+            route_record.meta['sensor_frames'] = sensor_interface.frame_stats()
+        if config.deadline is not None:
+            route_record.meta['deadline'] = config.deadline.summary()
+            self._add_deadline(route_record.meta['deadline'])
+        if config.coverage is not None:
+            self._add_coverage(route_record)
+        # Pre-generated noise of the GNSS, IMU and speedometer distortions
+        noise_timeline = getattr(config.rai_interface, 'noise_timeline', None)
+        if noise_timeline is not None:
+            route_record.meta['noise_timeline'] = noise_timeline.describe()
+            if self.noise_timeline_dir:
+                path = os.path.join(self.noise_timeline_dir, '{}_{}.npz'.format(config.route_type, config.run_id))
+                route_record.meta['noise_timeline']['path'] = noise_timeline.save(path)
+
+        self._record_table.append(route_record)
+        self._aggregator.update(route_record)
+        self.last_route_record = route_record
+
         return route_record
 
     def compute_global_statistics(self, total_routes):
@@ -171,115 +377,120 @@ class RAIStatisticsManager(StatisticsManager):
         global_record.rai_scores['rai_avg_emission_per_sec'] = 0
         global_record.rai_scores['rai_avg_emission_per_route'] = 0
 
-        if self._registry_route_records:
-
-            records = copy.deepcopy(global_record)
-            for route_record in self._registry_route_records:
-
-                rai_keys = route_record.rai_scores.keys()
-
-                for key in rai_keys:
-                    if not 'emission' in key:
-                        record_dict = {"score_composed": route_record.scores["score_composed"],
-                                        "score_route": route_record.scores["score_route"],
-                                        "score_penalty": route_record.scores["score_penalty"],
-                                        "emission_per_route": route_record.rai_scores["emission_per_route"],
-                                        "emission_per_sec": route_record.rai_scores["emission_per_sec"],
-                                        "duration_game": route_record.meta["duration_game"],
-                                        "duration_system": route_record.meta["duration_system"],
-                                        "route_length": route_record.meta["route_length"]}
-                        if key in records.rai_scores:
-                            records.rai_scores[key].append(record_dict)
-                        else:
-                            records.rai_scores[key] = [record_dict]
-
-                for key in global_record.infractions.keys():
-
-                    # Change the infraction from list to a number
-                    if isinstance(global_record.infractions[key], list):
-                        global_record.infractions[key] = 0
-
-                    # Avoid adding infractions if the vehicle hasn't moved,
-                    # as they will most likely be caused by the Leaderboard
-                    if route_record.scores['score_route'] == 0:
-                        continue
-
-                    route_length_kms = route_record.scores['score_route'] / 100 * route_record.meta['route_length'] / 1000.0
-                    global_record.infractions[key] += len(route_record.infractions[key]) / route_length_kms
-
-                if route_record.status != 'Completed':
-                    global_record.status = 'Failed'
-                    if 'exceptions' not in global_record.meta:
-                        global_record.meta['exceptions'] = []
-                    global_record.meta['exceptions'].append((route_record.route_id,
-                                                             route_record.index,
-                                                             route_record.status))
+        table = self._record_table
+        # Extra severity sweep levels only contribute to the severity curves
+        scored_rows = table.scored_rows()
+        if len(table):
+            for key in global_record.infractions.keys():
+                global_record.infractions[key] = 0 + table.infractions_per_km(key, scored_rows)
+
+            for row in np.flatnonzero((table['status'] != 'Completed') & (table['status'] != EARLY_STOP_STATUS)):
+                global_record.status = 'Failed'
+                if 'exceptions' not in global_record.meta:
+                    global_record.meta['exceptions'] = []
+                global_record.meta['exceptions'].append((table['route_id'][row],
+                                                         int(table['index'][row]),
+                                                         table['status'][row]))
 
         '''RAI is assessed in four dimensions, energy consumed per sec, power consumed per run, robustness against noise, robustness against distributional shifts'''
         if self.is_rai:
-            eps = 1e-9
-            records_rai_keys = records.rai_scores.keys()
-
-            print(f'records_rai_keys: {records_rai_keys}')
-            assert(RAIVariation.REGULAR in records_rai_keys)
-
-            # Get the regular driving score
-            regular_score = records.rai_scores['REGULAR'][0]['score_composed']
-
-            # Calculate number of REGULAR_* keys in the records.rai_scores.keys()
-            rai_keys_num = sum("REGULAR_" in key for key in records.rai_scores.keys())
-
-            for key in records.rai_scores.keys():
-                # We only check lists since we want to exclude score_composed, score_route, duration_game, etc
-                if isinstance(records.rai_scores[key], list):
-                    if len(records.rai_scores[key]) > 1:
-                        # Get minimun_score_dict where we have multiple runs for e.g. weather or D1_CAM
-                        records.rai_scores[key] = [min(records.rai_scores[key], key=lambda d: d['score_composed'])]
-
-                    if 'REGULAR_' in key:
-                        # Adjust the score based on regular_score
-                        global_record.rai_scores[key] = min(regular_score, records.rai_scores[key][0]['score_composed'])
-
-                        # Calculate all global_record.rai_scores from records.rai_scores 
-                        global_record.rai_scores['rai_avg_score_composed'] += global_record.rai_scores[key]/ rai_keys_num
-                        global_record.rai_scores['rai_avg_score_route'] += records.rai_scores[key][0]['score_route'] / rai_keys_num
-                        global_record.rai_scores['rai_avg_duration_game'] += records.rai_scores[key][0]['duration_game'] / rai_keys_num
-                        global_record.rai_scores['rai_avg_emission_per_sec'] += records.rai_scores[key][0]['emission_per_sec'] / rai_keys_num
-                        global_record.rai_scores['rai_avg_emission_per_route'] += records.rai_scores[key][0]['emission_per_route'] / rai_keys_num
-                    elif 'REGULAR' in key:
-                        global_record.rai_scores[key] = records.rai_scores[key][0]['score_composed']
-                        global_record.scores['score_composed'] = records.rai_scores[key][0]['score_composed']
-                        global_record.scores['score_route'] = records.rai_scores[key][0]['score_route']
-                        global_record.scores['score_penalty'] = records.rai_scores[key][0]['score_penalty']
-                        global_record.meta['total_length'] = records.rai_scores[key][0]['route_length']
-                        global_record.meta['duration_system'] = records.rai_scores[key][0]['duration_system']
-                        global_record.meta['duration_game'] = records.rai_scores[key][0]['duration_game']
-                    
-                    # take ratios of REGULAR*/ regular_score
-                    global_record.rai_scores[key] /= (regular_score + eps)
+            rai_scores, regular_row = table.rai_scores(scored_rows)
+            global_record.rai_scores.update(rai_scores)
+
+            global_record.scores['score_composed'] = float(table['score_composed'][regular_row])
+            global_record.scores['score_route'] = float(table['score_route'][regular_row])
+            global_record.scores['score_penalty'] = float(table['score_penalty'][regular_row])
+            global_record.meta['total_length'] = float(table['route_length'][regular_row])
+            global_record.meta['duration_system'] = float(table['duration_system'][regular_row])
+            global_record.meta['duration_game'] = float(table['duration_game'][regular_row])
+
+            # Same reductions, grouped by route
+            routes = table['route'][scored_rows]
+            global_record.meta['rai_scores_per_route'] = {}
+            for route in first_appearance(routes):
+                rows = scored_rows[routes == route]
+                if RAIVariation.REGULAR in table['case'][rows]:
+                    global_record.meta['rai_scores_per_route'][route] = table.rai_scores(rows)[0]
+
+            # Runs stopped by the run monitors and the time it saved
+            early_stops = table.early_stops()
+            if early_stops['runs']:
+                global_record.meta['early_stops'] = early_stops
+
+            # Latency percentiles per case, and the fraction of the steps within the budget
+            if self._latency_per_case:
+                all_latency = LatencyHistogram()
+                global_record.meta['latency'] = {}
+                for case, latency in self._latency_per_case.items():
+                    global_record.meta['latency'][case] = latency.summary()
+                    all_latency.merge(latency)
+                budget_ms = self.realtime_budget_ms or self._frame_period_ms
+                global_record.meta['latency']['budget_ms'] = budget_ms
+                global_record.rai_scores['rai_realtime_feasibility'] = all_latency.fraction_below(budget_ms)
+
+            # Ticks without a new control in the real-time budget mode
+            if self._deadline_ticks:
+                global_record.meta['deadline'] = {'budget_ms': self.realtime_budget_ms,
+                                                  'ticks': self._deadline_ticks,
+                                                  'misses': self._deadline_misses}
+                global_record.rai_scores['rai_deadline_miss_rate'] = self._deadline_misses / self._deadline_ticks
+
+            # Sensors covered by the runs of the camera and LiDAR cases, and the strategy that chose them
+            if self._coverage_per_case:
+                global_record.meta['coverage'] = {case: dict(coverage, sensors=list(coverage['sensors']))
+                                                  for case, coverage in self._coverage_per_case.items()}
+
+            # Score-vs-severity curves and their area under the curve, per case and sensor
+            if any(severity is not None for severity in table['severity']):
+                global_record.meta['severity_curves'] = table.severity_curves(table.driven_rows(),
+                                                                              table.regular_score(scored_rows))
 
         return global_record
 
-    @staticmethod
-    def save_record(route_record, index, endpoint):
+    def case_min_score(self, case):
+        """
+        Minimum score of the finished runs of a case, None before its first run
+        """
+        return self._aggregator.case_min_score(case)
+
+    def save_record(self, route_record, index, endpoint):
         data = fetch_dict(endpoint)
         if not data:
             data = create_default_json_msg()
 
-        stats_dict = route_record.__dict__
+        stats_dict = route_record.to_dict()
         record_list = data['_checkpoint']['records']
         
         record_list.append(stats_dict)
 
         save_dict(endpoint, data)
+
+        # The checkpoint now has the record, and the statistics only need the table
+        if self.spill_records and route_record in self._registry_route_records:
+            self._registry_route_records.remove(route_record)
         
+    def save_partial_global_record(self, total_routes, endpoint):
+        """
+        Save the provisional global record of the runs finished so far, which is
+        replaced by save_global_record() at the end of the evaluation
+        """
+        data = fetch_dict(endpoint)
+        if not data:
+            data = create_default_json_msg()
+
+        partial_record = self._aggregator.global_record(total_routes)
+        data['_checkpoint']['global_record'] = partial_record
+        save_dict(endpoint, data)
+
+        return partial_record
+
     @staticmethod
     def save_global_record(route_record, sensors, total_routes, endpoint, is_rai):
         data = fetch_dict(endpoint)
         if not data:
             data = create_default_json_msg()
 
-        stats_dict = route_record.__dict__
+        stats_dict = route_record.to_dict()
         data['_checkpoint']['global_record'] = stats_dict
         data['values'] = ['{:.3f}'.format(stats_dict['scores']['score_composed']),
                           '{:.3f}'.format(stats_dict['scores']['score_route']),
@@ -321,6 +532,14 @@ class RAIStatisticsManager(StatisticsManager):
                             'Avg. Emissions Per Route'
                             ]
 
+            if 'rai_realtime_feasibility' in stats_dict['rai_scores']:
+                data['values'] = data['values'] + ['{:.3f}'.format(stats_dict['rai_scores']['rai_realtime_feasibility'])]
+                data['labels'] = data['labels'] + ['Real-time Feasibility']
+
+            if 'rai_deadline_miss_rate' in stats_dict['rai_scores']:
+                data['values'] = data['values'] + ['{:.3f}'.format(stats_dict['rai_scores']['rai_deadline_miss_rate'])]
+                data['labels'] = data['labels'] + ['Deadline Miss Rate']
+
             #for RAI_CASE in RAI_CASES:
             for RAI_CASE in RAI_CASES:
                 if RAI_CASE in [RAIVariation.DISTORTION1, RAIVariation.DISTORTION2]:
@@ -0,0 +1,349 @@
+#!/usr/bin/env python
+
+"""
+Columnar storage of the route records, one row per run, used to compute
+the global RAI statistics with vectorised reductions.
+"""
+import numpy as np
+
+from rai.core.variations import RAIVariation
+
+# Per-run value columns, one int64 column per infraction key is added as well
+SCORE_COLUMNS = ['score_composed', 'score_route', 'score_penalty']
+META_COLUMNS = ['duration_game', 'duration_system', 'route_length']
+EMISSION_COLUMNS = ['emission_per_sec', 'emission_per_route']
+LABEL_COLUMNS = ['route', 'route_id', 'case', 'variant', 'status', 'severity', 'early_stop']
+# Time saved by stopping a run before the route timeout, 0 for the other runs
+EARLY_STOP_COLUMNS = ['game_time_saved', 'system_time_saved']
+# Status of the runs stopped once their outcome couldn't change the RAI scores
+EARLY_STOP_STATUS = 'Stopped early'
+# Added to the REGULAR score the RAI ratios are taken of, in case it is 0
+RAI_EPS = 1e-9
+# Averages of the RAI scores over the REGULAR_* cases, and the run value they average
+RAI_AVERAGES = [('rai_avg_score_route', 'score_route'),
+                ('rai_avg_duration_game', 'duration_game'),
+                ('rai_avg_emission_per_sec', 'emission_per_sec'),
+                ('rai_avg_emission_per_route', 'emission_per_route')]
+# Values of the run with the minimum score of each case used by the RAI scores
+RAI_RUN_COLUMNS = ['score_composed'] + [name for _, name in RAI_AVERAGES]
+
+
+def record_case(route_record):
+    """
+    The RAI case of a route record is its only non emission rai_scores key
+    """
+    for key in route_record.rai_scores:
+        if 'emission' not in key:
+            return key
+    return None
+
+
+def is_scored(severity):
+    """
+    Only the runs at the configured level of a severity sweep count for the RAI scores
+    """
+    return severity is None or severity['default']
+
+
+def severity_auc(levels, scores):
+    """
+    Area under the score-vs-severity curve normalised by the swept range, i.e. the
+    mean score across the range. Non numeric levels are evenly spaced
+    """
+    if len(levels) == 1:
+        return float(scores[0])
+    if all(isinstance(level, (int, float)) for level in levels):
+        x = np.asarray(levels, dtype=np.float64)
+    else:
+        x = np.arange(len(levels), dtype=np.float64)
+    y = np.asarray(scores, dtype=np.float64)
+    order = np.argsort(x, kind='stable')
+    x, y = x[order], y[order]
+    if x[-1] == x[0]:
+        return float(np.mean(y))
+    return float(np.sum((x[1:] - x[:-1]) * (y[1:] + y[:-1]) / 2) / (x[-1] - x[0]))
+
+
+def compute_rai_scores(min_runs, regular_score):
+    """
+    RAI scores from the run with the minimum score of every case ({case: {column: value}}):
+    the minimum score of every case, capped at the REGULAR score, as a ratio of the
+    REGULAR score, and the averages of the REGULAR_* cases
+    """
+    rai_keys_num = sum("REGULAR_" in case for case in min_runs)
+
+    rai_scores = {'rai_avg_score_route': 0,
+                  'rai_avg_score_composed': 0,
+                  'rai_avg_duration_game': 0,
+                  'rai_avg_emission_per_sec': 0,
+                  'rai_avg_emission_per_route': 0}
+    for case, run in min_runs.items():
+        if 'REGULAR_' in case:
+            # Adjust the score based on regular_score
+            rai_scores[case] = min(regular_score, run['score_composed'])
+            rai_scores['rai_avg_score_composed'] += rai_scores[case] / rai_keys_num
+            for key, name in RAI_AVERAGES:
+                rai_scores[key] += run[name] / rai_keys_num
+        else:
+            rai_scores[case] = run['score_composed']
+
+        # take ratios of REGULAR*/ regular_score
+        rai_scores[case] /= (regular_score + RAI_EPS)
+
+    return {key: float(value) for key, value in rai_scores.items()}
+
+
+def first_appearance(values):
+    """
+    Unique values of an object column, in the order they first appear
+    """
+    _, first_index = np.unique(values.astype(str), return_index=True)
+    return [values[index] for index in sorted(first_index)]
+
+
+class RAIRecordTable:
+    """
+    Growable table with one numpy array per column
+    """
+    def __init__(self, infraction_keys, capacity=64):
+        self.infraction_keys = list(infraction_keys)
+        self._size = 0
+        self._columns = {}
+        for name in LABEL_COLUMNS:
+            self._columns[name] = np.empty(capacity, dtype=object)
+        self._columns['index'] = np.zeros(capacity, dtype=np.int64)
+        for name in SCORE_COLUMNS + META_COLUMNS + EMISSION_COLUMNS + EARLY_STOP_COLUMNS:
+            self._columns[name] = np.zeros(capacity, dtype=np.float64)
+        for key in self.infraction_keys:
+            self._columns[key] = np.zeros(capacity, dtype=np.int64)
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, name):
+        return self._columns[name][:self._size]
+
+    def _grow(self):
+        for name, column in self._columns.items():
+            new_column = np.zeros(2 * len(column), dtype=column.dtype) if column.dtype != object \
+                else np.empty(2 * len(column), dtype=object)
+            new_column[:self._size] = column[:self._size]
+            self._columns[name] = new_column
+
+    def append(self, route_record):
+        """
+        Add a finished route record as a new row, and return its row number
+        """
+        if self._size == len(self._columns['index']):
+            self._grow()
+        row = self._size
+        columns = self._columns
+
+        columns['route'][row] = route_record.meta.get('route_name', route_record.route_id)
+        columns['route_id'][row] = route_record.route_id
+        columns['case'][row] = record_case(route_record)
+        columns['variant'][row] = route_record.meta.get('variant')
+        columns['status'][row] = route_record.status
+        columns['severity'][row] = route_record.meta.get('severity')
+        early_stop = route_record.meta.get('early_stop') or {}
+        columns['early_stop'][row] = early_stop.get('reason')
+        for name in EARLY_STOP_COLUMNS:
+            columns[name][row] = early_stop.get(name, 0.0)
+        columns['index'][row] = route_record.index
+        for name in SCORE_COLUMNS:
+            columns[name][row] = route_record.scores[name]
+        for name in META_COLUMNS:
+            columns[name][row] = route_record.meta[name]
+        for name in EMISSION_COLUMNS:
+            columns[name][row] = route_record.rai_scores.get(name, 0.0)
+        for key in self.infraction_keys:
+            columns[key][row] = len(route_record.infractions[key])
+
+        self._size += 1
+        return row
+
+    def early_stops(self):
+        """
+        Number of runs stopped early per reason, and the simulated and system
+        seconds it saved
+        """
+        reasons = self['early_stop']
+        stopped = np.flatnonzero([reason is not None for reason in reasons])
+        return {'runs': int(len(stopped)),
+                'reasons': {reason: int(np.sum(reasons == reason)) for reason in first_appearance(reasons[stopped])},
+                'game_time_saved': float(np.sum(self['game_time_saved'])),
+                'system_time_saved': float(np.sum(self['system_time_saved']))}
+
+    def driven_rows(self):
+        """
+        Rows of the runs driven to the end, i.e. all but the runs stopped early
+        """
+        return np.flatnonzero(self['status'] != EARLY_STOP_STATUS)
+
+    def scored_rows(self):
+        """
+        Rows used for the RAI scores, i.e. all but the extra severity sweep levels
+        and the runs stopped early
+        """
+        return np.array([row for row in self.driven_rows() if is_scored(self['severity'][row])], dtype=np.int64)
+
+    def infractions_per_km(self, key, rows=None):
+        """
+        Infractions of the given runs (default all) normalised by the driven kilometers.
+        Runs where the vehicle hasn't moved are skipped, as the infractions will most
+        likely be caused by the Leaderboard
+        """
+        if rows is None:
+            rows = np.arange(self._size)
+        moved = rows[self['score_route'][rows] != 0]
+        route_length_kms = self['score_route'][moved] / 100 * self['route_length'][moved] / 1000.0
+        return float(np.sum(self[key][moved] / route_length_kms))
+
+    def regular_score(self, rows):
+        """
+        The regular driving score is the one of the first REGULAR run
+        """
+        cases = self['case'][rows]
+        return self['score_composed'][rows[np.flatnonzero(cases == RAIVariation.REGULAR)[0]]]
+
+    def min_rows(self, rows):
+        """
+        Group the given rows by RAI case and return {case: row with the minimum
+        score_composed}, cases ordered by first appearance. Ties keep the first row
+        """
+        min_rows = {}
+        cases = self['case'][rows]
+        scores = self['score_composed'][rows]
+        for case in first_appearance(cases):
+            case_rows = np.flatnonzero(cases == case)
+            min_rows[case] = rows[case_rows[np.argmin(scores[case_rows])]]
+        return min_rows
+
+    def rai_scores(self, rows):
+        """
+        Compute the RAI scores of a group of rows with compute_rai_scores.
+        Returns (rai_scores, row of the REGULAR run)
+        """
+        min_rows = self.min_rows(rows)
+        assert(RAIVariation.REGULAR in min_rows)
+
+        min_runs = {case: {name: self[name][row] for name in RAI_RUN_COLUMNS} for case, row in min_rows.items()}
+        return compute_rai_scores(min_runs, self.regular_score(rows)), min_rows[RAIVariation.REGULAR]
+
+    def severity_curves(self, rows, regular_score):
+        """
+        Score-vs-severity curves of the severity sweeps, per case and sensor. Scores
+        are capped at and taken as ratios of the REGULAR score, like the RAI scores
+        """
+        curves = {}
+        for row in rows:
+            severity = self['severity'][row]
+            if severity is None:
+                continue
+            case_curves = curves.setdefault(self['case'][row], {})
+            curve = case_curves.setdefault(self['variant'][row], {'parameter': severity['parameter'],
+                                                                  'levels': [], 'scores': []})
+            score = min(regular_score, self['score_composed'][row]) / (regular_score + RAI_EPS)
+            if severity['level'] in curve['levels']:
+                # Repeated level, keep the minimum score as the RAI scores do
+                index = curve['levels'].index(severity['level'])
+                curve['scores'][index] = min(curve['scores'][index], float(score))
+            else:
+                curve['levels'].append(severity['level'])
+                curve['scores'].append(float(score))
+
+        for case_curves in curves.values():
+            for curve in case_curves.values():
+                curve['auc'] = severity_auc(curve['levels'], curve['scores'])
+        return curves
+
+
+class RAIOnlineAggregator:
+    """
+    Streaming version of the global RAI statistics. Every route record is folded
+    in with a constant amount of work (the per-case minimum, the REGULAR baseline
+    and the infraction sums), so a provisional global record can be produced
+    after each run
+    """
+    def __init__(self, infraction_keys):
+        self.n_runs = 0
+        self.regular_score = None
+        self.infractions = {key: 0.0 for key in infraction_keys}
+        self.exceptions = []
+        # case -> values of the run with the minimum score_composed
+        self._min_runs = {}
+
+    def update(self, route_record):
+        """
+        Fold a finished route record into the running statistics
+        """
+        self.n_runs += 1
+        if not is_scored(route_record.meta.get('severity')):
+            # Extra severity levels don't count for the RAI scores
+            if route_record.status not in ['Completed', EARLY_STOP_STATUS]:
+                self.exceptions.append((route_record.route_id, route_record.index, route_record.status))
+            return
+        if route_record.status == EARLY_STOP_STATUS:
+            # Runs stopped early have an incomplete drive and are left out, as compute_global_statistics does
+            return
+
+        case = record_case(route_record)
+        run = {name: route_record.scores[name] for name in SCORE_COLUMNS}
+        run.update({name: route_record.meta[name] for name in META_COLUMNS})
+        run.update({name: route_record.rai_scores.get(name, 0.0) for name in EMISSION_COLUMNS})
+
+        if case == RAIVariation.REGULAR and self.regular_score is None:
+            self.regular_score = run['score_composed']
+
+        # Keep the first run with the minimum score, as compute_global_statistics does
+        current = self._min_runs.get(case)
+        if current is None or run['score_composed'] < current['score_composed']:
+            self._min_runs[case] = run
+
+        if run['score_route'] != 0:
+            route_length_kms = run['score_route'] / 100 * run['route_length'] / 1000.0
+            for key in self.infractions:
+                self.infractions[key] += len(route_record.infractions[key]) / route_length_kms
+
+        if route_record.status not in ['Completed', EARLY_STOP_STATUS]:
+            self.exceptions.append((route_record.route_id, route_record.index, route_record.status))
+
+    def case_min_score(self, case):
+        """
+        Minimum score_composed of the case so far, None before its first run
+        """
+        run = self._min_runs.get(case)
+        return None if run is None else run['score_composed']
+
+    def global_record(self, total_runs):
+        """
+        Return the provisional global record, as a dict in the checkpoint format.
+        RAI ratios are only available once the REGULAR run has landed
+        """
+        rai_scores = {'rai_avg_score_route': 0,
+                      'rai_avg_score_composed': 0,
+                      'rai_avg_duration_game': 0,
+                      'rai_avg_emission_per_sec': 0,
+                      'rai_avg_emission_per_route': 0}
+        scores = {'score_route': 0, 'score_penalty': 0, 'score_composed': 0}
+        meta = {'provisional': True, 'progress': [self.n_runs, total_runs]}
+
+        if self.regular_score is not None:
+            rai_scores = compute_rai_scores(self._min_runs, self.regular_score)
+
+            regular_run = self._min_runs[RAIVariation.REGULAR]
+            scores = {name: regular_run[name] for name in ['score_route', 'score_penalty', 'score_composed']}
+            meta['total_length'] = regular_run['route_length']
+            meta['duration_system'] = regular_run['duration_system']
+            meta['duration_game'] = regular_run['duration_game']
+
+        if self.exceptions:
+            meta['exceptions'] = list(self.exceptions)
+
+        return {'route_id': -1,
+                'index': -1,
+                'status': 'Failed' if self.exceptions else 'Completed',
+                'infractions': dict(self.infractions),
+                'scores': scores,
+                'meta': meta,
+                'rai_scores': rai_scores}
@@ -1,14 +1,114 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
 import carla
 
+from rai.utils.utility import get_cache_dir
+
+WEATHER_SAMPLES_VERSION = 1
+
+# Default ranges of the sampled carla.WeatherParameters attributes
+WEATHER_RANGES = {
+    'fog_density': [0.0, 100.0],
+    'precipitation': [0.0, 100.0],
+    'sun_altitude_angle': [-15.0, 90.0],
+    'wetness': [0.0, 100.0],
+}
+
+def parse_weather_ranges(ranges):
+    """
+    Parse 'name=min:max' strings into {name: [min, max]}
+    """
+    parsed = {}
+    for weather_range in ranges:
+        name, equal, values = weather_range.partition('=')
+        low, colon, high = values.partition(':')
+        if not equal or not colon:
+            raise ValueError(f"Malformed weather range '{weather_range}', expected 'name=min:max'")
+        if not hasattr(carla.WeatherParameters(), name.strip()):
+            raise ValueError(f"Unknown weather parameter '{name.strip()}'")
+        parsed[name.strip()] = [float(low), float(high)]
+    return parsed
+
+
+class WeatherSampler:
+    """
+    Sample K weather conditions from parameter ranges with a Latin hypercube: every
+    parameter range is split in K strata and each stratum is used exactly once.
+    Samples only depend on (K, seed, ranges) and are cached on disk, so all the
+    runs of a job, and resumed jobs, use the same conditions
+    """
+    def __init__(self, n_samples, seed=0, ranges=None, cache_dir=None):
+        self.n_samples = n_samples
+        self.seed = seed
+        self.ranges = dict(WEATHER_RANGES)
+        self.ranges.update(ranges or {})
+        self.ranges = {name: [float(low), float(high)] for name, (low, high) in self.ranges.items()}
+        self.cache_dir = cache_dir
+        self._samples = None
+
+    def key(self):
+        description = json.dumps([WEATHER_SAMPLES_VERSION, self.n_samples, self.seed, self.ranges], sort_keys=True)
+        return hashlib.sha1(description.encode('utf-8')).hexdigest()
+
+    def latin_hypercube(self):
+        """
+        Return a list of K dicts of parameter values
+        """
+        rng = np.random.RandomState(self.seed)
+        names = sorted(self.ranges)
+        samples = np.empty((self.n_samples, len(names)))
+        for column, name in enumerate(names):
+            low, high = self.ranges[name]
+            strata = (rng.permutation(self.n_samples) + rng.uniform(size=self.n_samples)) / self.n_samples
+            samples[:, column] = low + strata * (high - low)
+        return [{name: round(float(value), 3) for name, value in zip(names, sample)} for sample in samples]
+
+    def samples(self):
+        if self._samples is None:
+            cache_dir = self.cache_dir or get_cache_dir('weathers')
+            path = os.path.join(cache_dir, self.key() + '.json')
+            if os.path.exists(path):
+                with open(path, 'r') as f:
+                    self._samples = json.load(f)
+            else:
+                self._samples = self.latin_hypercube()
+                os.makedirs(cache_dir, exist_ok=True)
+                tmp_path = path + '.tmp'
+                with open(tmp_path, 'w') as f:
+                    json.dump(self._samples, f)
+                os.replace(tmp_path, path)
+        return self._samples
+
+
+def weather_to_dict(weather):
+    """
+    Numeric attributes of a carla.WeatherParameters
+    """
+    attributes = {}
+    for name in dir(weather):
+        if not name.startswith('_'):
+            value = getattr(weather, name)
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                attributes[name] = value
+    return attributes
+
 
 class Weathers:
     """
-    A class containing different weather simulations for Carla
+    A class containing different weather simulations for Carla. The five presets
+    are used unless a WeatherSampler is given
     """
-    def __init__(self):
-        pass
+    def __init__(self, sampler=None):
+        self.sampler = sampler
 
     def get_weathers(self):
+        if self.sampler is not None:
+            return [self.sampled_weather(sample) for sample in self.sampler.samples()]
+
         # Define a list of weather conditions
         weather_conditions = []
 
@@ -20,6 +120,16 @@ class Weathers:
 
         return weather_conditions
 
+    def sampled_weather(self, sample):
+        """
+        Clear weather with the sampled parameters, with clouds for the rain
+        """
+        weather = self.clear_weather()
+        for name, value in sample.items():
+            setattr(weather, name, value)
+        weather.cloudiness = max(weather.cloudiness, weather.precipitation)
+        return weather
+
     def clear_weather(self):
         return carla.WeatherParameters(
             cloudiness=5.0,